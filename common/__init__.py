@@ -1,3 +0,0 @@
-from .logger import init_logging
-
-init_logging()
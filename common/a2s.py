@@ -0,0 +1,165 @@
+"""
+Asynchronous Steam server query (A2S) client.
+
+Keeps a single UDP socket open to the server's query port and supports the
+A2S_INFO request, including challenge handling and split responses.
+A truncated or malformed response raises A2SError like any other bad answer.
+"""
+
+import asyncio
+import logging
+import struct
+import time
+from dataclasses import dataclass
+
+log = logging.getLogger("arkhandler.a2s")
+
+SINGLE = b"\xff\xff\xff\xff"
+SPLIT = b"\xfe\xff\xff\xff"
+INFO_REQUEST = SINGLE + b"TSource Engine Query\x00"
+CHALLENGE = 0x41
+INFO = 0x49
+
+
+class A2SError(Exception):
+    pass
+
+
+@dataclass
+class ServerInfo:
+    name: str
+    map: str
+    players: int
+    max_players: int
+    bots: int
+    version: str
+    latency: float  # Seconds
+
+
+class Reader:
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.pos = 0
+
+    def byte(self) -> int:
+        if self.pos >= len(self.data):
+            raise A2SError("Response ended early")
+        self.pos += 1
+        return self.data[self.pos - 1]
+
+    def unpack(self, fmt: str) -> tuple:
+        try:
+            values = struct.unpack_from(fmt, self.data, self.pos)
+        except struct.error as e:
+            raise A2SError("Response ended early") from e
+        self.pos += struct.calcsize(fmt)
+        return values
+
+    def string(self) -> str:
+        end = self.data.find(b"\x00", self.pos)
+        if end < 0:
+            raise A2SError("Response ended in the middle of a string")
+        value = self.data[self.pos : end].decode("utf-8", errors="replace")
+        self.pos = end + 1
+        return value
+
+
+class _Protocol(asyncio.DatagramProtocol):
+    def __init__(self) -> None:
+        self.packets: asyncio.Queue[bytes] = asyncio.Queue()
+        self.transport: asyncio.DatagramTransport | None = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.packets.put_nowait(data)
+
+    def error_received(self, exc: Exception) -> None:
+        # On Windows an ICMP port unreachable surfaces here when nothing is listening yet
+        log.debug(f"Query socket error: {exc}")
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self.transport = None
+
+
+class A2SClient:
+    def __init__(self, host: str, port: int, timeout: float = 3.0) -> None:
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.protocol: _Protocol | None = None
+        self.lock = asyncio.Lock()
+
+    async def connect(self) -> None:
+        if self.protocol and self.protocol.transport:
+            return
+        loop = asyncio.get_running_loop()
+        _, self.protocol = await loop.create_datagram_endpoint(_Protocol, remote_addr=(self.host, self.port))
+
+    def close(self) -> None:
+        if self.protocol and self.protocol.transport:
+            self.protocol.transport.close()
+        self.protocol = None
+
+    async def _receive(self) -> bytes:
+        """Receive one response, reassembling split packets"""
+        parts: dict[int, bytes] = {}
+        while True:
+            packet = await asyncio.wait_for(self.protocol.packets.get(), timeout=self.timeout)
+            if packet.startswith(SINGLE):
+                if len(packet) == len(SINGLE):
+                    raise A2SError("Empty response")
+                return packet[4:]
+            # Header, request ID, total, number and max packet size come before the payload
+            if not packet.startswith(SPLIT) or len(packet) < 12:
+                raise A2SError("Invalid response header")
+            request_id, total, number = struct.unpack_from("<lBB", packet, 4)
+            if request_id & 0x80000000:
+                raise A2SError("Compressed responses are not supported")
+            if number >= total:
+                raise A2SError(f"Split packet {number} of {total} is out of range")
+            parts[number] = packet[12:]
+            if len(parts) == total:
+                data = b"".join(parts[i] for i in range(total))
+                if not data.startswith(SINGLE) or len(data) == len(SINGLE):
+                    raise A2SError("Invalid split response")
+                return data[4:]
+
+    async def _request(self, payload: bytes) -> bytes:
+        """Send a request, answering a challenge if the server asks for one"""
+        await self.connect()
+        async with self.lock:
+            # Drop anything late from a previous request
+            while not self.protocol.packets.empty():
+                self.protocol.packets.get_nowait()
+            request = payload
+            for _ in range(3):
+                self.protocol.transport.sendto(request)
+                response = await self._receive()
+                if response[0] != CHALLENGE:
+                    return response
+                if len(response) < 5:
+                    raise A2SError("Challenge response ended early")
+                request = payload + response[1:5]
+            raise A2SError("Server kept responding with challenges")
+
+    async def info(self) -> ServerInfo:
+        start = time.perf_counter()
+        data = await self._request(INFO_REQUEST)
+        latency = time.perf_counter() - start
+        if data[0] != INFO:
+            raise A2SError(f"Unexpected info response type {data[0]:#x}")
+        reader = Reader(data)
+        reader.pos = 2  # Type and protocol version
+        name = reader.string()
+        map_name = reader.string()
+        reader.string()  # Folder
+        reader.string()  # Game
+        reader.unpack("<h")  # App ID
+        players = reader.byte()
+        max_players = reader.byte()
+        bots = reader.byte()
+        reader.pos += 4  # Server type, environment, visibility and VAC
+        version = reader.string()
+        return ServerInfo(name, map_name, players, max_players, bots, version, latency)
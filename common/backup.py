@@ -0,0 +1,355 @@
+"""
+Deduplicated, incremental backups of the save and cluster files.
+
+Files are split into content-defined chunks so a small change to a large .ark file only produces
+a few new chunks. Chunks are stored once, compressed, in a content-addressed store and each
+snapshot is just a manifest listing the chunks that make up every file.
+
+Usage: python -m common.backup [list | snapshot | restore <snapshot> [--file <path>] | prune]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from common import const
+except ModuleNotFoundError:
+    import const
+
+log = logging.getLogger("arkhandler.backup")
+
+SAVE_SUFFIXES = {".ark", ".arkprofile", ".arktribe", ".arktributetribe"}
+
+# Chunking parameters, chunks average around 256 KiB
+WINDOW = 64
+MASK = (1 << 18) - 1
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 1024 * 1024
+BLOCK = 4 * 1024 * 1024  # Bytes scanned per numpy pass to keep memory flat on large files
+MAX_PENDING = 16  # Chunks handed to the pool at once, each holds up to MAX_CHUNK bytes until it's written
+
+# Fixed random byte table so chunk boundaries are stable between runs
+GEAR = np.random.default_rng(0x41524B).integers(0, 2**32, size=256, dtype=np.uint64)
+
+_pool: ProcessPoolExecutor | None = None
+_lock = threading.Lock()  # Scheduled and pre-reboot snapshots must not overlap
+
+
+def chunks_path() -> Path:
+    return const.BACKUP_PATH / "chunks"
+
+
+def snapshots_path() -> Path:
+    return const.BACKUP_PATH / "snapshots"
+
+
+def chunk_file(chunk_hash: str) -> Path:
+    return chunks_path() / chunk_hash[:2] / f"{chunk_hash}.z"
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=max(1, min(4, (os.cpu_count() or 2) - 1)))
+    return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def cut_points(data: np.ndarray) -> list[int]:
+    """
+    Find content-defined chunk boundaries.
+
+    A boundary falls wherever the sum of gear values over the last WINDOW bytes has its low bits zeroed,
+    so boundaries only depend on nearby content and re-align after an insertion or deletion.
+    """
+    size = len(data)
+    candidates: list[int] = []
+    for start in range(0, size, BLOCK):
+        lead = min(start, WINDOW)
+        segment = data[start - lead : start + BLOCK]
+        sums = np.cumsum(GEAR[segment], dtype=np.uint64)
+        window = sums[WINDOW:] - sums[:-WINDOW] if len(sums) > WINDOW else np.empty(0, dtype=np.uint64)
+        # window[i] covers segment[i + 1 : i + WINDOW + 1], a cut goes after the window
+        hits = np.flatnonzero((window & MASK) == 0) + WINDOW + 1 + start - lead
+        candidates.extend(int(i) for i in hits if i > start)
+
+    cuts: list[int] = []
+    last = 0
+    for point in candidates:
+        if point - last < MIN_CHUNK:
+            continue
+        while point - last > MAX_CHUNK:
+            last += MAX_CHUNK
+            cuts.append(last)
+        if point - last >= MIN_CHUNK:
+            cuts.append(point)
+            last = point
+    while size - last > MAX_CHUNK:
+        last += MAX_CHUNK
+        cuts.append(last)
+    if size > last:
+        cuts.append(size)
+    return cuts
+
+
+def _store_chunk(data: bytes, dest: str) -> int:
+    """Compress and write a chunk, runs in the process pool"""
+    path = Path(dest)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    compressed = zlib.compress(data, 6)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(compressed)
+    tmp.replace(path)
+    return len(compressed)
+
+
+def _chunk(path: Path, queued: set[str], pending: deque[Future]) -> tuple[list[str], int, int]:
+    """Split a file into chunks and queue the ones not stored yet, returns the hashes, bytes written and new chunks"""
+    chunks: list[str] = []
+    written = new_chunks = 0
+    if not path.stat().st_size:
+        return chunks, written, new_chunks
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        data = np.frombuffer(mm, dtype=np.uint8)
+        last = 0
+        for cut in cut_points(data):
+            piece = mm[last:cut]
+            chunk_hash = hashlib.sha256(piece).hexdigest()
+            chunks.append(chunk_hash)
+            if chunk_hash not in queued and not chunk_file(chunk_hash).exists():
+                queued.add(chunk_hash)
+                if len(pending) >= MAX_PENDING:
+                    written += pending.popleft().result()
+                pending.append(get_pool().submit(_store_chunk, piece, str(chunk_file(chunk_hash))))
+                new_chunks += 1
+            last = cut
+        del data
+    return chunks, written, new_chunks
+
+
+def source_files() -> list[Path]:
+    """Map, player and tribe saves under the save folder, plus everything in the cluster folder"""
+    files = []
+    if const.SAVE_PATH.exists():
+        for path in const.SAVE_PATH.rglob("*"):
+            if path.suffix.lower() in SAVE_SUFFIXES and path.is_file():
+                files.append(path)
+    if const.CLUSTER_PATH.exists():
+        files.extend(p for p in const.CLUSTER_PATH.rglob("*") if p.is_file() and p not in files)
+    return files
+
+
+def manifest_path(created: datetime) -> Path:
+    """Snapshots are named after the second they were taken, with a counter if that name is taken"""
+    stem = created.strftime("%Y%m%d-%H%M%S")
+    path = snapshots_path() / f"{stem}.json"
+    count = 0
+    while path.exists():
+        count += 1
+        # Zero padded so the names still sort in the order they were taken
+        path = snapshots_path() / f"{stem}_{count:02d}.json"
+    return path
+
+
+def list_snapshots() -> list[Path]:
+    if not snapshots_path().exists():
+        return []
+    return sorted(snapshots_path().glob("*.json"))
+
+
+def load_snapshot(path: Path) -> dict:
+    return json.loads(path.read_text())
+
+
+def find_snapshot(name: str) -> Path | None:
+    for path in list_snapshots():
+        if path.stem == name or path.name == name:
+            return path
+    return None
+
+
+def latest_before(when: datetime) -> Path | None:
+    """The newest snapshot taken before a point in time"""
+    for path in reversed(list_snapshots()):
+        if datetime.fromisoformat(load_snapshot(path)["created"]) < when:
+            return path
+    return None
+
+
+def snapshot(reason: str = "manual") -> Path | None:
+    """Take a snapshot of the save and cluster files, returns the manifest path"""
+    with _lock:
+        return _snapshot(reason)
+
+
+def _snapshot(reason: str) -> Path:
+    start = datetime.now()
+    previous = {}
+    if existing := list_snapshots():
+        previous = load_snapshot(existing[-1])["files"]
+
+    files: dict[str, dict] = {}
+    pending: deque[Future] = deque()
+    queued: set[str] = set()
+    written = 0
+    reused = new_chunks = 0
+    for path in source_files():
+        rel = str(path.relative_to(const.SAVE_PATH))
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        prev = previous.get(rel)
+        if prev and prev["size"] == stat.st_size and prev["mtime"] == stat.st_mtime:
+            # Unchanged since the last snapshot
+            files[rel] = prev
+            reused += 1
+            continue
+
+        entry = None
+        # The game may be saving the file right now, read it again once if it changed under us
+        for attempt in range(2):
+            try:
+                if attempt:
+                    stat = path.stat()
+                chunks, done, new = _chunk(path, queued, pending)
+                written += done
+                new_chunks += new
+                if path.stat().st_mtime == stat.st_mtime:
+                    entry = {"size": stat.st_size, "mtime": stat.st_mtime, "chunks": chunks}
+                    break
+            except (OSError, ValueError) as e:
+                log.warning(f"Could not read {rel}: {e}")
+                break
+        if entry:
+            files[rel] = entry
+        elif prev:
+            # Better an older copy than none at all, a map being saved is the usual case
+            log.warning(f"Keeping the previous backup of {rel}, it couldn't be read in one piece")
+            files[rel] = prev
+        else:
+            log.warning(f"Skipping {rel}, it couldn't be read in one piece")
+
+    written += sum(future.result() for future in pending)
+    snapshots_path().mkdir(parents=True, exist_ok=True)
+    manifest = manifest_path(start)
+    data = {"created": start.isoformat(), "reason": reason, "files": files}
+    tmp = manifest.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data))
+    tmp.replace(manifest)
+    took = (datetime.now() - start).total_seconds()
+    log.info(
+        f"Backup {manifest.stem} ({reason}): {len(files)} files, {reused} unchanged, "
+        f"{new_chunks} new chunks ({round(written / 1024**2, 1)} MiB) in {round(took, 1)}s"
+    )
+    return manifest
+
+
+def restore(name: str, only: str | None = None, target: Path | None = None) -> int:
+    """Restore files from a snapshot, optionally just one file, returns the number of files restored"""
+    path = find_snapshot(name)
+    if not path:
+        raise FileNotFoundError(f"Snapshot not found: {name}")
+    target = target or const.SAVE_PATH
+    restored = 0
+    for rel, entry in load_snapshot(path)["files"].items():
+        if only and Path(rel) != Path(only):
+            continue
+        dest = target / rel
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(dest.name + ".restoring")
+        with open(tmp, "wb") as f:
+            for chunk_hash in entry["chunks"]:
+                f.write(zlib.decompress(chunk_file(chunk_hash).read_bytes()))
+        os.utime(tmp, (entry["mtime"], entry["mtime"]))
+        tmp.replace(dest)
+        restored += 1
+    log.info(f"Restored {restored} files from {path.stem}")
+    return restored
+
+
+def prune(keep: int, keep_days: float) -> None:
+    """Keep the newest snapshots plus any younger than keep_days, then delete unreferenced chunks"""
+    with _lock:
+        _prune(keep, keep_days)
+
+
+def _prune(keep: int, keep_days: float) -> None:
+    snapshots = list_snapshots()
+    cutoff = datetime.now() - timedelta(days=keep_days)
+    removed = 0
+    for path in snapshots[:-keep] if keep else snapshots:
+        if datetime.fromisoformat(load_snapshot(path)["created"]) < cutoff:
+            path.unlink()
+            removed += 1
+    if not removed:
+        return
+    referenced = set()
+    for path in list_snapshots():
+        for entry in load_snapshot(path)["files"].values():
+            referenced.update(entry["chunks"])
+    freed = 0
+    for path in chunks_path().rglob("*.z"):
+        if path.stem not in referenced:
+            freed += path.stat().st_size
+            path.unlink()
+    log.info(f"Pruned {removed} snapshots, freed {round(freed / 1024**2, 1)} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage ArkHandler save backups")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List snapshots")
+    sub.add_parser("snapshot", help="Take a snapshot now")
+    restore_parser = sub.add_parser("restore", help="Restore a snapshot, the server should be stopped first")
+    restore_parser.add_argument("name", help="Snapshot name, or 'latest'")
+    restore_parser.add_argument("--file", help="Only restore this file, relative to the save folder")
+    prune_parser = sub.add_parser("prune", help="Apply the retention policy")
+    prune_parser.add_argument("--keep", type=int, default=24)
+    prune_parser.add_argument("--keep-days", type=float, default=7)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "list":
+            for path in list_snapshots():
+                data = load_snapshot(path)
+                size = sum(i["size"] for i in data["files"].values())
+                print(f"{path.stem}  {data['reason']:<10} {len(data['files'])} files  {round(size / 1024**2, 1)} MiB")
+        elif args.command == "snapshot":
+            snapshot()
+        elif args.command == "restore":
+            name = args.name
+            if name == "latest":
+                snapshots = list_snapshots()
+                if not snapshots:
+                    parser.error("There are no snapshots to restore")
+                name = snapshots[-1].stem
+            restore(name, args.file)
+        elif args.command == "prune":
+            prune(args.keep, args.keep_days)
+    finally:
+        shutdown()
+
+
+if __name__ == "__main__":
+    # Console only, logs.log belongs to the running handler
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    main()
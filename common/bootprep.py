@@ -0,0 +1,93 @@
+"""
+Run the steps before launching the game concurrently, each one starting as soon as the steps it needs are done.
+
+Blocking steps run in the OS executor, coroutine steps on the loop. A step fails by raising,
+and anything that needs a failed step is skipped.
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+import typing as t
+from dataclasses import dataclass, field
+
+try:
+    from common import executor, metrics
+except ModuleNotFoundError:
+    import executor
+    import metrics
+
+log = logging.getLogger("arkhandler.bootprep")
+
+
+@dataclass
+class Step:
+    name: str
+    func: t.Callable[..., t.Any]
+    args: tuple = ()
+    needs: tuple[str, ...] = ()
+
+
+@dataclass
+class Report:
+    results: dict[str, t.Any] = field(default_factory=dict)
+    failed: set[str] = field(default_factory=set)
+    skipped: set[str] = field(default_factory=set)
+    durations: dict[str, float] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed and not self.skipped
+
+
+class BootPrep:
+    def __init__(self) -> None:
+        self.steps: dict[str, Step] = {}
+
+    def add(self, name: str, func: t.Callable[..., t.Any], *args, needs: tuple[str, ...] = ()) -> None:
+        """Steps can only need steps added before them, so there can't be any cycles"""
+        for dep in needs:
+            if dep not in self.steps:
+                raise ValueError(f"Step {name} needs {dep}, which hasn't been added")
+        self.steps[name] = Step(name, func, args, needs)
+
+    async def run(self) -> Report:
+        report = Report()
+        tasks: dict[str, asyncio.Task] = {}
+        start = time.perf_counter()
+
+        async def run_step(step: Step) -> None:
+            for dep in step.needs:
+                await tasks[dep]
+            if any(dep in report.failed or dep in report.skipped for dep in step.needs):
+                log.warning(f"Skipping {step.name}, a step it needs didn't finish")
+                report.skipped.add(step.name)
+                return
+            step_start = time.perf_counter()
+            try:
+                if inspect.iscoroutinefunction(step.func):
+                    report.results[step.name] = await step.func(*step.args)
+                else:
+                    report.results[step.name] = await executor.run_blocking(step.func, *step.args)
+            except Exception as e:
+                log.error(f"Boot step {step.name} failed", exc_info=e)
+                report.failed.add(step.name)
+            finally:
+                report.durations[step.name] = time.perf_counter() - step_start
+
+        for step in self.steps.values():
+            tasks[step.name] = asyncio.create_task(run_step(step), name=f"bootprep-{step.name}")
+        await asyncio.gather(*tasks.values())
+
+        report.elapsed = time.perf_counter() - start
+        metrics.gauge("boot_prep_seconds", round(report.elapsed, 3))
+        if report.durations:
+            slowest = max(report.durations, key=report.durations.get)
+            total = sum(report.durations.values())
+            log.info(
+                f"Boot preparation took {report.elapsed:.2f}s for {total:.2f}s of steps "
+                f"(slowest: {slowest} {report.durations[slowest]:.2f}s)"
+            )
+        return report
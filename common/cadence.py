@@ -0,0 +1,132 @@
+"""
+Adaptive polling intervals for the handler's loops.
+
+Each loop has a base interval per supervisor state:
+
+- stable: the server is up and the internet is connected
+- booting: the reboot sequence is running
+- down: the server is not running and hasn't started booting yet
+- outage: the internet is down
+
+Right after an event (a crash, a finished boot, the internet coming back) loops poll at their fastest.
+Once the server has been stable for a while, intervals stretch out so the handler idles more cheaply.
+Intervals always stay between min_scale and max_scale times the loop's stable interval, and within the
+loop's floor and ceiling if it has one.
+"""
+
+import logging
+import math
+import time
+import typing as t
+from datetime import datetime, timedelta
+
+log = logging.getLogger("arkhandler.cadence")
+
+STATES = ("stable", "booting", "down", "outage")
+QUANTUM = 1.0  # Scheduled jobs are lined up on whole seconds so ones due around the same time wake together
+BURST_SECONDS = 120  # How long loops stay at their fastest after an event
+
+# Base interval in seconds for each loop in each state
+LOOPS: dict[str, dict[str, float]] = {
+    "watchdog": {"stable": 7, "booting": 7, "down": 2, "outage": 7},
+    "internet": {"stable": 60, "booting": 60, "down": 30, "outage": 10},
+    "query": {"stable": 10, "booting": 5, "down": 10, "outage": 10},
+    "screen": {"stable": 5, "booting": 2, "down": 2, "outage": 5},
+    "title": {"stable": 0.15, "booting": 0.15, "down": 0.15, "outage": 0.15},
+}
+# Loops that are never worth running faster than this, whatever the scale
+FLOORS: dict[str, float] = {"title": 0.15}
+# Loops that must never run slower than this, the internet check times outages in minutes
+CEILINGS: dict[str, float] = {"internet": 60}
+
+
+class Cadence:
+    def __init__(
+        self,
+        loops: dict[str, dict[str, float]] = LOOPS,
+        min_scale: float = 0.25,
+        max_scale: float = 4.0,
+        settle_minutes: float = 60,
+        enabled: bool = True,
+    ) -> None:
+        self.loops = loops
+        self.min_scale = min_scale
+        self.max_scale = max(max_scale, 1.0)
+        self.settle = settle_minutes * 60
+        self.enabled = enabled
+        self.state = "stable"
+        self.last_event = time.monotonic()
+
+    def set_state(self, state: str) -> bool:
+        """Returns True if the state changed, which also counts as an event"""
+        if state not in STATES:
+            raise ValueError(f"Unknown state '{state}', expected one of {', '.join(STATES)}")
+        if state == self.state:
+            return False
+        log.debug(f"Cadence state {self.state} -> {state}")
+        self.state = state
+        self.event()
+        return True
+
+    def event(self) -> None:
+        """Something happened that's worth watching closely for a bit"""
+        self.last_event = time.monotonic()
+
+    def scale(self) -> float:
+        """How much to stretch or shrink the state's base interval"""
+        quiet = time.monotonic() - self.last_event
+        if quiet < BURST_SECONDS:
+            return self.min_scale
+        if self.state != "stable" or not self.settle:
+            return 1.0
+        # Stretch linearly from the base interval to the max over the settle time
+        progress = min(1.0, (quiet - BURST_SECONDS) / self.settle)
+        return 1.0 + (self.max_scale - 1.0) * progress
+
+    def interval(self, loop: str) -> float:
+        intervals = self.loops[loop]
+        if not self.enabled:
+            return intervals["stable"]
+        base = intervals.get(self.state, intervals["stable"])
+        lowest = max(intervals["stable"] * self.min_scale, FLOORS.get(loop, 0.0))
+        highest = min(intervals["stable"] * self.max_scale, CEILINGS.get(loop, math.inf))
+        interval = min(max(base * self.scale(), lowest), highest)
+        if interval >= QUANTUM:
+            interval = float(round(interval))
+        return interval
+
+
+def align(when: datetime) -> datetime:
+    """Round a wake up time up to the next quantum so jobs due around the same time coalesce"""
+    stamp = math.ceil(when.timestamp() / QUANTUM) * QUANTUM
+    return datetime.fromtimestamp(stamp, tz=when.tzinfo)
+
+
+def reschedule(scheduler, job_id: str, seconds: float, current: dict[str, float]) -> bool:
+    """
+    Move an interval job to a new interval if it changed.
+
+    current tracks the interval each job is running at. Paused jobs are left alone.
+    The next run never moves later than it already was, so speeding up takes effect straight away.
+    """
+    if current.get(job_id) == seconds:
+        return False
+    job = scheduler.get_job(job_id)
+    if job is None or job.next_run_time is None:
+        return False
+    tz = job.next_run_time.tzinfo
+    first = min(job.next_run_time, align(datetime.now(tz) + timedelta(seconds=seconds)))
+    scheduler.reschedule_job(job_id, trigger="interval", seconds=seconds, start_date=first)
+    log.debug(f"{job.name} now runs every {seconds}s")
+    current[job_id] = seconds
+    return True
+
+
+def state_of(running: bool, booting: bool, connected: bool) -> t.Literal["stable", "booting", "down", "outage"]:
+    if not connected:
+        return "outage"
+    if booting:
+        return "booting"
+    if not running:
+        return "down"
+    return "stable"
@@ -0,0 +1,189 @@
+"""
+Calibrate template match thresholds per template and resolution.
+
+Labeled frames are full screenshots laid out as:
+
+    calibration/<width>x<height>/<template>/positive/*.png  (the template IS on screen)
+    calibration/<width>x<height>/<template>/negative/*.png  (the template is NOT on screen)
+
+Run with 'python -m common.calibrate' and the chosen thresholds are written to thresholds.json,
+which common.helpers picks up automatically. Frames are scored with each template's matching mode.
+
+With --masks, pixels that vary between the positive frames (animations) are masked out of each
+template first, for use with the "masked" and "edges" matching modes.
+"""
+
+import argparse
+import json
+import logging
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+try:
+    from common import const, helpers, matching
+except ModuleNotFoundError:
+    import const
+    import helpers
+    import matching
+
+log = logging.getLogger("arkhandler.calibrate")
+
+FRAME_SUFFIXES = (".png", ".jpg", ".jpeg", ".bmp")
+MIN_THRESHOLD = 0.5
+MAX_THRESHOLD = 0.99
+MARGIN = 0.02  # Used below the weakest positive when there are no negatives to separate from
+MASK_STD = 12  # Pixels varying more than this between positive frames are treated as animated
+MIN_MASK_FRAMES = 3
+
+
+def find_template(resolution_dir: Path, name: str) -> Path | None:
+    """Find a template image regardless of the case of its extension."""
+    for path in resolution_dir.iterdir():
+        if path.stem.lower() == name.lower() and path.suffix.lower() == ".png":
+            return path
+    return None
+
+
+def load_gray(path: Path) -> np.ndarray:
+    return cv2.imdecode(np.fromfile(str(path), dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+
+
+def load_frames(folder: Path) -> list[np.ndarray]:
+    if not folder.exists():
+        return []
+    frames = []
+    for frame_path in sorted(folder.iterdir()):
+        if frame_path.suffix.lower() not in FRAME_SUFFIXES:
+            continue
+        frame = load_gray(frame_path)
+        if frame is None:
+            log.warning(f"Could not read frame {frame_path}")
+            continue
+        frames.append(frame)
+    return frames
+
+
+def score_frames(frames: list[np.ndarray], template: np.ndarray, name: str, mask: np.ndarray | None) -> list[float]:
+    # A threshold of 1 lets the ORB fallback (if enabled) have a go at every frame
+    return [helpers.match_template(frame, template, name, 1.0, mask)[0] for frame in frames]
+
+
+def build_mask(frames: list[np.ndarray], template: np.ndarray) -> np.ndarray | None:
+    """Mask out the template pixels that change between positive frames"""
+    if len(frames) < MIN_MASK_FRAMES:
+        return None
+    height, width = template.shape[:2]
+    crops = []
+    for frame in frames:
+        _, (left, top, _, _) = helpers.match_template(frame, template)
+        crop = frame[top : top + height, left : left + width]
+        if crop.shape == template.shape:
+            crops.append(crop.astype(np.float32))
+    if len(crops) < MIN_MASK_FRAMES:
+        return None
+    varying = np.std(np.stack(crops), axis=0) > MASK_STD
+    return np.where(varying, 0, 255).astype(np.uint8)
+
+
+def pick_threshold(positives: list[float], negatives: list[float]) -> float:
+    """
+    Pick the threshold that best separates the positive scores from the negative scores.
+
+    - Cleanly separable: the midpoint between the weakest positive and strongest negative
+    - Overlapping: the threshold with the best true positive rate minus false positive rate,
+      favoring the higher threshold on ties so we don't click too early
+    - No negatives: just under the weakest positive
+    """
+    if not negatives:
+        threshold = min(positives) - MARGIN
+    elif min(positives) > max(negatives):
+        threshold = (min(positives) + max(negatives)) / 2
+    else:
+        pos = np.array(positives)
+        neg = np.array(negatives)
+        best_threshold, best_score = MAX_THRESHOLD, -1.0
+        for candidate in sorted(set(positives + negatives)):
+            separation = (pos >= candidate).mean() - (neg >= candidate).mean()
+            if separation >= best_score:
+                best_threshold, best_score = candidate, separation
+        threshold = best_threshold
+    return round(min(max(threshold, MIN_THRESHOLD), MAX_THRESHOLD), 4)
+
+
+def calibrate(frames_dir: Path, make_masks: bool = False) -> dict[str, dict[str, float]]:
+    results: dict[str, dict[str, float]] = {}
+    if not frames_dir.exists():
+        log.error(f"Calibration frames folder not found: {frames_dir}")
+        return results
+    for res_dir in sorted(p for p in frames_dir.iterdir() if p.is_dir()):
+        resolution_dir = const.IMAGE_PATH / res_dir.name
+        if not resolution_dir.exists():
+            log.warning(f"Skipping unsupported resolution {res_dir.name}")
+            continue
+        for template_dir in sorted(p for p in res_dir.iterdir() if p.is_dir()):
+            name = template_dir.name
+            template_path = find_template(resolution_dir, name)
+            if not template_path:
+                log.warning(f"No {name} template for {res_dir.name}, skipping")
+                continue
+            template = load_gray(template_path)
+            positive_frames = load_frames(template_dir / "positive")
+            if not positive_frames:
+                log.warning(f"No positive frames for {res_dir.name}/{name}, skipping")
+                continue
+            if make_masks and (mask := build_mask(positive_frames, template)) is not None:
+                path = matching.mask_paths(name, res_dir.name)[0]
+                path.parent.mkdir(parents=True, exist_ok=True)
+                cv2.imwrite(str(path), mask)
+                ignored = round(100 * float((mask == 0).mean()), 1)
+                log.info(f"Saved {res_dir.name}/{name} mask ignoring {ignored}% of the template to {path}")
+            mask = matching.load_mask(name, res_dir.name)
+            positives = score_frames(positive_frames, template, name, mask)
+            negatives = score_frames(load_frames(template_dir / "negative"), template, name, mask)
+            threshold = pick_threshold(positives, negatives)
+            results.setdefault(res_dir.name, {})[name] = threshold
+            log.info(
+                f"{res_dir.name}/{name}: threshold {threshold} "
+                f"(positives {min(positives):.3f}-{max(positives):.3f} over {len(positives)}, "
+                f"negatives {max(negatives, default=0):.3f} max over {len(negatives)})"
+            )
+            false_negatives = sum(1 for i in positives if i < threshold)
+            false_positives = sum(1 for i in negatives if i >= threshold)
+            if false_negatives or false_positives:
+                log.warning(
+                    f"{res_dir.name}/{name} is not cleanly separable: "
+                    f"{false_negatives} false negatives, {false_positives} false positives"
+                )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate template match thresholds from labeled frames")
+    parser.add_argument("--frames", type=Path, default=const.CALIBRATION_PATH, help="Labeled frames folder")
+    parser.add_argument("--output", type=Path, default=const.THRESHOLDS_PATH, help="Thresholds file to write")
+    parser.add_argument("--dry-run", action="store_true", help="Print the thresholds without saving them")
+    parser.add_argument("--masks", action="store_true", help="Build masks for animated pixels from the positives")
+    args = parser.parse_args()
+
+    results = calibrate(args.frames, args.masks)
+    if not results:
+        log.warning("Nothing was calibrated")
+        return
+    if args.dry_run:
+        print(json.dumps(results, indent=4))
+        return
+
+    # Merge with existing results so calibrating one resolution doesn't wipe out the others
+    existing = json.loads(args.output.read_text()) if args.output.exists() else {}
+    for resolution, thresholds in results.items():
+        existing.setdefault(resolution, {}).update(thresholds)
+    args.output.write_text(json.dumps(existing, indent=4))
+    log.info(f"Saved thresholds to {args.output}")
+
+
+if __name__ == "__main__":
+    # Console only, logs.log belongs to the running handler
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    main()
@@ -0,0 +1,461 @@
+"""
+Keep the cluster transfer folder in sync between ArkHandlers on different machines.
+
+Each handler watches its cluster folder and pushes files that changed to its peers over a persistent,
+authenticated TCP connection. Like rsync, the receiver sends the weak and strong checksums of the
+blocks it already has, and the sender only sends the bytes that don't match any of them.
+Received files are written to a temp file and swapped in, and the newest modification time wins a conflict.
+Files still being written (modified in the last SETTLE seconds) are left until the game is done with them.
+
+Every message is framed as two big-endian uint32 lengths, a JSON header and a binary payload.
+
+Run two on one machine to try it out:
+    python -m common.clustersync --dir /tmp/a --port 7791 --peer 127.0.0.1:7792 --secret test
+    python -m common.clustersync --dir /tmp/b --port 7792 --peer 127.0.0.1:7791 --secret test
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import struct
+import time
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from common import executor, metrics
+except ModuleNotFoundError:
+    import executor
+    import metrics
+
+log = logging.getLogger("arkhandler.clustersync")
+
+BLOCK = 2048  # Bytes per checksummed block
+SETTLE = 2.0  # Seconds a file has to go unmodified before it's sent
+SCAN_INTERVAL = 1.0
+MAX_MESSAGE = 256 * 1024**2
+MAX_HANDSHAKE = 4096  # Until a peer has authenticated it only gets to send something this small
+TMP_SUFFIX = ".clustersync"
+RECONNECT_DELAY = 5.0
+
+
+class SyncError(Exception):
+    pass
+
+
+# Checksums and deltas
+
+
+def rolling_checksums(data: np.ndarray, block: int = BLOCK) -> np.ndarray:
+    """
+    The weak (adler style) checksum of the block starting at every offset, computed from prefix sums.
+
+    For the block at k: a = sum(x[k:k+B]) and b = sum((B - j) * x[k+j]), which is (k + B) * a minus the
+    prefix sums of i * x[i]. The checksum packs the low 16 bits of each into a uint32.
+    """
+    if len(data) < block:
+        return np.empty(0, dtype=np.uint32)
+    x = data.astype(np.int64)
+    s1 = np.concatenate(([0], np.cumsum(x)))
+    s2 = np.concatenate(([0], np.cumsum(x * np.arange(len(x), dtype=np.int64))))
+    k = np.arange(len(x) - block + 1, dtype=np.int64)
+    a = s1[k + block] - s1[k]
+    b = (k + block) * a - (s2[k + block] - s2[k])
+    return ((a & 0xFFFF) | ((b & 0xFFFF) << 16)).astype(np.uint32)
+
+
+def strong_checksum(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def block_signature(data: bytes, block: int = BLOCK) -> tuple[np.ndarray, list[str]]:
+    """Weak and strong checksums of every whole block in the file"""
+    count = len(data) // block
+    weak = rolling_checksums(np.frombuffer(data, dtype=np.uint8), block)[::block][:count]
+    strong = [strong_checksum(data[i * block : (i + 1) * block]) for i in range(count)]
+    return weak, strong
+
+
+def delta(data: bytes, weak: np.ndarray, strong: list[str], block: int = BLOCK) -> tuple[list[int], bytes]:
+    """
+    Describe data in terms of the receiver's blocks.
+
+    Returns the ops and the literal bytes. An op >= 0 copies that block from the receiver's file,
+    an op < 0 takes that many bytes from the literals.
+    """
+    ops: list[int] = []
+    literals: list[bytes] = []
+    pos = 0
+    if len(weak) and len(data) >= block:
+        rolling = rolling_checksums(np.frombuffer(data, dtype=np.uint8), block)
+        blocks: dict[int, list[int]] = {}
+        for index, checksum in enumerate(weak.tolist()):
+            blocks.setdefault(checksum, []).append(index)
+        # Only offsets whose weak checksum matches one of the receiver's blocks need a closer look
+        for offset in np.nonzero(np.isin(rolling, weak))[0].tolist():
+            if offset < pos:
+                continue
+            digest = strong_checksum(data[offset : offset + block])
+            match = next((i for i in blocks[int(rolling[offset])] if strong[i] == digest), None)
+            if match is None:
+                continue
+            if offset > pos:
+                ops.append(pos - offset)
+                literals.append(data[pos:offset])
+            ops.append(match)
+            pos = offset + block
+    if pos < len(data):
+        ops.append(pos - len(data))
+        literals.append(data[pos:])
+    return ops, b"".join(literals)
+
+
+def patch(old: bytes, ops: list[int], literals: bytes, block: int = BLOCK) -> bytes:
+    out = bytearray()
+    literal_pos = 0
+    for op in ops:
+        if op >= 0:
+            out += old[op * block : (op + 1) * block]
+        else:
+            out += literals[literal_pos : literal_pos - op]
+            literal_pos -= op
+    return bytes(out)
+
+
+# Messages
+
+
+async def send_message(writer: asyncio.StreamWriter, header: dict, payload: bytes = b"") -> None:
+    encoded = json.dumps(header).encode()
+    writer.write(struct.pack(">II", len(encoded), len(payload)) + encoded + payload)
+    await writer.drain()
+
+
+async def read_message(reader: asyncio.StreamReader, limit: int = MAX_MESSAGE) -> tuple[dict, bytes]:
+    header_len, payload_len = struct.unpack(">II", await reader.readexactly(8))
+    if header_len + payload_len > limit:
+        raise SyncError(f"Message too large ({header_len + payload_len} bytes)")
+    header = json.loads(await reader.readexactly(header_len))
+    payload = await reader.readexactly(payload_len) if payload_len else b""
+    return header, payload
+
+
+def sign(secret: str, nonce: str) -> str:
+    return hmac.new(secret.encode(), nonce.encode(), hashlib.sha256).hexdigest()
+
+
+class Peer:
+    """A persistent connection to another handler, reconnecting as needed"""
+
+    def __init__(self, host: str, port: int, secret: str) -> None:
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+        self.lock = asyncio.Lock()
+        self.retry_at = 0.0
+        self.backlog: set[str] = set()  # Files that failed to send, retried once the peer is reachable
+
+    def __str__(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    async def connect(self) -> None:
+        if self.writer and not self.writer.is_closing():
+            return
+        if time.monotonic() < self.retry_at:
+            raise SyncError(f"Waiting to reconnect to {self}")
+        try:
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), 10)
+            challenge, _ = await read_message(self.reader, MAX_HANDSHAKE)
+            nonce = secrets.token_hex(16)
+            auth = {"type": "auth", "mac": sign(self.secret, challenge["nonce"]), "nonce": nonce}
+            await send_message(self.writer, auth)
+            welcome, _ = await read_message(self.reader, MAX_HANDSHAKE)
+            if welcome.get("type") != "welcome" or not hmac.compare_digest(
+                welcome.get("mac", ""), sign(self.secret, nonce)
+            ):
+                raise SyncError(f"{self} failed authentication")
+        except Exception:
+            self.close()
+            self.retry_at = time.monotonic() + RECONNECT_DELAY
+            raise
+        log.info(f"Connected to cluster peer {self}")
+
+    def close(self) -> None:
+        if self.writer:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, header: dict, payload: bytes = b"") -> tuple[dict, bytes]:
+        async with self.lock:
+            await self.connect()
+            try:
+                await send_message(self.writer, header, payload)
+                response = await asyncio.wait_for(read_message(self.reader), 60)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                self.close()
+                raise SyncError(f"Lost connection to {self}: {e!r}") from e
+        if response[0].get("type") == "error":
+            raise SyncError(f"{self} rejected {header.get('path')}: {response[0].get('error')}")
+        return response
+
+
+class ClusterSync:
+    def __init__(
+        self,
+        directory: Path,
+        port: int,
+        peers: list[tuple[str, int]],
+        secret: str,
+        host: str = "0.0.0.0",
+    ) -> None:
+        self.directory = Path(directory)
+        self.port = port
+        self.host = host
+        self.secret = secret
+        self.peers = [Peer(peer_host, peer_port, secret) for peer_host, peer_port in peers]
+        # (size, mtime_ns) of each file as last sent or received, so we only push real changes
+        self.known: dict[str, tuple[int, int]] = {}
+        self.server: asyncio.AbstractServer | None = None
+        self.task: asyncio.Task | None = None
+        self.stats = {"sent_files": 0, "sent_bytes": 0, "received_files": 0, "received_bytes": 0}
+
+    async def start(self) -> None:
+        if not self.secret:
+            raise SyncError("A shared secret is required for cluster sync")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.server = await asyncio.start_server(self.handle_peer, self.host, self.port)
+        self.task = asyncio.create_task(self.run())
+        peers = ", ".join(map(str, self.peers))
+        log.info(f"Cluster sync for {self.directory} listening on port {self.port}, peers: {peers}")
+
+    def close(self) -> None:
+        if self.task:
+            self.task.cancel()
+        if self.server:
+            self.server.close()
+        for peer in self.peers:
+            peer.close()
+
+    def resolve(self, rel: str) -> Path:
+        """A path inside the cluster folder, refusing anything that tries to climb out of it"""
+        path = (self.directory / rel).resolve()
+        if not path.is_relative_to(self.directory.resolve()) or path == self.directory.resolve():
+            raise SyncError(f"Invalid path {rel}")
+        return path
+
+    def scan(self) -> list[str]:
+        """Files that changed since they were last synced and have finished being written"""
+        now = time.time_ns()
+        changed = []
+        for path in self.directory.rglob("*"):
+            if path.name.endswith(TMP_SUFFIX):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if not path.is_file():
+                continue
+            rel = path.relative_to(self.directory).as_posix()
+            state = (stat.st_size, stat.st_mtime_ns)
+            if self.known.get(rel) == state or (now - stat.st_mtime_ns) / 1e9 < SETTLE:
+                continue
+            self.known[rel] = state
+            changed.append(rel)
+        return changed
+
+    async def run(self) -> None:
+        while True:
+            try:
+                for rel in await executor.run_blocking(self.scan):
+                    await self.push(rel, self.peers)
+                for peer in self.peers:
+                    if peer.backlog and time.monotonic() >= peer.retry_at:
+                        for rel in sorted(peer.backlog):
+                            await self.push(rel, [peer])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error("Cluster sync scan failed", exc_info=e)
+            await asyncio.sleep(SCAN_INTERVAL)
+
+    async def push(self, rel: str, peers: list[Peer]) -> None:
+        path = self.directory / rel
+        try:
+            data, state = await executor.run_blocking(self.read_stable, path)
+        except FileNotFoundError:
+            for peer in peers:
+                peer.backlog.discard(rel)
+            return
+        except (OSError, SyncError) as e:
+            log.debug(f"Not sending {rel} yet: {e}")
+            self.known.pop(rel, None)
+            return
+        for peer in peers:
+            try:
+                await self.push_to(peer, rel, data, state)
+                peer.backlog.discard(rel)
+            except Exception as e:
+                if rel not in peer.backlog:
+                    log.warning(f"Failed to send {rel} to {peer}, will retry: {e}")
+                peer.backlog.add(rel)
+
+    @staticmethod
+    def read_stable(path: Path) -> tuple[bytes, tuple[int, int]]:
+        """Read a file, making sure it wasn't modified while reading it"""
+        before = path.stat()
+        data = path.read_bytes()
+        after = path.stat()
+        if (before.st_size, before.st_mtime_ns) != (after.st_size, after.st_mtime_ns):
+            raise SyncError("modified while reading")
+        return data, (after.st_size, after.st_mtime_ns)
+
+    async def push_to(self, peer: Peer, rel: str, data: bytes, state: tuple[int, int]) -> None:
+        size, mtime_ns = state
+        offer = {"type": "offer", "path": rel, "size": size, "mtime_ns": mtime_ns}
+        response, payload = await peer.request(offer)
+        if response["type"] != "signature":
+            log.debug(f"{peer} already has {rel} ({response['type']})")
+            return
+        weak = np.frombuffer(payload, dtype="<u4")
+        ops, literals = await executor.run_blocking(delta, data, weak, response["strong"], response["block"])
+        header = {
+            "type": "delta",
+            "path": rel,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "ops": ops,
+        }
+        await peer.request(header, literals)
+        self.stats["sent_files"] += 1
+        self.stats["sent_bytes"] += len(literals)
+        metrics.incr("cluster_sent_bytes", len(literals))
+        log.info(f"Sent {rel} to {peer}: {len(literals)} of {size} bytes changed")
+
+    async def handle_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        address = writer.get_extra_info("peername")
+        try:
+            nonce = secrets.token_hex(16)
+            await send_message(writer, {"type": "challenge", "nonce": nonce})
+            auth, _ = await asyncio.wait_for(read_message(reader, MAX_HANDSHAKE), 10)
+            if not hmac.compare_digest(auth.get("mac", ""), sign(self.secret, nonce)):
+                log.warning(f"Rejected cluster peer {address}: bad secret")
+                return
+            await send_message(writer, {"type": "welcome", "mac": sign(self.secret, auth.get("nonce", ""))})
+            # (size, mtime_ns) of our copy when its signature was sent, to catch it changing before the delta lands
+            pending: dict[str, tuple[int, int] | None] = {}
+            while True:
+                header, payload = await read_message(reader)
+                try:
+                    if header.get("type") == "offer":
+                        response = await executor.run_blocking(self.answer_offer, header, pending)
+                    elif header.get("type") == "delta":
+                        response = (await executor.run_blocking(self.apply_delta, header, payload, pending), b"")
+                    else:
+                        raise SyncError(f"Unknown message type {header.get('type')}")
+                except (SyncError, OSError) as e:
+                    response = ({"type": "error", "error": str(e)}, b"")
+                await send_message(writer, *response)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.TimeoutError):
+            pass
+        except Exception as e:
+            log.error(f"Cluster peer {address} failed", exc_info=e)
+        finally:
+            writer.close()
+
+    def answer_offer(self, header: dict, pending: dict) -> tuple[dict, bytes]:
+        rel = header["path"]
+        path = self.resolve(rel)
+        if not path.exists():
+            pending[rel] = None
+            return {"type": "signature", "block": BLOCK, "strong": []}, b""
+        data, state = self.read_stable(path)
+        if state == (header["size"], header["mtime_ns"]):
+            return {"type": "same"}, b""
+        if state[1] > header["mtime_ns"]:
+            # Ours is newer, it'll be sent the other way
+            return {"type": "newer"}, b""
+        weak, strong = block_signature(data)
+        pending[rel] = state
+        return {"type": "signature", "block": BLOCK, "strong": strong}, weak.astype("<u4").tobytes()
+
+    def apply_delta(self, header: dict, literals: bytes, pending: dict) -> dict:
+        rel = header["path"]
+        if rel not in pending:
+            raise SyncError(f"No offer for {rel}")
+        expected = pending.pop(rel)
+        path = self.resolve(rel)
+        old = b""
+        if expected is not None:
+            old, state = self.read_stable(path)
+            if state != expected:
+                raise SyncError(f"{rel} changed here while it was being sent")
+        elif path.exists():
+            raise SyncError(f"{rel} was created here while it was being sent")
+        data = patch(old, header["ops"], literals)
+        if len(data) != header["size"] or hashlib.sha256(data).hexdigest() != header["sha256"]:
+            raise SyncError(f"{rel} didn't match after patching")
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + TMP_SUFFIX)
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.utime(tmp, ns=(header["mtime_ns"], header["mtime_ns"]))
+        os.replace(tmp, path)
+        # Don't send it straight back
+        stat = path.stat()
+        self.known[rel] = (stat.st_size, stat.st_mtime_ns)
+        self.stats["received_files"] += 1
+        self.stats["received_bytes"] += len(literals)
+        metrics.incr("cluster_received_bytes", len(literals))
+        log.info(f"Received {rel}: {len(literals)} of {len(data)} bytes changed")
+        return {"type": "ok"}
+
+
+def parse_peers(text: str) -> list[tuple[str, int]]:
+    """Parse 'host:port, host:port'"""
+    peers = []
+    for item in text.replace(" ", "").split(","):
+        if not item:
+            continue
+        host, _, port = item.rpartition(":")
+        peers.append((host, int(port)))
+    return peers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync a cluster folder with other ArkHandlers")
+    parser.add_argument("--dir", type=Path, required=True, help="Cluster folder to sync")
+    parser.add_argument("--port", type=int, required=True, help="Port to listen on")
+    parser.add_argument("--peer", action="append", default=[], help="Peer as host:port, can be repeated")
+    parser.add_argument("--secret", required=True, help="Secret shared by all peers")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    async def run():
+        sync = ClusterSync(args.dir, args.port, parse_peers(",".join(args.peer)), args.secret)
+        await sync.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            sync.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,39 @@ class Conf(BaseModel):
     gameusersettings_ini: str
     sentry_dsn: str
     debug: bool
+    lag_threshold: float = 0.25
+    profiling: bool = False
+    profile_seconds: int = 30
+    json_logs: bool = False
+    log_max_mb: float = 1.0
+    log_backups: int = 5
+    log_rotate_hours: float = 0
+    log_retention_days: float = 14
+    backups: bool = True
+    backup_interval: int = 60
+    backup_keep: int = 24
+    backup_keep_days: float = 7
+    query_host: str = "127.0.0.1"
+    query_port: int = 27015
+    query_failures: int = 6
+    restart_defer_minutes: int = 30
+    adaptive_cadence: bool = True
+    cadence_min_scale: float = 0.25
+    cadence_max_scale: float = 4.0
+    cadence_settle_minutes: float = 60
+    vision_worker: bool = False
+    vision_worker_memory_mb: float = 1024
+    crash_repeat_limit: int = 3
+    crash_update_wait_minutes: int = 120
+    verify_saves: bool = True
+    network_telemetry: bool = True
+    network_alert_utilization: float = 80
+    network_alert_minutes: float = 2
+    network_alert_errors: int = 100
+    cluster_peers: str = ""
+    cluster_port: int = 7790
+    cluster_dir: str = ""
+    cluster_secret: str = ""
 
     @property
     def game_ini_path(self) -> Path:
@@ -33,6 +66,39 @@ class Conf(BaseModel):
             "gameusersettings_ini": settings.get("GameUserSettingsiniPath", fallback="").replace('"', ""),
             "sentry_dsn": settings.get("SentryDSN", fallback=const.DSN_FALLBACK).replace('"', ""),
             "debug": settings.getboolean("Debug", fallback=False),
+            "lag_threshold": settings.getfloat("LoopLagThreshold", fallback=0.25),
+            "profiling": settings.getboolean("Profiling", fallback=False),
+            "profile_seconds": settings.getint("ProfileSeconds", fallback=30),
+            "json_logs": settings.getboolean("JsonLogs", fallback=False),
+            "log_max_mb": settings.getfloat("LogMaxMB", fallback=1.0),
+            "log_backups": settings.getint("LogBackups", fallback=5),
+            "log_rotate_hours": settings.getfloat("LogRotateHours", fallback=0),
+            "log_retention_days": settings.getfloat("LogRetentionDays", fallback=14),
+            "backups": settings.getboolean("Backups", fallback=True),
+            "backup_interval": settings.getint("BackupInterval", fallback=60),
+            "backup_keep": settings.getint("BackupKeep", fallback=24),
+            "backup_keep_days": settings.getfloat("BackupKeepDays", fallback=7),
+            "query_host": settings.get("QueryHost", fallback="127.0.0.1").replace('"', "") or "127.0.0.1",
+            "query_port": settings.getint("QueryPort", fallback=27015),
+            "query_failures": settings.getint("QueryFailures", fallback=6),
+            "restart_defer_minutes": settings.getint("RestartDeferMinutes", fallback=30),
+            "adaptive_cadence": settings.getboolean("AdaptiveCadence", fallback=True),
+            "cadence_min_scale": settings.getfloat("CadenceMinScale", fallback=0.25),
+            "cadence_max_scale": settings.getfloat("CadenceMaxScale", fallback=4.0),
+            "cadence_settle_minutes": settings.getfloat("CadenceSettleMinutes", fallback=60),
+            "vision_worker": settings.getboolean("VisionWorker", fallback=False),
+            "vision_worker_memory_mb": settings.getfloat("VisionWorkerMemoryMB", fallback=1024),
+            "crash_repeat_limit": settings.getint("CrashRepeatLimit", fallback=3),
+            "crash_update_wait_minutes": settings.getint("CrashUpdateWaitMinutes", fallback=120),
+            "verify_saves": settings.getboolean("VerifySaves", fallback=True),
+            "network_telemetry": settings.getboolean("NetworkTelemetry", fallback=True),
+            "network_alert_utilization": settings.getfloat("NetworkAlertUtilization", fallback=80),
+            "network_alert_minutes": settings.getfloat("NetworkAlertMinutes", fallback=2),
+            "network_alert_errors": settings.getint("NetworkAlertErrors", fallback=100),
+            "cluster_peers": settings.get("ClusterPeers", fallback="").replace('"', ""),
+            "cluster_port": settings.getint("ClusterPort", fallback=7790),
+            "cluster_dir": settings.get("ClusterDir", fallback="").replace('"', ""),
+            "cluster_secret": settings.get("ClusterSecret", fallback="").replace('"', ""),
         }
         if config["game_ini"]:
             if Path(config["game_ini"]).is_dir():
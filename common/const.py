@@ -26,6 +26,21 @@ CONF_PATH = ROOT_PATH / "config.ini"
 DEFAULT_CONF_TEXT = (ASSET_PATH / "default_config.ini").read_text()
 BANNER_TEXT = (ASSET_PATH / "banner.txt").read_text()
 POSITIONS_PATH = IMAGE_PATH / "positions.json"
+THRESHOLDS_PATH = ROOT_PATH / "thresholds.json"
+CALIBRATION_PATH = ROOT_PATH / "calibration"
+MASK_PATH = ROOT_PATH / "masks"
+UPDATE_BOOKMARK_PATH = ROOT_PATH / "update_bookmark.json"
+BACKUP_PATH = ROOT_PATH / "backups"
+STATE_PATH = ROOT_PATH / "state.json"
+CRASH_INDEX_PATH = ROOT_PATH / "crash_index.json"
+CRASH_RULES_PATH = ROOT_PATH / "crash_rules.json"
+INTEGRITY_PATH = ROOT_PATH / "integrity.json"
+
+# Fallback match confidences used when a template has no calibrated threshold
+STATE_CONFIDENCE = 0.85  # Identifying the current game state
+BUTTON_CONFIDENCE = 0.93  # Confirming a specific button is on screen
+
+OS_WORKERS = 6  # Threads reserved for blocking OS/Win32 calls
 
 DOWNLOAD = "**The server has started downloading an update, and will go down once it starts installing.**"
 INSTALL = "**The server has started installing the update. Stand by...**"
@@ -35,6 +50,8 @@ APP = "StudioWildcard.4558480580BB9_1w2mm55455e38"
 SAVE_PATH = Path(os.environ["LOCALAPPDATA"]) / "Packages" / APP / "LocalState" / "Saved"
 CLUSTER_PATH = SAVE_PATH / "clusters" / "solecluster"
 INI_PATH = SAVE_PATH / "UWPConfig" / "UWP"
+LOG_FILE_PATH = SAVE_PATH / "Logs" / "ShooterGame.log"
+CRASH_PATH = SAVE_PATH / "Crashes"
 
 BOOT_COMMAND = rf"explorer.exe shell:appsFolder\{APP}!AppARKSurvivalEvolved"
 MS_BOOT_COMMAND = r"explorer.exe shell:appsFolder\Microsoft.WindowsStore_8wekyb3d8bbwe!App"
@@ -0,0 +1,134 @@
+"""
+Local control endpoint for a running ArkHandler.
+
+Listens on a named pipe on Windows and a Unix socket elsewhere. Each request is one line of JSON,
+e.g. {"cmd": "loglevel", "args": {"level": "DEBUG"}}, answered with one line of JSON.
+
+Usage: python -m common.control <status | reboot [--force] | pause | resume | resync | loglevel <level> | metrics | profile [seconds]>
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import socket
+import sys
+import typing as t
+from datetime import datetime
+from pathlib import Path
+
+try:
+    from common import const
+except ModuleNotFoundError:
+    import const
+
+if t.TYPE_CHECKING:
+    from common.tasks import ArkHandler
+
+log = logging.getLogger("arkhandler.control")
+
+IS_WINDOWS = sys.platform == "win32"
+ADDRESS = r"\\.\pipe\arkhandler" if IS_WINDOWS else str(const.ROOT_PATH / "arkhandler.sock")
+COMMANDS = ["status", "reboot", "pause", "resume", "resync", "loglevel", "metrics", "profile"]
+
+
+class ControlServer:
+    def __init__(self, handler: "ArkHandler", address: str = ADDRESS) -> None:
+        self.handler = handler
+        self.address = address
+        self.servers: list = []
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if IS_WINDOWS:
+
+            def factory():
+                reader = asyncio.StreamReader()
+                return asyncio.StreamReaderProtocol(reader, self.handle_client)
+
+            # Only the proactor loop can serve named pipes, which is what main.py runs
+            self.servers = await loop.start_serving_pipe(factory, self.address)
+        else:
+            # Clear out a socket left behind by a previous run
+            Path(self.address).unlink(missing_ok=True)
+            self.servers = [await asyncio.start_unix_server(self.handle_client, path=self.address)]
+        log.info(f"Control endpoint listening on {self.address}")
+
+    def close(self) -> None:
+        for server in self.servers:
+            server.close()
+        self.servers = []
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    response = await self.dispatch(request.get("cmd", ""), request.get("args") or {})
+                except Exception as e:
+                    log.error("Control command failed", exc_info=e)
+                    response = {"ok": False, "error": str(e)}
+                writer.write(json.dumps(response, default=str).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, cmd: str, args: dict) -> dict:
+        if cmd not in COMMANDS:
+            return {"ok": False, "error": f"Unknown command '{cmd}', expected one of {', '.join(COMMANDS)}"}
+        log.info(f"Control command: {cmd} {args or ''}".strip())
+        result = await getattr(self.handler, f"control_{cmd}")(**args)
+        return {"ok": True, "result": result, "time": datetime.now().isoformat()}
+
+
+def send(cmd: str, args: dict | None = None, address: str = ADDRESS, timeout: float = 10) -> dict:
+    """Send a single command to a running handler and return its response"""
+    payload = json.dumps({"cmd": cmd, "args": args or {}}).encode() + b"\n"
+    if IS_WINDOWS:
+        with open(address, "r+b", buffering=0) as pipe:
+            pipe.write(payload)
+            response = b""
+            while not response.endswith(b"\n"):
+                chunk = pipe.read(65536)
+                if not chunk:
+                    break
+                response += chunk
+    else:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(address)
+            sock.sendall(payload)
+            response = sock.makefile("rb").readline()
+    return json.loads(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Control a running ArkHandler")
+    parser.add_argument("cmd", choices=COMMANDS)
+    parser.add_argument("value", nargs="?", help="Log level for 'loglevel', seconds for 'profile'")
+    parser.add_argument("--force", action="store_true", help="Reboot even if players are online")
+    args = parser.parse_args()
+
+    cmd_args = {}
+    if args.cmd == "reboot":
+        cmd_args["force"] = args.force
+    elif args.cmd == "loglevel":
+        if not args.value:
+            parser.error("loglevel needs a level, e.g. DEBUG")
+        cmd_args["level"] = args.value
+    elif args.cmd == "profile" and args.value:
+        cmd_args["seconds"] = float(args.value)
+
+    try:
+        response = send(args.cmd, cmd_args)
+    except (FileNotFoundError, ConnectionError) as e:
+        print(f"Could not reach ArkHandler at {ADDRESS}, is it running? ({e})")
+        sys.exit(1)
+    print(json.dumps(response, indent=2))
+    sys.exit(0 if response.get("ok") else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Work out why the server crashed and what to do about it.
+
+When the watchdog sees the server exit, the newest unread crash report and the tail of the server log
+are boiled down to a signature: the exception code, the faulting module and the last few log lines with
+timestamps, addresses and numbers stripped out. Signatures are counted in crash_index.json and mapped
+to a recovery strategy:
+
+- reboot: the usual reboot
+- restore: roll the map back to the newest backup from before the crash, then reboot
+- wait_update: hold off rebooting until an update installs (or the wait runs out)
+- hold: alert and don't reboot until told to resume
+
+Rules are matched in order against "<code> <module> <lines>", those in crash_rules.json next to the config
+come first, e.g. [{"match": "EXCEPTION_STACK_OVERFLOW", "strategy": "hold"}].
+A signature that keeps coming back within an hour is held whatever its rule says, since rebooting isn't fixing it.
+"""
+
+import hashlib
+import json
+import logging
+import re
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+
+try:
+    from common import const
+except ModuleNotFoundError:
+    import const
+
+log = logging.getLogger("arkhandler.crashes")
+
+STRATEGIES = ("reboot", "restore", "wait_update", "hold")
+REPORT_FILES = ("CrashContext.runtime-xml", "CrashReport.runtime-xml")
+MAX_REPORT_BYTES = 512 * 1024
+SIGNATURE_LINES = 3
+REPEAT_WINDOW = timedelta(hours=1)
+
+DEFAULT_RULES: list[dict[str, str]] = [
+    {"match": r"version mismatch|needs to be updated|incompatible version", "strategy": "wait_update"},
+    # Only errors that name a map save, the save code shows up in plenty of unrelated stacks
+    {
+        "match": r"(?:corrupt|truncated|failed to (?:load|read)) .*\.ark\b|\.ark\b.* (?:is corrupt|truncated)",
+        "strategy": "restore",
+    },
+    {"match": r".", "strategy": "reboot"},
+]
+
+ERROR_RE = re.compile(r"<ErrorMessage>(.*?)</ErrorMessage>", re.S)
+STACK_RE = re.compile(r"<CallStack>(.*?)</CallStack>", re.S)
+CODE_RE = re.compile(r"\b(EXCEPTION_[A-Z_]+|0x[0-9a-fA-F]{8})\b")
+MODULE_RE = re.compile(r"^\s*(?:\[[^\]]*\])*\s*([\w.-]+?)(?:\.exe|\.dll)?!", re.M | re.I)
+TIMESTAMP_RE = re.compile(r"^\[[\d.:-]+\]\[\s*\d+\]")
+ADDRESS_RE = re.compile(r"0x[0-9a-fA-F]+")
+NUMBER_RE = re.compile(r"\d+")
+
+
+@dataclass
+class Signature:
+    code: str
+    module: str
+    lines: tuple[str, ...]
+
+    @property
+    def id(self) -> str:
+        text = "|".join((self.code, self.module, *self.lines))
+        return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+    @property
+    def text(self) -> str:
+        return " ".join((self.code, self.module, *self.lines))
+
+
+@dataclass
+class Crash:
+    signature: Signature
+    strategy: str
+    count: int  # Times this signature has been seen, including this one
+    recent: int  # Times within the repeat window
+    time: datetime
+    report: str | None = None
+
+
+def normalize(line: str) -> str:
+    line = TIMESTAMP_RE.sub("", line.strip())
+    line = ADDRESS_RE.sub("<addr>", line)
+    line = NUMBER_RE.sub("#", line)
+    return " ".join(line.split())
+
+
+def build_signature(report: str, log_lines: list[str]) -> Signature:
+    """Reduce a crash report and the last log lines to what stays the same between repeats of a crash"""
+    error = ERROR_RE.search(report)
+    stack = STACK_RE.search(report)
+    context = "\n".join(filter(None, [error and error.group(1), stack and stack.group(1), *log_lines]))
+    code = CODE_RE.search(context)
+    module = MODULE_RE.search(stack.group(1) if stack else "\n".join(log_lines))
+    lines = [normalize(line) for line in log_lines if line.strip()]
+    return Signature(
+        code=code.group(1) if code else "UNKNOWN",
+        module=module.group(1) if module else "unknown",
+        lines=tuple(lines[-SIGNATURE_LINES:]),
+    )
+
+
+class CrashAnalyzer:
+    def __init__(
+        self,
+        crash_dir: Path = const.CRASH_PATH,
+        index_path: Path = const.CRASH_INDEX_PATH,
+        rules_path: Path = const.CRASH_RULES_PATH,
+        repeat_limit: int = 3,
+    ) -> None:
+        self.crash_dir = crash_dir
+        self.index_path = index_path
+        self.rules_path = rules_path
+        self.repeat_limit = repeat_limit
+        self.index: dict = {"signatures": {}, "last_report": 0.0}
+        self.load()
+
+    def load(self) -> None:
+        if not self.index_path.exists():
+            return
+        try:
+            self.index = json.loads(self.index_path.read_text())
+        except (OSError, ValueError) as e:
+            log.warning(f"Starting a new crash index, could not read {self.index_path}: {e}")
+
+    def save(self) -> None:
+        tmp = self.index_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.index, indent=2))
+        tmp.replace(self.index_path)
+
+    def rules(self) -> list[dict[str, str]]:
+        custom = []
+        if self.rules_path.exists():
+            try:
+                custom = json.loads(self.rules_path.read_text())
+            except (OSError, ValueError) as e:
+                log.error(f"Ignoring invalid crash rules in {self.rules_path}", exc_info=e)
+        return [rule for rule in custom + DEFAULT_RULES if rule.get("strategy") in STRATEGIES]
+
+    def new_report(self) -> tuple[str, str] | None:
+        """The newest crash report written since the last one we read, as (name, contents)"""
+        if not self.crash_dir.exists():
+            return None
+        newest: tuple[float, Path] | None = None
+        for folder in self.crash_dir.iterdir():
+            for name in REPORT_FILES:
+                path = folder / name
+                try:
+                    mtime = path.stat().st_mtime
+                except OSError:
+                    continue
+                if mtime > self.index["last_report"] and (newest is None or mtime > newest[0]):
+                    newest = (mtime, path)
+        if not newest:
+            return None
+        self.index["last_report"] = newest[0]
+        with open(newest[1], "rb") as f:
+            data = f.read(MAX_REPORT_BYTES)
+        encoding = "utf-16" if data[:2] in (b"\xff\xfe", b"\xfe\xff") else "utf-8"
+        return newest[1].parent.name, data.decode(encoding, errors="replace")
+
+    def choose(self, signature: Signature, recent: int) -> str:
+        if self.repeat_limit and recent >= self.repeat_limit:
+            return "hold"
+        for rule in self.rules():
+            if re.search(rule["match"], signature.text, re.IGNORECASE):
+                return rule["strategy"]
+        return "reboot"
+
+    def analyze(self, log_lines: list[str] | deque) -> Crash:
+        now = datetime.now()
+        report_name, report = self.new_report() or (None, "")
+        signature = build_signature(report, list(log_lines))
+
+        entry = self.index["signatures"].setdefault(
+            signature.id,
+            {
+                "code": signature.code,
+                "module": signature.module,
+                "lines": list(signature.lines),
+                "count": 0,
+                "first_seen": now.isoformat(),
+                "times": [],
+            },
+        )
+        cutoff = now - REPEAT_WINDOW
+        entry["times"] = [i for i in entry["times"] if datetime.fromisoformat(i) > cutoff] + [now.isoformat()]
+        entry["count"] += 1
+        entry["last_seen"] = now.isoformat()
+        strategy = self.choose(signature, len(entry["times"]))
+        entry["strategy"] = strategy
+        self.save()
+
+        crash = Crash(signature, strategy, entry["count"], len(entry["times"]), now, report_name)
+        log.warning(
+            f"Crash {signature.id}: {signature.code} in {signature.module} "
+            f"(seen {crash.count} times, {crash.recent} in the last hour) -> {strategy}"
+        )
+        return crash
@@ -0,0 +1,63 @@
+import asyncio
+import functools
+import logging
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import DEVNULL
+
+from common import const, metrics
+
+log = logging.getLogger("arkhandler.executor")
+
+# All blocking OS/Win32 work runs here so the event loop and the default executor are never tied up
+os_executor = ThreadPoolExecutor(max_workers=const.OS_WORKERS, thread_name_prefix="arkhandler-os")
+
+
+async def run_blocking(func: t.Callable[..., t.Any], *args, **kwargs) -> t.Any:
+    """Run a blocking function in the OS executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(os_executor, functools.partial(func, *args, **kwargs))
+
+
+async def run_command(cmd: str, timeout: float | None = None) -> int | None:
+    """Run a shell command without blocking the loop, returns the exit code or None if it timed out."""
+    proc = await asyncio.create_subprocess_shell(cmd, stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL)
+    try:
+        return await asyncio.wait_for(proc.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        log.warning(f"Command timed out after {timeout}s: {cmd}")
+        proc.kill()
+        return None
+
+
+def shutdown() -> None:
+    os_executor.shutdown(wait=False, cancel_futures=True)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up and reports any stall over the threshold."""
+
+    def __init__(self, threshold: float, interval: float = 0.5) -> None:
+        self.threshold = threshold
+        self.interval = interval
+        self.task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - start - self.interval
+            metrics.gauge("loop_lag_seconds", round(lag, 4))
+            metrics.gauge_max("loop_lag_max_seconds", round(lag, 4))
+            if lag > self.threshold:
+                metrics.incr("loop_stalls")
+                log.warning(f"Event loop stalled for {lag:.3f}s")
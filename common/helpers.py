@@ -1,9 +1,11 @@
 import asyncio
-import contextlib
+import functools
 import json
 import logging
 import os
 import ssl
+import time
+import typing as t
 from contextlib import suppress
 from datetime import datetime
 from pathlib import Path
@@ -16,44 +18,146 @@ import numpy as np
 import psutil
 import pyautogui
 import pyscreeze
-import pywinauto
+import pythoncom
 import pywintypes
 import win32api
 import win32con
-import win32gui
 import win32security
 import wmi
-from comtypes import COMError
 from pyinjector import inject
-from pywinauto import Application, ElementAmbiguousError, ElementNotFoundError
-from pywinauto.timings import TimeoutError
 
 try:
-    from common import const
+    from common import const, matching, metrics, vision, windows
+    from common.profiling import timed
 except ModuleNotFoundError:
+    from profiling import timed
+
     import const
+    import matching
+    import metrics
+    import vision
+    import windows
 
 log = logging.getLogger("arkhandler.helpers")
 
 
 pyscreeze.USE_IMAGE_NOT_FOUND_EXCEPTION = False
 
+# Calibrated thresholds keyed by resolution then template, along with the mtime they were loaded at
+_thresholds: dict[str, dict[str, float]] = {}
+_thresholds_mtime: float | None = None
+
+_images: dict[str, np.ndarray] = {}
+
+
+def decode_image(imagebytes: bytes) -> np.ndarray | None:
+    """Decode a template to grayscale, None if the bytes aren't an image"""
+    return cv2.imdecode(np.frombuffer(imagebytes, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+
 
 def get_images() -> dict[str, np.ndarray]:
-    images: dict[str, np.ndarray] = {}
-    for name, imagebytes in const.IMAGE_BYTES.items():
-        image_array = np.frombuffer(imagebytes, dtype=np.uint8)
-        images[name] = cv2.imdecode(image_array, cv2.IMREAD_GRAYSCALE)
-    return images
+    """Templates for the current resolution, decoded once"""
+    if not _images:
+        for name, imagebytes in const.IMAGE_BYTES.items():
+            _images[name] = decode_image(imagebytes)
+    return _images
+
+
+@timed
+def grab_screen() -> np.ndarray:
+    """Capture the screen as grayscale"""
+    return np.array(pyautogui.screenshot().convert("L"))
+
+
+@timed
+def locate(
+    state: str,
+    confidence: float,
+    minSearchTime: float = 0.0,
+    screen: np.ndarray | None = None,
+) -> pyscreeze.Box | None:
+    """Find a template on screen using its configured matching mode, retrying until minSearchTime has passed"""
+    deadline = time.monotonic() + minSearchTime
+    while True:
+        haystack = grab_screen() if screen is None else screen
+        score, box = score_templates(haystack, {state: confidence})[state]
+        if score >= confidence:
+            return pyscreeze.Box(*box)
+        if screen is not None or time.monotonic() >= deadline:
+            return None
+        sleep(0.1)
+
 
+def load_thresholds() -> dict[str, dict[str, float]]:
+    """Load the calibrated thresholds file, only re-reading it when it has changed on disk."""
+    global _thresholds, _thresholds_mtime
+    try:
+        mtime = const.THRESHOLDS_PATH.stat().st_mtime
+    except FileNotFoundError:
+        _thresholds, _thresholds_mtime = {}, None
+        return _thresholds
+    if mtime == _thresholds_mtime:
+        return _thresholds
+    try:
+        _thresholds = json.loads(const.THRESHOLDS_PATH.read_text())
+        log.info(f"Loaded calibrated thresholds from {const.THRESHOLDS_PATH}")
+    except (OSError, ValueError) as e:
+        log.error(f"Failed to load thresholds from {const.THRESHOLDS_PATH}", exc_info=e)
+        _thresholds = {}
+    _thresholds_mtime = mtime
+    return _thresholds
+
+
+def get_confidence(state: str, fallback: float) -> float:
+    """Get the calibrated confidence for a template at the current resolution, or the fallback if uncalibrated."""
+    resolution = f"{const.SCREEN_WIDTH}x{const.SCREEN_HEIGHT}"
+    return float(load_thresholds().get(resolution, {}).get(state, fallback))
+
+
+def match_template(
+    haystack: np.ndarray,
+    needle: np.ndarray,
+    name: str | None = None,
+    threshold: float | None = None,
+    mask: np.ndarray | None = None,
+) -> tuple[float, tuple[int, int, int, int]]:
+    """
+    Score the best match of a grayscale needle within a grayscale haystack.
 
+    When the template name is given its matching mode from matching.json is used, otherwise the
+    same normalized correlation as pyautogui's confidence matching. Either way scores are directly
+    comparable to the confidence thresholds.
+
+    Returns the score and the (left, top, width, height) box of the best match.
+    """
+    return matching.match(haystack, needle, name, threshold, mask)
+
+
+def score_templates(
+    screen: np.ndarray, thresholds: dict[str, float]
+) -> dict[str, tuple[float, tuple[int, int, int, int]]]:
+    """Score several templates against one capture, in the vision worker process if it's enabled"""
+    if vision.worker:
+        try:
+            return vision.worker.match(screen, thresholds)
+        except vision.VisionError as e:
+            log.warning(f"{e}, matching in process instead")
+    images = get_images()
+    return {name: match_template(screen, images[name], name, threshold) for name, threshold in thresholds.items()}
+
+
+@timed
 def sync_file(source: Path) -> bool:
     dest = const.INI_PATH / source.name
     if not source.exists():
         log.error(f"ini file not found: {source}")
         return False
     try:
-        dest.write_text(source.read_text())
+        text = source.read_text()
+        if dest.exists() and dest.read_text() == text:
+            log.info(f"{source.name} is already in sync")
+            return True
+        dest.write_text(text)
         log.info(f"Synced {source.name} to UWPConfig")
         return True
     except Exception as e:
@@ -61,6 +165,7 @@ def sync_file(source: Path) -> bool:
         return False
 
 
+@timed
 async def send_webhook(url: str, title: str, message: str, color: int, footer: str | None = None):
     if not url:
         return
@@ -100,6 +205,7 @@ async def send_webhook(url: str, title: str, message: str, color: int, footer: s
         log.error(f"Failed to send {title} webhook", exc_info=e)
 
 
+@timed
 async def internet_connected() -> bool:
     """Check if the host machine is connected to the internet."""
 
@@ -129,24 +235,30 @@ async def internet_connected() -> bool:
     return False
 
 
+@timed
 def get_ethernet_link_speed() -> list[tuple[str, float]]:
-    connection = wmi.WMI()
-    speeds = []
-    for adapter in connection.Win32_NetworkAdapter():
-        if not adapter.NetConnectionID:
-            continue
-        if "Ethernet" not in adapter.NetConnectionID:
-            continue
-        speed = adapter.Speed
-        if not speed:
-            continue
-        speed_mbps = round(int(speed) / (1024**2), 1)
-        speeds.append([adapter.NetConnectionID, speed_mbps])
-        log.debug(f"{adapter.NetConnectionID}'s speed: {speed_mbps} Mbps")
-    return speeds
-
-
-def get_game_state(confidence: float = 0.85, minSearchTime: float = 0.0) -> str | None:
+    """Link speeds from WMI, slow so only used for adapters psutil doesn't know the speed of"""
+    # Runs on executor threads, which don't have COM set up
+    pythoncom.CoInitialize()
+    try:
+        connection = wmi.WMI()
+        speeds = []
+        for adapter in connection.Win32_NetworkAdapter():
+            if not adapter.NetConnectionID:
+                continue
+            speed = adapter.Speed
+            if not speed:
+                continue
+            speed_mbps = round(int(speed) / 1e6, 1)
+            speeds.append((adapter.NetConnectionID, speed_mbps))
+            log.debug(f"{adapter.NetConnectionID}'s speed: {speed_mbps} Mbps")
+        return speeds
+    finally:
+        pythoncom.CoUninitialize()
+
+
+@timed
+def get_game_state(confidence: float | None = None, minSearchTime: float = 0.0) -> str | None:
     """
     Return the current state of the game
     - start: the game is at the pre-menu screen
@@ -156,28 +268,45 @@ def get_game_state(confidence: float = 0.85, minSearchTime: float = 0.0) -> str
     - accept2: ready to click the second accept button
     - loaded: the game is running
     - None: unknown state, or the game is not running
+
+    If confidence is not given, each template uses its calibrated threshold.
     """
     maximize_window()
-    images = get_images()
-    for state, image in images.items():
-        with suppress(pyscreeze.ImageNotFoundException, pyautogui.ImageNotFoundException):
-            loc = pyautogui.locateOnScreen(image, confidence=confidence, minSearchTime=minSearchTime, grayscale=True)
-            if loc:
+    deadline = time.monotonic() + minSearchTime
+    while True:
+        # Every template is checked against the same capture
+        screen = grab_screen()
+        thresholds = {state: confidence or get_confidence(state, const.STATE_CONFIDENCE) for state in get_images()}
+        scores = score_templates(screen, thresholds)
+        for state, threshold in thresholds.items():
+            if scores[state][0] >= threshold:
                 return state
-    return None
+        if time.monotonic() >= deadline:
+            return None
+        sleep(0.1)
 
 
-def check_for_state(state: str, confidence: float = 0.93, minSearchTime: float = 0.0) -> bool:
-    minimize_window("Microsoft Store")  # Minimize MS store if it's open
-    maximize_window("ARK: Survival Evolved")  # Make sure ark is maximized
-    image = get_images()[state]
-    loc = pyautogui.locateOnScreen(image, confidence=confidence, minSearchTime=minSearchTime, grayscale=True)
+@timed
+def check_for_state(state: str, confidence: float | None = None, minSearchTime: float = 0.0) -> bool:
+    minimize_window(windows.STORE)  # Minimize MS store if it's open
+    maximize_window(windows.ARK)  # Make sure ark is maximized
+    confidence = confidence or get_confidence(state, const.BUTTON_CONFIDENCE)
+    loc = locate(state, confidence, minSearchTime=minSearchTime)
     return True if loc else False
 
 
-def wait_for_state(state: str, timeout: int) -> bool:
+@timed
+def wait_for_state(state: str, timeout: int, until: t.Callable[[], bool] | None = None, poll: float = 5) -> bool:
+    """
+    Wait for a state to appear on screen, checking every poll seconds.
+
+    If until is given, it is checked every half second and the wait finishes as soon as it returns True,
+    e.g. when the server log says it has loaded.
+    """
     start = datetime.now()
     while (datetime.now() - start).total_seconds() < timeout:
+        if until and until():
+            return True
         if not is_running():
             log.warning("Cant wait for state if the server is not running")
             return False
@@ -188,30 +317,34 @@ def wait_for_state(state: str, timeout: int) -> bool:
             maximize_window()
         if check_for_state(state):
             return True
-        sleep(5)
+        for _ in range(max(1, round(poll / 0.5))):
+            if until and until():
+                return True
+            sleep(0.5)
     return False
 
 
+@timed
 def close_teamviewer():
     try:
-        handle = win32gui.FindWindow(None, "Sponsored session")
-        if not handle:
-            return
-        log.info("Closing TeamViewer...")
-        win32gui.PostMessage(handle, win32con.WM_CLOSE, 0, 0)
+        if windows.tracker.close(windows.TEAMVIEWER):
+            log.info("Closing TeamViewer...")
     except Exception as e:
         log.error("Failed to close TeamViewer window", exc_info=e)
 
 
+@timed
 def kill(process: str = "ShooterGame.exe") -> bool:
     with suppress(Exception):
         for proc in psutil.process_iter():
             if proc.name() == process:
                 proc.kill()
+                windows.tracker.invalidate()
                 return True
     return False
 
 
+@timed
 def is_running(process: str = "ShooterGame.exe") -> bool:
     for _ in range(3):
         try:
@@ -224,6 +357,7 @@ def is_running(process: str = "ShooterGame.exe") -> bool:
     return False
 
 
+@timed
 def wait_till_running(process: str = "ShooterGame.exe", timeout: int = 10) -> bool:
     now = datetime.now()
     while (datetime.now() - now).total_seconds() < timeout:
@@ -233,6 +367,7 @@ def wait_till_running(process: str = "ShooterGame.exe", timeout: int = 10) -> bo
     return False
 
 
+@timed
 def get_pid(process: str = "ShooterGame.exe") -> int:
     try:
         for proc in psutil.process_iter():
@@ -247,33 +382,16 @@ def get_positions() -> dict[str, tuple[float, float, float, float]]:
     return json.loads(const.POSITIONS_PATH.read_text())
 
 
-def minimize_window(app_name: str = "Microsoft Store") -> None:
-    """Minimize the window of the given app name."""
-    log.debug(f"Minimizing {app_name} window...")
-    handle = win32gui.FindWindow(None, app_name)
-    if not handle:
-        return
-    with suppress(Exception):
-        win32gui.ShowWindow(handle, win32con.SW_MINIMIZE)
+@timed
+def minimize_window(app_name: str = windows.STORE) -> None:
+    """Minimize the window of the given app name if it's open and not already minimized."""
+    windows.tracker.minimize(app_name)
 
 
-def maximize_window(app_name: str = "ARK: Survival Evolved") -> None:
-    """Maximize the window of the given app name and bring it to the front."""
-    log.debug(f"Maximizing {app_name} window...")
-    handle = win32gui.FindWindow(None, app_name)
-    if not handle:
-        return
-    with suppress(Exception):
-        win32gui.ShowWindow(handle, win32con.SW_MAXIMIZE)
-        bring_to_front()
-
-
-def bring_to_front(app_name: str = "ARK: Survival Evolved") -> None:
-    window = pywinauto.findwindows.find_window(title=app_name)
-    if window:
-        log.debug(f"Setting focus to {app_name} window: {window}")
-        app = Application().connect(handle=window)
-        app.top_window().set_focus()
+@timed
+def maximize_window(app_name: str = windows.ARK) -> None:
+    """Maximize the window of the given app name and bring it to the front, unless it already is."""
+    windows.tracker.maximize(app_name)
 
 
 def set_resolution(width: int = 1280, height: int = 720, default: bool = False):
@@ -297,6 +415,7 @@ def set_resolution(width: int = 1280, height: int = 720, default: bool = False):
     win32api.ChangeDisplaySettings(dev, 0)
 
 
+@timed
 def check_resolution():
     # Ensure current resolution is supported
     current = (pyautogui.size().width, pyautogui.size().height)
@@ -309,42 +428,33 @@ def check_resolution():
         log.info(f"Current resolution {current} is supported")
 
 
-def check_ms_store() -> Application | None:
-    """Check MS store for updates"""
-    # First kill the app if it's running
-    kill("WinStore.App.exe")
-    sleep(5)
-    # Launch the MS store
-    os.system(const.MS_BOOT_COMMAND)
-    sleep(8)
-    if not is_running("WinStore.App.exe"):
-        return
-    maximize_window("Microsoft Store")
-    try:
-        app = Application(backend="uia").connect(title="Microsoft Store")
-    except (ElementNotFoundError, COMError):
-        kill("WinStore.App.exe")
-        return
-
-    dlg = app.top_window()
+# (mtime, size) of the startup dll the last time its contents were confirmed
+_dll_verified: tuple[float, int] | None = None
 
-    with contextlib.suppress(ElementAmbiguousError, ElementNotFoundError):
-        library_button = dlg.window(auto_id="MyLibraryButton")
-        with contextlib.suppress(TimeoutError):
-            library_button.wait("ready", timeout=30)
-        library_button.click_input()
 
+@timed
+def ensure_dll() -> bool:
+    """Write the startup DLL to disk if it is missing or doesn't match the bundled copy, returns True if written."""
+    global _dll_verified
     try:
-        update_button = dlg.window(auto_id="CheckForUpdatesButton")
-        with contextlib.suppress(TimeoutError):
-            update_button.wait("ready", timeout=30)
-        update_button.click()
-    except (ElementAmbiguousError, ElementNotFoundError):
-        kill("WinStore.App.exe")
-        return
-    return app
+        stat = const.DLL_PATH.stat()
+    except FileNotFoundError:
+        stat = None
+    if stat and (stat.st_mtime, stat.st_size) == _dll_verified:
+        return False
+    if stat and stat.st_size == len(const.DLL_BYTES) and const.DLL_PATH.read_bytes() == const.DLL_BYTES:
+        _dll_verified = (stat.st_mtime, stat.st_size)
+        return False
+    log.info("Writing startup dll...")
+    const.DLL_PATH.parent.mkdir(parents=True, exist_ok=True)
+    const.DLL_PATH.write_bytes(const.DLL_BYTES)
+    const.DLL_PATH.chmod(0o777)
+    stat = const.DLL_PATH.stat()
+    _dll_verified = (stat.st_mtime, stat.st_size)
+    return True
 
 
+@timed
 def inject_dll(pid: int, dll_path: Path | str) -> bool:
     try:
         inject(pid, str(dll_path))
@@ -354,28 +464,125 @@ def inject_dll(pid: int, dll_path: Path | str) -> bool:
         return False
 
 
-def apply_permissions_to_dll(dll_path: Path | str) -> bool:
-    everyone, domain, type = win32security.LookupAccountName("", "ALL APPLICATION PACKAGES")
+@functools.cache
+def lookup_sid(account: str) -> pywintypes.SID:
+    """Account name lookups don't change while we're running, so only do each one once"""
+    return win32security.LookupAccountName("", account)[0]
+
+
+def has_ace(dll_path: Path | str, sid: pywintypes.SID, access: int) -> bool:
     sd = win32security.GetFileSecurity(str(dll_path), win32security.DACL_SECURITY_INFORMATION)
     dacl = sd.GetSecurityDescriptorDacl()
+    if dacl is None:
+        return False
+    for i in range(dacl.GetAceCount()):
+        (ace_type, _), ace_access, ace_sid = dacl.GetAce(i)
+        # Compare SIDs directly instead of looking up the account name of every entry
+        if ace_type == win32security.ACCESS_ALLOWED_ACE_TYPE and ace_sid == sid and ace_access & access == access:
+            return True
+    return False
+
 
-    dacl.AddAccessAllowedAce(win32con.ACL_REVISION, con.FILE_GENERIC_READ | con.FILE_GENERIC_EXECUTE, everyone)
+@timed
+def apply_permissions_to_dll(dll_path: Path | str) -> bool:
+    """Let the game's app container read and execute the dll, skipping the write if it already can"""
+    everyone = lookup_sid("ALL APPLICATION PACKAGES")
+    access = con.FILE_GENERIC_READ | con.FILE_GENERIC_EXECUTE
+    if has_ace(dll_path, everyone, access):
+        return True
+
+    sd = win32security.GetFileSecurity(str(dll_path), win32security.DACL_SECURITY_INFORMATION)
+    dacl = sd.GetSecurityDescriptorDacl()
+    dacl.AddAccessAllowedAce(win32con.ACL_REVISION, access, everyone)
     sd.SetSecurityDescriptorDacl(1, dacl, 0)
     win32security.SetFileSecurity(str(dll_path), win32security.DACL_SECURITY_INFORMATION, sd)
 
     # Confirm that the permissions were set correctly
-    sd = win32security.GetFileSecurity(str(dll_path), win32security.DACL_SECURITY_INFORMATION)
-    dacl = sd.GetSecurityDescriptorDacl()
+    return has_ace(dll_path, everyone, access)
 
-    for i in range(dacl.GetAceCount()):
-        rev, access, usersid = dacl.GetAce(i)
-        user, domain, type = win32security.LookupAccountSid(None, usersid)
-        if user == "ALL APPLICATION PACKAGES":
-            return True
 
-    return False
+LOCATE_TIMEOUT = 5  # Seconds to keep looking for a button before the first click, the menus animate in
+
+
+class ButtonNotFound(Exception):
+    pass
+
+
+def frame_changed(before: np.ndarray, after: np.ndarray, threshold: float = 8.0) -> bool:
+    """Whether two screen captures differ noticeably, compared at 1/8th scale to ignore noise"""
+    small_before = before[::8, ::8].astype(np.int16)
+    small_after = after[::8, ::8].astype(np.int16)
+    if small_before.shape != small_after.shape:
+        return True
+    return float(np.abs(small_before - small_after).mean()) > threshold
+
+
+def wait_until_stable(state: str, confidence: float, timeout: float = 3.0) -> pyscreeze.Box | None:
+    """Locate a button and wait until it stops moving, so we don't click it mid-animation"""
+    deadline = time.monotonic() + timeout
+    loc = locate(state, confidence)
+    while loc and time.monotonic() < deadline:
+        sleep(0.25)
+        again = locate(state, confidence)
+        if again == loc:
+            return loc
+        loc = again
+    return loc
+
+
+def click_until_transition(
+    button_name: str,
+    next_state: str | None,
+    double: bool = False,
+    retries: int = 4,
+) -> float | None:
+    """
+    Click a button and watch for the UI to move on, instead of sleeping a fixed amount of time.
 
+    The UI has transitioned once the next expected state shows up, or the button is gone and the screen changed.
+    Clicks are retried at growing intervals (0.5s, 1s, 2s, 4s...) until it does.
 
+    Returns the reaction time in seconds from the last click to the transition, or None if it never transitioned.
+    Raises ButtonNotFound if the button can't be found to click it in the first place.
+    """
+    confidence = get_confidence(button_name, const.BUTTON_CONFIDENCE)
+    next_confidence = get_confidence(next_state, const.BUTTON_CONFIDENCE) if next_state else 0.0
+    interval = 0.5
+    clicked: float | None = None
+    for attempt in range(retries + 1):
+        loc = wait_until_stable(button_name, confidence)
+        if not loc and clicked is None:
+            # Nothing has been clicked yet, the button is most likely still animating in
+            deadline = time.monotonic() + LOCATE_TIMEOUT
+            while not loc and time.monotonic() < deadline:
+                sleep(0.25)
+                loc = wait_until_stable(button_name, confidence)
+            if not loc:
+                raise ButtonNotFound(f"Failed to locate {button_name} button")
+        elif not loc:
+            # The button went away after the last click, so that click worked
+            return time.monotonic() - clicked
+        before = grab_screen()
+        x, y = pyautogui.center(loc)
+        if attempt:
+            log.warning(f"{button_name} button didn't respond, clicking again (attempt {attempt + 1})")
+        if double:
+            pyautogui.doubleClick(x, y)
+        else:
+            pyautogui.click(x, y)
+        clicked = time.monotonic()
+        while (waited := time.monotonic() - clicked) < interval:
+            sleep(0.1)
+            screen = grab_screen()
+            if next_state and locate(next_state, next_confidence, screen=screen):
+                return waited
+            if not locate(button_name, confidence, screen=screen) and frame_changed(before, screen):
+                return waited
+        interval *= 2
+    return None
+
+
+@timed
 def start_server() -> bool:
     log.info("Starting the server...")
     # If the app is already running we want to kill it
@@ -383,53 +590,49 @@ def start_server() -> bool:
         sleep(5)
     # Launch Ark
     os.system(const.BOOT_COMMAND)
-    sleep(5)
-    if not is_running():
+    if not wait_till_running(timeout=10):
         log.error("Failed to launch the Ark: Survival Evolved!")
         return False
+    # Button -> max seconds to wait for it to appear
     buttons = {
-        "start": (300, 12),
-        "host": (300, 5),
-        "run": (120, 2),
-        "accept1": (15, 1),
-        "accept2": (15, 1),
+        "start": 300,
+        "host": 300,
+        "run": 120,
+        "accept1": 15,
+        "accept2": 15,
     }
-    images = get_images()
-    for button_name, (min_search_time, wait_after_clicking) in buttons.items():
+    order = list(buttons)
+    for index, (button_name, min_search_time) in enumerate(buttons.items()):
         if not is_running():
             log.error(f"Server may have crashed while waiting for {button_name} button")
             return False
-        image = images[button_name]
         log.info(f"Waiting for {button_name} button to appear...")
         # Close teamviewer popup if it's open
         close_teamviewer()
         # Ensure the window is maximized
         maximize_window()
-        found = wait_for_state(button_name, min_search_time)
+        found = wait_for_state(button_name, min_search_time, poll=1)
         if not found:
             log.warning(f"Could not find {button_name} button")
             return False
-        loc = pyautogui.locateOnScreen(image, confidence=0.93, minSearchTime=1, grayscale=True)
-        if not loc:
-            log.error(f"Failed to locate {button_name} button")
-            return False
-        coords = pyautogui.center(loc)
         log.info(f"Clicking {button_name} button...")
-        sleep(wait_after_clicking / 2)
-        if button_name == "start":
-            pyautogui.doubleClick(coords[0], coords[1])
+        next_state = order[index + 1] if index + 1 < len(order) else None
+        try:
+            reaction = click_until_transition(button_name, next_state, double=button_name == "start")
+        except ButtonNotFound as e:
+            log.error(e)
+            return False
+        if reaction is None:
+            log.error(f"{button_name} button never responded to clicks")
+            metrics.incr(f"click_{button_name}_failures")
         else:
-            pyautogui.click(coords[0], coords[1])
-        sleep(wait_after_clicking)
-        # Check if the same button is still visible
-        if check_for_state(button_name):
-            # Try clicking again:
-            log.error(f"Failed to click {button_name} button, trying again...")
-            pyautogui.click(coords[0], coords[1])
-            sleep(wait_after_clicking)
+            log.info(f"{button_name} button responded in {reaction:.2f}s")
+            metrics.gauge(f"click_{button_name}_reaction_seconds", round(reaction, 3))
 
     return is_running()
 
 
 if __name__ == "__main__":
+    # Console only, logs.log belongs to the running handler
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
     start_server()
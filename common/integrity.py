@@ -0,0 +1,338 @@
+"""
+Check the save files before booting and roll back any that are corrupt.
+
+A crash in the middle of a world save can leave the map truncated or zero filled, and the server only
+finds out after a long load. Before each boot the map, player and tribe saves are checked against
+integrity.json, which keeps the size, mtime and hash of every file. Unchanged files reuse their cached
+result, changed ones are hashed in parallel from memory mapped reads (hashlib releases the GIL on large
+buffers, so threads are enough) and given a few cheap structural checks:
+
+- not empty, and the first page isn't all zeros (the game zero pads, so the tail can be)
+- the header version is sane (int16 for maps, int32 for profiles and tribes)
+- a map isn't less than half the size it was when it last checked out
+
+A corrupt file is moved aside as <name>.<timestamp>.corrupt and replaced with the newest copy that
+passes the same checks, either one of the game's own timestamped map backups or a backup snapshot.
+The file swapped in has to hash the same as the copy that passed, so a torn copy isn't booted into.
+The crash handler rolls maps back to a snapshot the same way, keeping the current map as
+<name>.<timestamp>.pre-restore since nothing says it's corrupt.
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import struct
+import tempfile
+import time
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+try:
+    from common import backup, const, metrics
+except ModuleNotFoundError:
+    import backup
+    import const
+    import metrics
+
+log = logging.getLogger("arkhandler.integrity")
+
+PAGE = 4096
+HASH_PIECE = 8 * 1024 * 1024  # Bytes hashed per update
+MIN_SIZE_RATIO = 0.5  # A map smaller than this fraction of its last good size was probably cut short
+MAX_VERSION = 64
+# The game's own map backups, e.g. TheIsland_27.03.2024_12.34.56.ark
+ARK_BACKUP_RE = re.compile(r"_\d{2}\.\d{2}\.\d{4}_\d{2}\.\d{2}\.\d{2}\.ark$", re.I)
+CORRUPT_SUFFIX = ".corrupt"
+PRE_RESTORE_SUFFIX = ".pre-restore"  # A map moved aside by a crash restore, nothing says it's corrupt
+
+
+class CorruptSave(Exception):
+    pass
+
+
+@dataclass
+class FileCheck:
+    rel: str
+    ok: bool
+    reason: str = ""
+    cached: bool = False
+    restored_from: str | None = None
+
+
+@dataclass
+class Result:
+    checks: list[FileCheck] = field(default_factory=list)
+    hashed_bytes: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def failed(self) -> list[FileCheck]:
+        """Files still corrupt after trying to roll them back"""
+        return [i for i in self.checks if not i.ok]
+
+    @property
+    def restored(self) -> list[FileCheck]:
+        return [i for i in self.checks if i.restored_from]
+
+
+def is_map(path: Path) -> bool:
+    return path.suffix.lower() == ".ark"
+
+
+def is_live_map(rel: str) -> bool:
+    """A map save rather than one of the game's own timestamped backups of it"""
+    return is_map(Path(rel)) and not ARK_BACKUP_RE.search(rel)
+
+
+def structure_problem(data: bytes | mmap.mmap, map_file: bool) -> str | None:
+    """Why the contents can't be a valid save, or None if they look fine"""
+    size = len(data)
+    if not size:
+        return "empty"
+    # Only the start, the game pads its saves so a zero tail is normal. A save cut short shows up as
+    # shrinking instead, see SaveVerifier.check.
+    if not any(data[:PAGE]):
+        return "starts with zeros"
+    if map_file:
+        if size < 2:
+            return "too short"
+        version = struct.unpack_from("<h", data, 0)[0]
+    else:
+        if size < 4:
+            return "too short"
+        version = struct.unpack_from("<i", data, 0)[0]
+    if not 0 < version <= MAX_VERSION:
+        return f"bad header version {version}"
+    return None
+
+
+def check_file(path: Path, map_file: bool) -> tuple[str, str | None]:
+    """Hash a file and check its structure, returns (hash, problem)"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return digest.hexdigest(), "empty"
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                for start in range(0, len(mm), HASH_PIECE):
+                    digest.update(view[start : start + HASH_PIECE])
+            return digest.hexdigest(), structure_problem(mm, map_file)
+
+
+class SaveVerifier:
+    def __init__(
+        self,
+        save_dir: Path = const.SAVE_PATH,
+        manifest_path: Path = const.INTEGRITY_PATH,
+        workers: int = max(1, min(4, os.cpu_count() or 1)),
+    ) -> None:
+        self.save_dir = save_dir
+        self.manifest_path = manifest_path
+        self.workers = workers
+        self.manifest: dict[str, dict] = {}
+        self.load()
+
+    def load(self) -> None:
+        if not self.manifest_path.exists():
+            return
+        try:
+            self.manifest = json.loads(self.manifest_path.read_text())
+        except (OSError, ValueError) as e:
+            log.warning(f"Rebuilding the save manifest, could not read {self.manifest_path}: {e}")
+
+    def save(self) -> None:
+        tmp = self.manifest_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.manifest, indent=2))
+        tmp.replace(self.manifest_path)
+
+    def files(self) -> list[Path]:
+        """Map, player and tribe saves, leaving out the cluster folder and the game's timestamped backups"""
+        if not self.save_dir.exists():
+            return []
+        files = []
+        for path in self.save_dir.rglob("*"):
+            if path.suffix.lower() not in backup.SAVE_SUFFIXES or ARK_BACKUP_RE.search(path.name):
+                continue
+            if path.is_relative_to(const.CLUSTER_PATH) or not path.is_file():
+                continue
+            files.append(path)
+        return files
+
+    def check(self, path: Path) -> tuple[FileCheck, int]:
+        """Check one file against the manifest, returns the result and how many bytes were hashed"""
+        rel = path.relative_to(self.save_dir).as_posix()
+        stat = path.stat()
+        entry = self.manifest.get(rel, {})
+        if entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            return FileCheck(rel, entry["ok"], entry.get("reason", ""), cached=True), 0
+
+        file_hash, problem = check_file(path, is_map(path))
+        good_size = entry.get("good_size", 0)
+        if not problem and is_map(path) and stat.st_size < good_size * MIN_SIZE_RATIO:
+            problem = f"shrank from {good_size} to {stat.st_size} bytes"
+        self.manifest[rel] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "hash": file_hash,
+            "ok": not problem,
+            "reason": problem or "",
+            "good_size": good_size if problem else stat.st_size,
+        }
+        return FileCheck(rel, not problem, problem or ""), stat.st_size
+
+    def candidates(self, path: Path) -> list[Path]:
+        """The game's own backups of a map, newest first"""
+        if not is_map(path):
+            return []
+        found = [
+            i
+            for i in path.parent.glob(f"{path.stem}_*")
+            if i.suffix.lower() in (".ark", ".bak") and i.is_file() and not i.name.endswith(CORRUPT_SUFFIX)
+        ]
+        return sorted(found, key=lambda i: i.stat().st_mtime, reverse=True)
+
+    def rollback(self, path: Path, rel: str) -> tuple[str, str] | None:
+        """Replace a corrupt file with the newest good copy, returns where it came from and its hash"""
+        for candidate in self.candidates(path):
+            try:
+                file_hash, problem = check_file(candidate, True)
+            except (OSError, ValueError) as e:
+                problem = str(e)
+            if problem:
+                log.info(f"Not rolling back to {candidate.name}: {problem}")
+                continue
+            self.replace(path, candidate)
+            return candidate.name, file_hash
+
+        bad = path.stat()
+        with tempfile.TemporaryDirectory() as tmp:
+            copies = self.snapshot_copies(rel, Path(tmp), backup.list_snapshots(), (bad.st_size, bad.st_mtime))
+            for name, restored, file_hash in copies:
+                self.replace(path, restored)
+                return f"snapshot {name}", file_hash
+        return None
+
+    @staticmethod
+    def snapshot_copies(
+        rel: str, tmp: Path, snapshots: list[Path], skip: tuple[int, float] | None = None
+    ) -> t.Iterator[tuple[str, Path, str]]:
+        """Copies of a file from the snapshots that pass the checks, newest first, as (snapshot, path, hash)"""
+        tried: set[tuple[str, ...]] = set()
+        for snapshot in reversed(snapshots):
+            entry = backup.load_snapshot(snapshot)["files"].get(str(Path(rel)))
+            if not entry or (entry["size"], entry["mtime"]) == skip:
+                continue
+            # Most snapshots share the same copy of a file that rarely changes
+            if tuple(entry["chunks"]) in tried:
+                continue
+            tried.add(tuple(entry["chunks"]))
+            restored = tmp / rel
+            try:
+                backup.restore(snapshot.stem, rel, tmp)
+                file_hash, problem = check_file(restored, is_map(restored))
+            except (OSError, ValueError) as e:
+                problem = str(e)
+            if problem:
+                log.info(f"Not rolling {rel} back to snapshot {snapshot.stem}: {problem}")
+                continue
+            yield snapshot.stem, restored, file_hash
+
+    def restore_maps(self, snapshot: Path) -> dict[str, str]:
+        """
+        Roll every map back to a snapshot, or the newest older one with a good copy, leaving player and tribe
+        saves alone. The current map is kept next to it. Returns the snapshot each map was restored from.
+        """
+        snapshots = [i for i in backup.list_snapshots() if i.name <= snapshot.name]
+        restored = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for rel in backup.load_snapshot(snapshot)["files"]:
+                if not is_live_map(rel):
+                    continue
+                path = self.save_dir / rel
+                for name, copy, good_hash in self.snapshot_copies(rel, Path(tmp), snapshots):
+                    aside = self.replace(path, copy, PRE_RESTORE_SUFFIX)
+                    if check_file(path, True)[0] == good_hash:
+                        restored[rel] = name
+                    else:
+                        log.error(f"{rel} doesn't match snapshot {name} after copying it over, putting it back")
+                        if aside:
+                            os.replace(aside, path)
+                    break
+                else:
+                    log.error(f"No good copy of {rel} in snapshot {snapshot.stem} or older")
+        return restored
+
+    @staticmethod
+    def replace(path: Path, source: Path, suffix: str = CORRUPT_SUFFIX) -> Path | None:
+        """Swap in a good copy, keeping the current one next to it, returns where the current one went"""
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        tmp = path.with_name(path.name + ".restoring")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(source, tmp)
+        aside = None
+        if path.exists():
+            aside = path.with_name(f"{path.name}.{stamp}{suffix}")
+            os.replace(path, aside)
+        os.replace(tmp, path)
+        return aside
+
+    def verify(self) -> Result:
+        """Check every save, rolling back the corrupt ones"""
+        start = time.perf_counter()
+        result = Result()
+        files = self.files()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="arkhandler-integrity") as pool:
+            futures = {path: pool.submit(self.check, path) for path in files}
+            for path, future in futures.items():
+                try:
+                    check, hashed = future.result()
+                except (OSError, ValueError) as e:
+                    # Files that can't be read are left for the server to deal with
+                    log.warning(f"Could not check {path}: {e}")
+                    continue
+                result.checks.append(check)
+                result.hashed_bytes += hashed
+
+        for check in result.checks:
+            if check.ok:
+                continue
+            path = self.save_dir / check.rel
+            log.error(f"Save {check.rel} is corrupt ({check.reason}), rolling back")
+            rolled_back = None
+            try:
+                rolled_back = self.rollback(path, check.rel)
+            except Exception as e:
+                log.error(f"Failed to roll back {check.rel}", exc_info=e)
+            if not rolled_back:
+                log.error(f"No good copy of {check.rel} to roll back to")
+                continue
+            check.restored_from, good_hash = rolled_back
+            metrics.incr("save_rollbacks")
+            self.manifest.pop(check.rel, None)
+            restored, _ = self.check(path)
+            check.ok = restored.ok
+            if not restored.ok:
+                check.reason = restored.reason
+            elif self.manifest[check.rel]["hash"] != good_hash:
+                check.ok = False
+                check.reason = f"doesn't match {check.restored_from} after copying it over"
+                self.manifest[check.rel].update(ok=False, reason=check.reason)
+            log.warning(f"Rolled {check.rel} back to {check.restored_from}")
+
+        self.save()
+        result.elapsed = time.perf_counter() - start
+        metrics.gauge("save_verify_seconds", round(result.elapsed, 3))
+        cached = sum(i.cached for i in result.checks)
+        log.info(
+            f"Verified {len(result.checks)} saves in {result.elapsed:.2f}s ({cached} unchanged, "
+            f"{round(result.hashed_bytes / 1024**2, 1)} MiB hashed), {len(result.restored)} rolled back, "
+            f"{len(result.failed)} still corrupt"
+        )
+        return result
@@ -1,6 +1,16 @@
+import atexit
+import copy
+import gzip
+import json
 import logging
+import os
+import queue
+import shutil
 import sys
-from logging.handlers import RotatingFileHandler
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
 
 import colorama
 import sentry_sdk
@@ -28,25 +38,127 @@ formats = {
 dt_fmt = "%Y-%m-%d %I:%M:%S %p"
 colorama.init(autoreset=True)
 
+LOG_FILE = "logs.log"
+JSON_LOG_FILE = "logs.jsonl"
+
+_listener: QueueListener | None = None
+
 
 class PrettyFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__()
+        # Build each level's formatter once rather than per record
+        self.formatters = {level: logging.Formatter(fmt=fmt, datefmt="%I:%M:%S %p") for level, fmt in formats.items()}
+
     def format(self, record):
-        log_fmt = formats[record.levelno]
-        formatter = logging.Formatter(fmt=log_fmt, datefmt="%I:%M:%S %p")
+        formatter = self.formatters.get(record.levelno, self.formatters[logging.INFO])
         return formatter.format(record)
 
 
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+    Queues records with their args merged into the message but the traceback kept apart in exc_text.
+
+    The stock prepare() appends the traceback to the message and drops exc_info, which leaves the JSON sink
+    nothing to put in its exc field. The listener's formatters still append exc_text to text output.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatter.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+class CompressedRotatingFileHandler(RotatingFileHandler):
+    """
+    Rotates when the file exceeds max_bytes or is older than max_age seconds.
+
+    Rotated files are gzipped, and any older than retention_days are deleted.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        max_bytes: int,
+        backup_count: int,
+        max_age: float = 0,
+        retention_days: float = 0,
+    ):
+        super().__init__(filename=filename, mode="a", encoding="utf-8", maxBytes=max_bytes, backupCount=backup_count)
+        self.max_age = max_age
+        self.retention_days = retention_days
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = self._compress
+        try:
+            self.opened_at = os.path.getctime(self.baseFilename)
+        except OSError:
+            self.opened_at = time.time()
+
+    @staticmethod
+    def _compress(source: str, dest: str) -> None:
+        with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+    def shouldRollover(self, record) -> bool:
+        if self.max_age and time.time() - self.opened_at >= self.max_age:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        self.opened_at = time.time()
+        self.prune()
+
+    def prune(self) -> None:
+        if not self.retention_days:
+            return
+        cutoff = time.time() - self.retention_days * 86400
+        base = Path(self.baseFilename)
+        for path in base.parent.glob(f"{base.name}.*.gz"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+
 def init_logging():
+    """Log through a queue so callers never wait on console or disk I/O."""
+    global _listener
+    if _listener is not None:
+        return
+
     stdout_handler = logging.StreamHandler()
     stdout_handler.setFormatter(PrettyFormatter())
     stdout_handler.setLevel(logging.DEBUG)
 
-    file_handler = RotatingFileHandler(
-        filename="logs.log",
-        mode="a",
-        encoding="utf-8",
-        maxBytes=1 * 1024 * 1024,  # 1 MiB
-        backupCount=0,  # No backup files
+    file_handler = CompressedRotatingFileHandler(
+        filename=LOG_FILE,
+        max_bytes=1 * 1024 * 1024,  # 1 MiB
+        backup_count=5,
     )
     file_formatter = logging.Formatter(
         fmt="[{asctime}] {levelname:<8} [{name}] {message}",
@@ -55,14 +167,66 @@ def init_logging():
     )
     file_handler.setFormatter(file_formatter)
 
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, stdout_handler, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    # The queue handler only merges args into the message, the listener's handlers do the formatting
+    queue_handler = RecordQueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))
+
     logging.basicConfig(
         level=logging.DEBUG,
         datefmt=dt_fmt,
-        handlers=[stdout_handler, file_handler],
+        handlers=[queue_handler],
     )
     logging.getLogger("apscheduler").setLevel(logging.ERROR)
 
 
+def configure_logging(
+    max_mb: float,
+    backups: int,
+    rotate_hours: float,
+    retention_days: float,
+    json_logs: bool,
+) -> None:
+    """Apply the user's rotation and retention settings, and optionally add the JSON lines sink."""
+    if _listener is None:
+        return
+    handlers = list(_listener.handlers)
+    for handler in handlers:
+        if isinstance(handler, CompressedRotatingFileHandler):
+            handler.maxBytes = int(max_mb * 1024 * 1024)
+            handler.backupCount = backups
+            handler.max_age = rotate_hours * 3600
+            handler.retention_days = retention_days
+    has_json = any(isinstance(h.formatter, JsonFormatter) for h in handlers)
+    if json_logs and not has_json:
+        json_handler = CompressedRotatingFileHandler(
+            filename=JSON_LOG_FILE,
+            max_bytes=int(max_mb * 1024 * 1024),
+            backup_count=backups,
+            max_age=rotate_hours * 3600,
+            retention_days=retention_days,
+        )
+        json_handler.setFormatter(JsonFormatter())
+        handlers.append(json_handler)
+    # The listener thread reads this tuple for every record, so swapping it is safe
+    _listener.handlers = tuple(handlers)
+
+
+def stop_logging() -> None:
+    """Flush anything still queued, then close the handlers."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
 def init_sentry(dsn: str, version: str) -> None:
     """Initializes Sentry SDK.
 
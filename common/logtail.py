@@ -0,0 +1,102 @@
+"""
+Stream the server's ShooterGame log and turn known lines into events.
+
+The tailer keeps its byte offset between polls so each poll only reads what was appended,
+and starts over from the top when the log is rotated or truncated.
+"""
+
+import logging
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+try:
+    from common import const
+except ModuleNotFoundError:
+    import const
+
+log = logging.getLogger("arkhandler.logtail")
+
+# Event name -> patterns that signal it
+PATTERNS: dict[str, list[re.Pattern]] = {
+    "loaded": [
+        re.compile(r"Full Startup: [\d.]+ seconds"),
+        re.compile(r"has successfully started!"),
+    ],
+    "listening": [
+        re.compile(r"Server listening|listening on port", re.IGNORECASE),
+    ],
+    "fatal": [
+        re.compile(r"Fatal error!"),
+        re.compile(r"=== Critical error: ==="),
+        re.compile(r"Assertion failed:"),
+        re.compile(r"Unhandled Exception:"),
+    ],
+}
+
+
+@dataclass
+class LogEvent:
+    name: str
+    line: str
+    time: datetime = field(default_factory=datetime.now)
+
+
+class LogTailer:
+    def __init__(self, path: Path = const.LOG_FILE_PATH, patterns: dict[str, list[re.Pattern]] = PATTERNS) -> None:
+        self.path = path
+        self.patterns = patterns
+        self.offset = 0
+        self.identity: tuple[int, int] | None = None  # (device, inode/file index) of the file being tailed
+        self.partial = b""  # A trailing line that hasn't been terminated yet
+        self.recent: deque[str] = deque(maxlen=50)  # Last lines read, for crash analysis
+
+    def seek_end(self) -> None:
+        """Skip anything already in the log"""
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            self.offset, self.identity = 0, None
+            return
+        self.offset = stat.st_size
+        self.identity = (stat.st_dev, stat.st_ino)
+        self.partial = b""
+
+    def read_lines(self) -> list[str]:
+        """Read any complete lines appended since the last poll"""
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return []
+        identity = (stat.st_dev, stat.st_ino)
+        if identity != self.identity or stat.st_size < self.offset:
+            # The log was rotated or truncated, start from the top of the new file
+            if self.identity is not None:
+                log.debug(f"{self.path.name} was rotated, reading from the start")
+            self.identity = identity
+            self.offset = 0
+            self.partial = b""
+        if stat.st_size == self.offset:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(stat.st_size - self.offset)
+        self.offset += len(data)
+        data = self.partial + data
+        lines = data.split(b"\n")
+        self.partial = lines.pop()
+        # The game writes the log as UTF-16 on some builds, strip the nulls rather than guessing
+        decoded = [line.replace(b"\x00", b"").decode("utf-8", errors="replace").rstrip("\r") for line in lines]
+        self.recent.extend(decoded)
+        return decoded
+
+    def poll(self) -> list[LogEvent]:
+        events = []
+        for line in self.read_lines():
+            for name, patterns in self.patterns.items():
+                if any(pattern.search(line) for pattern in patterns):
+                    events.append(LogEvent(name, line.strip()))
+                    break
+        return events
@@ -0,0 +1,163 @@
+"""
+Template matching modes, selectable per template in matching.json.
+
+- gray: plain grayscale normalized correlation, what pyautogui's confidence matching uses
+- masked: the same, but pixels marked black in the template's mask (e.g. animated parts) are ignored
+- edges: correlation of gradient magnitudes, tolerant to lighting and color shifts
+- Any mode can set "orb_fallback" to look for the template with ORB keypoints when the correlation falls short,
+  the region ORB finds is then scored with the mode's own correlation
+
+Every mode scores with normalized correlation from 0 to 1 so the same confidence thresholds apply.
+"""
+
+import json
+import logging
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+try:
+    from common import const
+except ModuleNotFoundError:
+    import const
+
+log = logging.getLogger("arkhandler.matching")
+
+MODES = ("gray", "masked", "edges")
+MIN_ORB_MATCHES = 8
+
+_settings: dict[str, dict] | None = None
+_masks: dict[str, np.ndarray | None] = {}
+_orb = None
+
+
+def settings() -> dict[str, dict]:
+    """Per template matching settings, the copy next to the config overrides the bundled one"""
+    global _settings
+    if _settings is None:
+        _settings = {}
+        for path in (const.IMAGE_PATH / "matching.json", const.ROOT_PATH / "matching.json"):
+            if path.exists():
+                try:
+                    for name, conf in json.loads(path.read_text()).items():
+                        _settings.setdefault(name, {}).update(conf)
+                except ValueError as e:
+                    log.error(f"Invalid matching settings in {path}", exc_info=e)
+    return _settings
+
+
+def get_mode(name: str) -> tuple[str, bool]:
+    """The matching mode and whether to fall back to ORB for a template"""
+    conf = settings().get(name, {})
+    mode = conf.get("mode", "gray")
+    if mode not in MODES:
+        log.warning(f"Unknown matching mode '{mode}' for {name}, using gray")
+        mode = "gray"
+    return mode, bool(conf.get("orb_fallback", False))
+
+
+def mask_paths(name: str, resolution: str) -> list[Path]:
+    """Where a template's mask can live, masks made by the calibrate command take priority over bundled ones"""
+    filename = f"{name}_mask.png"
+    return [const.MASK_PATH / resolution / filename, const.IMAGE_PATH / resolution / filename]
+
+
+def load_mask(name: str, resolution: str = const.RESOLUTION_DIR.name) -> np.ndarray | None:
+    """White pixels are matched, black pixels (e.g. animated parts of the template) are ignored"""
+    for path in mask_paths(name, resolution):
+        if path.exists():
+            return cv2.imdecode(np.fromfile(str(path), dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    return None
+
+
+def get_mask(name: str) -> np.ndarray | None:
+    if name not in _masks:
+        _masks[name] = load_mask(name)
+    return _masks[name]
+
+
+def gradients(image: np.ndarray) -> np.ndarray:
+    dx = cv2.Sobel(image, cv2.CV_32F, 1, 0, ksize=3)
+    dy = cv2.Sobel(image, cv2.CV_32F, 0, 1, ksize=3)
+    return cv2.magnitude(dx, dy)
+
+
+def correlate(
+    haystack: np.ndarray, needle: np.ndarray, mask: np.ndarray | None = None
+) -> tuple[float, tuple[int, int, int, int]]:
+    height, width = needle.shape[:2]
+    if haystack.shape[0] < height or haystack.shape[1] < width:
+        return 0.0, (0, 0, width, height)
+    result = cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED, mask=mask)
+    # Flat regions under a mask can divide by zero
+    result = np.nan_to_num(result, nan=0.0, posinf=0.0, neginf=0.0)
+    _, score, _, (left, top) = cv2.minMaxLoc(result)
+    return float(score), (left, top, width, height)
+
+
+def orb_locate(haystack: np.ndarray, needle: np.ndarray) -> np.ndarray | None:
+    """The homography placing the template in the haystack by keypoints, or None if it can't be placed"""
+    global _orb
+    if _orb is None:
+        _orb = cv2.ORB_create(nfeatures=1000)
+    kp1, des1 = _orb.detectAndCompute(needle, None)
+    kp2, des2 = _orb.detectAndCompute(haystack, None)
+    if des1 is None or des2 is None or len(kp1) < MIN_ORB_MATCHES:
+        return None
+    pairs = cv2.BFMatcher(cv2.NORM_HAMMING).knnMatch(des1, des2, k=2)
+    good = [p[0] for p in pairs if len(p) == 2 and p[0].distance < 0.75 * p[1].distance]
+    if len(good) < MIN_ORB_MATCHES:
+        return None
+    src = np.float32([kp1[m.queryIdx].pt for m in good]).reshape(-1, 1, 2)
+    dst = np.float32([kp2[m.trainIdx].pt for m in good]).reshape(-1, 1, 2)
+    homography, _ = cv2.findHomography(src, dst, cv2.RANSAC, 5.0)
+    return homography
+
+
+def orb_match(
+    haystack: np.ndarray, needle: np.ndarray, mask: np.ndarray | None = None, edges: bool = False
+) -> tuple[float, tuple[int, int, int, int]]:
+    """Find the template by keypoints, then score the region it lands on by correlation like the other modes"""
+    height, width = needle.shape[:2]
+    homography = orb_locate(haystack, needle)
+    if homography is None:
+        return 0.0, (0, 0, width, height)
+    corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]]).reshape(-1, 1, 2)
+    box = cv2.boundingRect(cv2.perspectiveTransform(corners, homography))
+    # Map the region back onto the template so the two line up pixel for pixel
+    aligned = cv2.warpPerspective(haystack, homography, (width, height), flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP)
+    if edges:
+        aligned, needle = gradients(aligned), gradients(needle)
+    score, _ = correlate(aligned, needle, mask)
+    return score, tuple(box)
+
+
+def match(
+    haystack: np.ndarray,
+    needle: np.ndarray,
+    name: str | None = None,
+    threshold: float | None = None,
+    mask: np.ndarray | None = None,
+) -> tuple[float, tuple[int, int, int, int]]:
+    """
+    Score the best match of a grayscale needle within a grayscale haystack using the template's mode.
+
+    The template's mask for the current resolution is used unless one is passed in.
+    Returns the score and the (left, top, width, height) box of the best match.
+    """
+    mode, orb_fallback = get_mode(name) if name else ("gray", False)
+    if mode != "gray" and mask is None and name:
+        mask = get_mask(name)
+    if mode == "masked":
+        score, box = correlate(haystack, needle, mask)
+    elif mode == "edges":
+        score, box = correlate(gradients(haystack), gradients(needle), mask)
+    else:
+        score, box = correlate(haystack, needle)
+
+    if orb_fallback and threshold is not None and score < threshold:
+        orb_score, orb_box = orb_match(haystack, needle, mask if mode != "gray" else None, mode == "edges")
+        if orb_score > score:
+            return orb_score, orb_box
+    return score, box
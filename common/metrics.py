@@ -0,0 +1,35 @@
+"""In-process counters and gauges for the handler, dumped on demand."""
+
+import threading
+import time
+
+_lock = threading.Lock()
+_counters: dict[str, float] = {}
+_gauges: dict[str, float] = {}
+_started = time.time()
+
+
+def incr(name: str, value: float = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def gauge(name: str, value: float) -> None:
+    with _lock:
+        _gauges[name] = value
+
+
+def gauge_max(name: str, value: float) -> None:
+    """Set a gauge only if the value is higher than what it currently holds."""
+    with _lock:
+        if value > _gauges.get(name, float("-inf")):
+            _gauges[name] = value
+
+
+def snapshot() -> dict[str, dict[str, float] | float]:
+    with _lock:
+        return {
+            "uptime": round(time.time() - _started, 1),
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+        }
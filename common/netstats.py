@@ -0,0 +1,200 @@
+"""
+Network telemetry for the host, to tell a saturated uplink apart from a lag spike on the server.
+
+The byte, error and drop counters of every adapter are sampled at a fixed cadence and turned into
+throughput and link utilization, keeping the last hour of samples per adapter in a ring buffer.
+Link speeds come from psutil and are cached, falling back to a (slow) WMI query only for adapters that
+don't report one. An alert is raised when an adapter stays over the utilization threshold for the
+alert window, or when its errors and drops over the window pass the error threshold.
+"""
+
+import logging
+import re
+import time
+import typing as t
+from collections import deque
+from dataclasses import asdict, dataclass
+
+import psutil
+
+try:
+    from common import metrics
+except ModuleNotFoundError:
+    import metrics
+
+log = logging.getLogger("arkhandler.netstats")
+
+SAMPLE_SECONDS = 5
+HISTORY = 720  # Samples kept per adapter, an hour at the default cadence
+LINK_SPEED_TTL = 600  # Seconds before link speeds are looked up again
+IGNORED = re.compile(r"loopback|^lo\d*$|pseudo|isatap|teredo", re.I)
+
+
+@dataclass
+class Sample:
+    time: float
+    sent_mbps: float
+    recv_mbps: float
+    utilization: float  # Busiest direction as a fraction of the link speed, 0 if the speed is unknown
+    errors: int  # Errors and drops since the last sample
+
+
+class LinkSpeeds:
+    """Adapter link speeds in Mbps, looked up at most once per ttl"""
+
+    def __init__(
+        self,
+        fallback: t.Callable[[], t.Iterable[tuple[str, float]]] | None = None,
+        ttl: float = LINK_SPEED_TTL,
+    ) -> None:
+        self.fallback = fallback
+        self.ttl = ttl
+        self.speeds: dict[str, float] = {}
+        self.checked = 0.0
+
+    def get(self) -> dict[str, float]:
+        if self.speeds and time.monotonic() - self.checked < self.ttl:
+            return self.speeds
+        self.checked = time.monotonic()
+        speeds = {nic: float(stats.speed) for nic, stats in psutil.net_if_stats().items() if stats.isup}
+        if self.fallback and any(not speed for speed in speeds.values()):
+            try:
+                for nic, speed in self.fallback():
+                    if nic in speeds and not speeds[nic]:
+                        speeds[nic] = float(speed)
+            except Exception as e:
+                log.warning(f"Link speed fallback failed: {e}")
+        self.speeds = speeds
+        return speeds
+
+
+class NetSampler:
+    def __init__(
+        self,
+        link_speeds: LinkSpeeds,
+        utilization_threshold: float = 0.8,
+        alert_seconds: float = 120,
+        error_threshold: int = 100,
+        history: int = HISTORY,
+    ) -> None:
+        self.link_speeds = link_speeds
+        self.utilization_threshold = utilization_threshold
+        self.alert_seconds = alert_seconds
+        self.error_threshold = error_threshold
+        self.history = history
+        self.samples: dict[str, deque[Sample]] = {}
+        self.last: tuple[float, dict] | None = None
+        self.busy_since: dict[str, float] = {}
+        self.alerting: set[tuple[str, str]] = set()  # (adapter, kind) alerts that haven't cleared yet
+
+    @property
+    def window(self) -> str:
+        if self.alert_seconds < 120:
+            return f"{self.alert_seconds:.0f} seconds"
+        return f"{self.alert_seconds / 60:.0f} minutes"
+
+    def sample(self) -> list[str]:
+        """Take a sample of every adapter, returns any new or cleared alerts"""
+        now = time.monotonic()
+        counters = psutil.net_io_counters(pernic=True)
+        previous = self.last
+        self.last = (now, counters)
+        if not previous:
+            return []
+        elapsed = now - previous[0]
+        if elapsed <= 0:
+            return []
+
+        speeds = self.link_speeds.get()
+        messages = []
+        for nic, current in counters.items():
+            before = previous[1].get(nic)
+            if before is None or IGNORED.search(nic) or nic not in speeds:
+                continue
+            sent = current.bytes_sent - before.bytes_sent
+            recv = current.bytes_recv - before.bytes_recv
+            if sent < 0 or recv < 0:
+                # Counters reset, e.g. the adapter was reconnected
+                continue
+            errors = sum(
+                max(0, getattr(current, i) - getattr(before, i)) for i in ("errin", "errout", "dropin", "dropout")
+            )
+            sent_mbps = sent * 8 / elapsed / 1e6
+            recv_mbps = recv * 8 / elapsed / 1e6
+            speed = speeds[nic]
+            utilization = max(sent_mbps, recv_mbps) / speed if speed else 0.0
+            sample = Sample(now, round(sent_mbps, 3), round(recv_mbps, 3), round(utilization, 4), errors)
+            self.samples.setdefault(nic, deque(maxlen=self.history)).append(sample)
+
+            name = metric_name(nic)
+            metrics.gauge(f"net_{name}_sent_mbps", sample.sent_mbps)
+            metrics.gauge(f"net_{name}_recv_mbps", sample.recv_mbps)
+            metrics.gauge(f"net_{name}_utilization", sample.utilization)
+            if errors:
+                metrics.incr(f"net_{name}_errors", errors)
+            messages.extend(self.check_alerts(nic, sample))
+        return messages
+
+    def check_alerts(self, nic: str, sample: Sample) -> list[str]:
+        messages = []
+        if sample.utilization >= self.utilization_threshold:
+            self.busy_since.setdefault(nic, sample.time)
+        else:
+            self.busy_since.pop(nic, None)
+        busy = nic in self.busy_since and sample.time - self.busy_since[nic] >= self.alert_seconds
+        messages.extend(
+            self.update_alert(
+                nic,
+                "utilization",
+                busy,
+                f"{nic} has been over {self.utilization_threshold:.0%} of its link speed for "
+                f"{self.window} ({sample.sent_mbps} Mbps up, {sample.recv_mbps} Mbps down)",
+            )
+        )
+
+        window = [i for i in self.samples[nic] if sample.time - i.time < self.alert_seconds]
+        errors = sum(i.errors for i in window)
+        messages.extend(
+            self.update_alert(
+                nic,
+                "errors",
+                bool(self.error_threshold) and errors >= self.error_threshold,
+                f"{nic} had {errors} errors and dropped packets in the last {self.window}",
+            )
+        )
+        return messages
+
+    def update_alert(self, nic: str, kind: str, active: bool, message: str) -> list[str]:
+        key = (nic, kind)
+        if active and key not in self.alerting:
+            self.alerting.add(key)
+            metrics.incr("net_alerts")
+            log.warning(message)
+            return [message]
+        if not active and key in self.alerting:
+            self.alerting.discard(key)
+            message = f"{nic} {kind} back to normal"
+            log.info(message)
+            return [message]
+        return []
+
+    def latest(self) -> dict[str, Sample]:
+        return {nic: samples[-1] for nic, samples in self.samples.items() if samples}
+
+    def summary(self) -> dict[str, dict]:
+        """Latest sample, link speed and peak utilization over the history of each adapter"""
+        speeds = self.link_speeds.speeds
+        return {
+            nic: {
+                **asdict(samples[-1]),
+                "link_mbps": speeds.get(nic, 0.0),
+                "peak_utilization": max(i.utilization for i in samples),
+                "alerts": sorted(kind for name, kind in self.alerting if name == nic),
+            }
+            for nic, samples in self.samples.items()
+            if samples
+        }
+
+
+def metric_name(nic: str) -> str:
+    return re.sub(r"\W+", "_", nic).strip("_").lower()
@@ -1,16 +1,141 @@
+import argparse
+import queue
+import threading
+import time
 import tkinter as tk
+from dataclasses import dataclass
+from pathlib import Path
 
-import pyautogui
-import win32gui
+import numpy as np
 
 try:
-    from common import helpers
+    from common import cadence, const, helpers, windows
 except ModuleNotFoundError:
+    import cadence
+    import const
     import helpers
+    import windows
+
+
+@dataclass
+class Match:
+    score: float
+    threshold: float
+    box: tuple[int, int, int, int]  # left, top, width, height in screen coordinates
+
+    @property
+    def found(self) -> bool:
+        return self.score >= self.threshold
+
+
+@dataclass
+class Frame:
+    rect: tuple[int, int, int, int] | None  # Game window rect
+    matches: dict[str, Match]
+    positions: dict[str, tuple[float, float, float, float]]  # Button positions the matches were made with
+    latency: float  # Seconds to capture and match everything
+
+
+class Templates:
+    """
+    Button positions and templates, only reloaded when their files change.
+
+    Refreshed by the match worker so the Tk thread never touches the disk.
+    """
+
+    def __init__(self) -> None:
+        self.images: dict[str, np.ndarray] = {}
+        self.positions: dict[str, tuple[float, float, float, float]] = {}
+        self.mtimes: dict[Path, float | None] = {}
+
+    def changed(self, path: Path) -> bool:
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if path in self.mtimes and self.mtimes[path] == mtime:
+            return False
+        self.mtimes[path] = mtime
+        return True
+
+    def refresh(self) -> None:
+        if self.changed(const.POSITIONS_PATH):
+            try:
+                # Replaced rather than updated, frames already handed to Tk keep the old dict
+                self.positions = helpers.get_positions()
+            except FileNotFoundError:
+                self.positions = {}
+            except ValueError:
+                # Caught mid-save, keep the old positions until the next write
+                pass
+
+        images = dict(self.images)
+        for name in const.IMAGE_BYTES or {}:
+            path = const.RESOLUTION_DIR / f"{name}.PNG"
+            if not self.changed(path):
+                continue
+            try:
+                image = helpers.decode_image(path.read_bytes())
+            except FileNotFoundError:
+                image = None
+            if image is None:
+                images.pop(name, None)
+            else:
+                images[name] = image
+        self.images = images
+
+
+def get_window_rect() -> tuple[int, int, int, int] | None:
+    return windows.tracker.rect(windows.ARK)
+
+
+class MatchWorker(threading.Thread):
+    """
+    Captures the screen once per cycle and matches every template against that single capture.
+
+    Runs at the requested rate while the matches are changing, slowing down when they settle
+    or the game window is closed.
+    """
+
+    def __init__(self, templates: Templates, rate: float) -> None:
+        super().__init__(name="overlay-matcher", daemon=True)
+        self.templates = templates
+        interval = 1 / rate
+        loops = {"overlay": {"stable": interval, "booting": interval, "down": interval * 4, "outage": interval}}
+        self.cadence = cadence.Cadence(loops, min_scale=1.0, settle_minutes=1)
+        self.found: set[str] = set()
+        self.results: queue.Queue[Frame] = queue.Queue(maxsize=1)
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            start = time.perf_counter()
+            self.templates.refresh()
+            rect = get_window_rect()
+            matches = {}
+            if rect:
+                screen = helpers.grab_screen()
+                for name, image in self.templates.images.items():
+                    threshold = helpers.get_confidence(name, const.STATE_CONFIDENCE)
+                    score, box = helpers.match_template(screen, image, name, threshold)
+                    matches[name] = Match(score, threshold, box)
+            frame = Frame(rect, matches, self.templates.positions, time.perf_counter() - start)
+            found = {name for name, match in matches.items() if match.found}
+            if found != self.found:
+                self.found = found
+                self.cadence.event()
+            self.cadence.set_state("stable" if rect else "down")
+            # Only the newest result matters, drop any the UI hasn't picked up yet
+            try:
+                self.results.get_nowait()
+            except queue.Empty:
+                pass
+            self.results.put(frame)
+            self.stopped.wait(max(0.0, self.cadence.interval("overlay") - frame.latency))
 
 
 class OverlayApp:
-    def __init__(self):
+    def __init__(self, rate: float = 2.0):
         self.game_state = "start"  # start, host, run, accept1, accept2
         self.root: tk.Tk = tk.Tk()
         self.canvas = tk.Canvas(self.root, bg="white", highlightthickness=0)
@@ -19,109 +144,113 @@ class OverlayApp:
         self.root.wm_attributes("-transparentcolor", "white")
         self.root.wm_attributes("-topmost", True)
         self.root.overrideredirect(True)
+
+        self.templates = Templates()
+        self.worker = MatchWorker(self.templates, rate)
+        self.rect: tuple[int, int, int, int] | None = None
+        self.drawn: dict[str, tuple] = {}  # What is currently drawn for each template
         self.update_overlay()
 
     def start(self):
-        self.root.mainloop()
+        self.worker.start()
+        try:
+            self.root.mainloop()
+        finally:
+            self.worker.stopped.set()
 
     def update_overlay(self):
-        handle = win32gui.FindWindow(None, "ARK: Survival Evolved")
         try:
-            rect = win32gui.GetWindowRect(handle)
-        except Exception as e:
-            if "Invalid window handle" in str(e):
-                rect = None
-        if rect:
-            # Unpack the window's position and size
-            # x, y, x1, y1
-            # left, top, right, bottom
-            left, top, right, bottom = rect
-            width = right - left
-            height = bottom - top
-
-            game_aspect_ratio = 16 / 9
-            window_aspect_ratio = width / height
-            if window_aspect_ratio > game_aspect_ratio:
-                # Window is too wide, black bars will be on the sides
-                inner_height = height
-                inner_width = int(inner_height * game_aspect_ratio)
-            else:
-                # Window is too tall, black bars will be on the top/bottom
-                inner_width = width
-                inner_height = int(inner_width / game_aspect_ratio)
+            frame = self.worker.results.get_nowait()
+        except queue.Empty:
+            frame = None
+        if frame:
+            self.draw(frame)
+        # Only picking up results here, the matching happens in the worker
+        self.root.after(50, self.update_overlay)
 
-            # Calculate offsets for black bars if present
-            offset_x = (width - inner_width) // 2
-            offset_y = (height - inner_height) // 2
-
-            # Resize and move the overlay window to match the game window
-            self.root.geometry(f"{width}x{height}+{left}+{top}")
-            # Clear the canvas and draw a red rectangle
+    def draw(self, frame: Frame):
+        if frame.rect != self.rect:
+            self.rect = frame.rect
+            # Everything needs redrawing when the window moves
             self.canvas.delete("all")
-            # Draw the main window border
-            # self.canvas.create_rectangle(10, 3, width - 10, height - 10, outline="red", width=5)
-            # Draw each of the button outlines
-            positions = helpers.get_positions()
-            images = helpers.get_images()
-            for button_name, (x_ratio, y_ratio, w_ratio, h_ratio) in positions.items():
-                # if self.game_state in positions and button_name != self.game_state:
-                #     continue
-                # X and Y ratio represent the center of the button as a percentage of the game window
-                # W and H ratio represent the width and height of the button relative to the game window as a percentage
-                # If the window is out of perfect 16:9 aspect ratio, the game UI will have black bars on the sides or top and bottom
-
-                # If window is wider than 16:9, there will be black bars on the sides
-                # If window is taller than 16:9, there will be black bars on the top and bottom
-                # Calculate button dimensions based on its ratios and inner dimensions
-                button_x = int(offset_x + (inner_width * x_ratio)) - (w_ratio * inner_width) // 2
-                button_y = int(offset_y + (inner_height * y_ratio)) - (h_ratio * inner_height) // 2
+            self.drawn.clear()
+        if not self.rect:
+            return
+
+        # Unpack the window's position and size
+        # x, y, x1, y1
+        # left, top, right, bottom
+        left, top, right, bottom = self.rect
+        width = right - left
+        height = bottom - top
+        self.root.geometry(f"{width}x{height}+{left}+{top}")
+
+        game_aspect_ratio = 16 / 9
+        window_aspect_ratio = width / height
+        if window_aspect_ratio > game_aspect_ratio:
+            # Window is too wide, black bars will be on the sides
+            inner_height = height
+            inner_width = int(inner_height * game_aspect_ratio)
+        else:
+            # Window is too tall, black bars will be on the top/bottom
+            inner_width = width
+            inner_height = int(inner_width / game_aspect_ratio)
+
+        # Calculate offsets for black bars if present
+        offset_x = (width - inner_width) // 2
+        offset_y = (height - inner_height) // 2
+
+        # Buttons taken out of positions.json, or whose template went away
+        for button_name in [i for i in self.drawn if i not in frame.positions or i not in frame.matches]:
+            del self.drawn[button_name]
+            self.canvas.delete(button_name)
+
+        for button_name, (x_ratio, y_ratio, w_ratio, h_ratio) in frame.positions.items():
+            match = frame.matches.get(button_name)
+            if not match:
+                continue
+            # X and Y ratio represent the center of the button as a percentage of the game window
+            # W and H ratio represent the width and height of the button relative to the game window as a percentage
+            if match.found:
+                box = (match.box[0] - left, match.box[1] - top, match.box[2], match.box[3])
+                color = "green"
+            else:
                 button_width = int(inner_width * w_ratio)
                 button_height = int(inner_height * h_ratio)
+                button_x = int(offset_x + (inner_width * x_ratio)) - button_width // 2
+                button_y = int(offset_y + (inner_height * y_ratio)) - button_height // 2
+                box = (button_x, button_y, button_width, button_height)
+                color = "red"
+            state = (box, color, round(match.score, 2), match.threshold)
+            if self.drawn.get(button_name) == state:
+                continue
+            self.drawn[button_name] = state
+            self.canvas.delete(button_name)
+
+            x, y, w, h = box
+            self.canvas.create_rectangle(x, y, x + w, y + h, outline=color, width=2, tags=button_name)
+            # draw a circle on the center of the button
+            cx, cy = x + w // 2, y + h // 2
+            self.canvas.create_oval(cx - 5, cy - 5, cx + 5, cy + 5, fill=color, tags=button_name)
+            label = f"{button_name} {match.score:.2f}/{match.threshold:.2f}"
+            self.canvas.create_text(x, y - 4, text=label, anchor="sw", fill=color, tags=button_name)
 
-                loc = pyautogui.locateOnScreen(images[button_name], confidence=0.85, grayscale=True)
-                if loc:
-                    print(f"{button_name}: {loc}")
-                    self.canvas.create_rectangle(
-                        loc.left,
-                        loc.top,
-                        loc.left + loc.width,
-                        loc.top + loc.height,
-                        outline="green",
-                        width=2,
-                    )
-                    center = pyautogui.center(loc)
-                    # draw a circle on the center of the button
-                    self.canvas.create_oval(
-                        center.x - 5,
-                        center.y - 5,
-                        center.x + 5,
-                        center.y + 5,
-                        fill="green",
-                    )
-                else:
-                    self.canvas.create_rectangle(
-                        button_x,
-                        button_y,
-                        button_x + button_width,
-                        button_y + button_height,
-                        outline="red",
-                        width=2,
-                    )
-                    # draw a circle on the center of the button
-                    self.canvas.create_oval(
-                        button_x + button_width // 2 - 5,
-                        button_y + button_height // 2 - 5,
-                        button_x + button_width // 2 + 5,
-                        button_y + button_height // 2 + 5,
-                        fill="red",
-                    )
-
-        # Schedule the overlay to be updated again after 100ms
-        self.root.after(100, self.update_overlay)
+        self.canvas.delete("latency")
+        self.canvas.create_text(
+            10,
+            10,
+            text=f"match {frame.latency * 1000:.0f}ms",
+            anchor="nw",
+            fill="yellow",
+            tags="latency",
+        )
 
 
 def main():
-    app = OverlayApp()
+    parser = argparse.ArgumentParser(description="Show where ArkHandler sees each button")
+    parser.add_argument("--rate", type=float, default=2.0, help="Matching passes per second")
+    args = parser.parse_args()
+    app = OverlayApp(rate=args.rate)
     app.start()
 
 
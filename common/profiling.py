@@ -0,0 +1,184 @@
+"""
+On-demand profiling for the hot helpers.
+
+- Timing: helpers wrapped with @timed record call count, total and max duration while profiling is enabled
+- Sampling: sample_to_file() samples every thread's stack for N seconds and writes folded stacks
+  (compatible with flamegraph.pl and speedscope) next to logs.log
+
+When profiling is disabled a wrapped call costs a single global lookup.
+"""
+
+import asyncio
+import functools
+import logging
+import signal
+import sys
+import threading
+import time
+import typing as t
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+try:
+    from common import logger
+except ModuleNotFoundError:
+    import logger
+
+log = logging.getLogger("arkhandler.profiling")
+
+enabled = False
+_lock = threading.Lock()
+_stats: dict[str, list[float]] = {}  # name -> [count, total seconds, max seconds]
+_sampling = threading.Event()
+
+
+def set_enabled(value: bool) -> None:
+    global enabled
+    if value == enabled:
+        return
+    enabled = value
+    log.info(f"Profiling {'enabled' if value else 'disabled'}")
+
+
+def _record(name: str, elapsed: float) -> None:
+    with _lock:
+        stat = _stats.setdefault(name, [0, 0.0, 0.0])
+        stat[0] += 1
+        stat[1] += elapsed
+        stat[2] = max(stat[2], elapsed)
+
+
+def timed(func: t.Callable | None = None, *, name: str | None = None) -> t.Callable:
+    """Record the duration of each call to the wrapped function while profiling is enabled."""
+    if func is None:
+        return functools.partial(timed, name=name)
+    label = name or func.__name__
+
+    if asyncio.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if not enabled:
+                return await func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _record(label, time.perf_counter() - start)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _record(label, time.perf_counter() - start)
+
+    return wrapper
+
+
+def summary() -> dict[str, dict[str, float]]:
+    with _lock:
+        return {
+            name: {
+                "calls": int(count),
+                "total": round(total, 4),
+                "avg": round(total / count, 4) if count else 0.0,
+                "max": round(longest, 4),
+            }
+            for name, (count, total, longest) in sorted(_stats.items(), key=lambda i: i[1][1], reverse=True)
+        }
+
+
+def log_summary() -> None:
+    stats = summary()
+    if not stats:
+        return
+    lines = [
+        f"{name}: {i['calls']} calls, {i['total']}s total, {i['avg']}s avg, {i['max']}s max"
+        for name, i in stats.items()
+    ]
+    log.info("Helper timings:\n" + "\n".join(lines))
+
+
+def reset() -> None:
+    with _lock:
+        _stats.clear()
+
+
+def output_dir() -> Path:
+    """The folder logs.log is written to."""
+    return Path(logger.LOG_FILE).resolve().parent
+
+
+def _folded_stack(frame, thread_name: str) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{Path(code.co_filename).stem}:{code.co_name}")
+        frame = frame.f_back
+    stack.append(thread_name)
+    return ";".join(reversed(stack))
+
+
+def sample(seconds: float, interval: float = 0.005) -> Counter:
+    """Sample the stacks of every other thread for the given number of seconds."""
+    samples: Counter = Counter()
+    me = threading.get_ident()
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            samples[_folded_stack(frame, names.get(ident, str(ident)))] += 1
+        time.sleep(interval)
+    return samples
+
+
+def sample_to_file(seconds: float) -> Path | None:
+    """Run a sampling profile and write it as folded stacks, returns the file path."""
+    if _sampling.is_set():
+        log.warning("A sampling profile is already running")
+        return None
+    _sampling.set()
+    try:
+        log.info(f"Sampling profile for {seconds} seconds...")
+        samples = sample(seconds)
+        path = output_dir() / f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded"
+        path.write_text("\n".join(f"{stack} {count}" for stack, count in samples.most_common()))
+        log.info(f"Saved sampling profile to {path}")
+        return path
+    finally:
+        _sampling.clear()
+
+
+def start_sampling(seconds: float) -> None:
+    """Run a sampling profile in the background."""
+    threading.Thread(target=sample_to_file, args=(seconds,), name="arkhandler-profiler", daemon=True).start()
+
+
+def install_signal_handler(seconds: float) -> None:
+    """
+    Toggle profiling with CTRL+Break on Windows (SIGUSR1 elsewhere).
+
+    Turning it on also starts a sampling profile, turning it off logs the collected timings.
+    """
+    signum = getattr(signal, "SIGBREAK", None) or getattr(signal, "SIGUSR1", None)
+    if signum is None:
+        return
+
+    def _handler(*_):
+        if enabled:
+            log_summary()
+            set_enabled(False)
+        else:
+            set_enabled(True)
+            start_sampling(seconds)
+
+    signal.signal(signum, _handler)
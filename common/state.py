@@ -0,0 +1,125 @@
+"""
+Checkpoint the handler's supervisor state to disk so a restarted handler can pick up where it left off.
+
+The checkpoint is small and rewritten atomically whenever it changes, on a writer thread of its own so the
+fsync never holds up the event loop. On startup the server process is re-adopted only if its pid and
+creation time both match, since pids get reused.
+"""
+
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+
+import psutil
+
+try:
+    from common import const
+except ModuleNotFoundError:
+    import const
+
+log = logging.getLogger("arkhandler.state")
+
+# Boot phases in the order they happen
+PHASES = ("preparing", "launching", "injecting", "loading")
+
+
+@dataclass
+class Checkpoint:
+    running: bool = False
+    booting: bool = False
+    boot_phase: str = ""  # One of PHASES while booting
+    phase_started: datetime | None = None
+    connected: bool = True
+    last_connected: datetime | None = None  # Only kept while the internet is down
+    pid: int = 0
+    create_time: float = 0.0  # Process creation time, so a reused pid isn't mistaken for the server
+    hold_reason: str = ""  # Reboots on hold, so a restarted handler doesn't reboot into the same crash
+    hold_until: datetime | None = None  # None holds until resumed
+
+    def to_json(self) -> dict:
+        data = asdict(self)
+        for key in ("phase_started", "last_connected", "hold_until"):
+            if data[key]:
+                data[key] = data[key].isoformat()
+        return data
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Checkpoint":
+        for key in ("phase_started", "last_connected", "hold_until"):
+            if data.get(key):
+                data[key] = datetime.fromisoformat(data[key])
+        return cls(**{k: v for k, v in data.items() if k in cls.__dataclass_fields__})
+
+
+class StateStore:
+    def __init__(self, path: Path = const.STATE_PATH) -> None:
+        self.path = path
+        self.last_saved: dict | None = None  # Last checkpoint written or queued to be
+        self.lock = threading.Lock()
+        # One worker so checkpoints land in the order they were taken
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="arkhandler-state")
+
+    def load(self) -> Checkpoint | None:
+        if not self.path.exists():
+            return None
+        try:
+            checkpoint = Checkpoint.from_json(json.loads(self.path.read_text()))
+        except (OSError, ValueError, TypeError) as e:
+            log.warning(f"Ignoring unreadable state checkpoint {self.path}: {e}")
+            return None
+        with self.lock:
+            self.last_saved = checkpoint.to_json()
+        return checkpoint
+
+    def save(self, checkpoint: Checkpoint) -> bool:
+        """Queue the checkpoint to be written if it changed, returns True if it changed"""
+        data = checkpoint.to_json()
+        with self.lock:
+            if data == self.last_saved:
+                return False
+            self.last_saved = data
+        self.writer.submit(self.write, data)
+        return True
+
+    def write(self, data: dict) -> None:
+        tmp = self.path.with_suffix(".tmp")
+        try:
+            with tmp.open("w") as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log.error(f"Failed to save state checkpoint to {self.path}", exc_info=e)
+            with self.lock:
+                # Try again with the next checkpoint, even if nothing changed
+                if self.last_saved is data:
+                    self.last_saved = None
+
+
+def process_identity(pid: int) -> tuple[int, float] | None:
+    """The pid and creation time of a process, or None if it's gone"""
+    if not pid:
+        return None
+    try:
+        return pid, psutil.Process(pid).create_time()
+    except psutil.Error:
+        return None
+
+
+def adopt(checkpoint: Checkpoint, process: str = "ShooterGame.exe") -> psutil.Process | None:
+    """The server process from the checkpoint if it is still the same process"""
+    if not checkpoint.pid:
+        return None
+    try:
+        proc = psutil.Process(checkpoint.pid)
+        if proc.name() != process or abs(proc.create_time() - checkpoint.create_time) > 1:
+            return None
+        return proc
+    except psutil.Error:
+        return None
@@ -2,14 +2,36 @@ import asyncio
 import logging
 import os
 import sys
+import threading
 from datetime import datetime, timedelta
 from itertools import cycle
-from subprocess import DEVNULL, call
+from pathlib import Path
 from time import sleep
 
 from colorama import Fore, Style
 
-from common import const, helpers, logger, version
+from common import (
+    a2s,
+    backup,
+    bootprep,
+    cadence,
+    clustersync,
+    const,
+    control,
+    crashes,
+    executor,
+    helpers,
+    integrity,
+    logger,
+    logtail,
+    metrics,
+    netstats,
+    profiling,
+    state,
+    updates,
+    version,
+    vision,
+)
 from common.config import Conf
 from common.scheduler import scheduler
 
@@ -21,6 +43,12 @@ class ArkHandler:
     Task Loops:
     - Watchdog: Check for server crashes and restart
     - Internet: Check for internet connection
+    - Updates: Watch for Ark updates being downloaded and installed
+    - Backups: Snapshot the save and cluster files
+    - Server Log: Watch the server log for load and fatal error lines
+    - Server Query: Check the server is reachable and count players
+    - Crashes: Pick how to recover from each crash by its signature
+    - Cadence: Speed up or slow down the other loops depending on what the server is doing
     """
 
     __version__ = version.VERSION
@@ -33,17 +61,73 @@ class ArkHandler:
         self.running = False  # Server is running
         self.checking_server = False  # Checking if server is running
         self.booting = False  # Server is booting up
-        self.checking_updates = False  # Checking for updates
+        self.boot_phase = ""  # Which part of the boot sequence is running, see state.PHASES
+        self.phase_started: datetime | None = None
+        self.server_process: tuple[int, float] | None = None  # PID and creation time of the server
+        self.resume_loading: datetime | None = None  # When the load wait a previous run was in started
+        self.resume_task: asyncio.Task | None = None
+        self.state_store = state.StateStore()
+
+        # Crash states
+        self.crash_analyzer = crashes.CrashAnalyzer(repeat_limit=self.conf.crash_repeat_limit)
+        self.last_crash: crashes.Crash | None = None
+        # Reboots on hold: the reason and until when, None means until resumed from the control endpoint
+        self.hold: None | tuple[str, datetime | None] = None
+        self.intentional_kill: str | None = None  # Why the server was killed on purpose, so it isn't taken for a crash
+        self.save_verifier = integrity.SaveVerifier()
+
+        # Network telemetry
+        self.net_sampler = netstats.NetSampler(
+            netstats.LinkSpeeds(fallback=helpers.get_ethernet_link_speed),
+            utilization_threshold=self.conf.network_alert_utilization / 100,
+            alert_seconds=self.conf.network_alert_minutes * 60,
+            error_threshold=self.conf.network_alert_errors,
+        )
+
+        # Cluster folder sync with other handlers
+        self.cluster_sync: clustersync.ClusterSync | None = None
+        if self.conf.cluster_peers:
+            self.cluster_sync = clustersync.ClusterSync(
+                Path(self.conf.cluster_dir) if self.conf.cluster_dir else const.CLUSTER_PATH,
+                self.conf.cluster_port,
+                clustersync.parse_peers(self.conf.cluster_peers),
+                self.conf.cluster_secret,
+            )
 
         # Update states
+        self.update_detector = updates.UpdateDetector(updates.WindowsEventSource())
         self.last_event: None | tuple[int, datetime] = None  # Last event pulled from event log
         self.downloading = False  # Downloading update
         self.installing = False  # Installing update
 
         # Internet states
-        self.last_connected = datetime.now()  # Last time internet was connected
+        self.last_connected = datetime.now()  # Last time internet was connected, or when it was first seen down
         self.connected = True  # Whether the computer is connected to the internet
 
+        self.lag_monitor = executor.LoopLagMonitor(self.conf.lag_threshold)
+
+        # Polling intervals for the loops, adjusted as the states above change
+        self.cadence = cadence.Cadence(
+            min_scale=self.conf.cadence_min_scale,
+            max_scale=self.conf.cadence_max_scale,
+            settle_minutes=self.conf.cadence_settle_minutes,
+            enabled=self.conf.adaptive_cadence,
+        )
+        self.intervals: dict[str, float] = {}  # Interval each scheduled job is currently running at
+
+        # Server log states
+        self.log_tailer = logtail.LogTailer()
+        self.loaded_event = threading.Event()  # Set once the server log says the map has loaded
+
+        # Server query states
+        self.prober = a2s.A2SClient(self.conf.query_host, self.conf.query_port)
+        self.query_ready = threading.Event()  # Set once the server answers queries
+        self.query_failures = 0  # Consecutive failed queries
+        self.players: int | None = None  # Players online, None if unknown
+        self.pending_restart: None | tuple[str, datetime] = None  # Restart put off while players are online
+
+        self.control = control.ControlServer(self)
+
     async def initialize(self):
         log.info("Initializing...")
         # Print banner and info
@@ -65,43 +149,153 @@ class ArkHandler:
         if self.conf.debug:
             log.setLevel(logging.DEBUG)
             info += "Debug mode enabled.\n"
-            speeds = helpers.get_ethernet_link_speed()
-            for adapter, speed in speeds:
+            speeds = await executor.run_blocking(self.net_sampler.link_speeds.get)
+            for adapter, speed in speeds.items():
                 info += f"{adapter}: {speed} Mbps\n"
         print(Fore.CYAN + info.strip())
 
+        logger.configure_logging(
+            max_mb=self.conf.log_max_mb,
+            backups=self.conf.log_backups,
+            rotate_hours=self.conf.log_rotate_hours,
+            retention_days=self.conf.log_retention_days,
+            json_logs=self.conf.json_logs,
+        )
+
         # Initialize Sentry
         logger.init_sentry(self.conf.sentry_dsn, self.__version__)
 
-        # Check resolution
-        helpers.check_resolution()
+        # Pick the server back up if ArkHandler was restarted, otherwise check resolution
+        adopted = await executor.run_blocking(self.restore_state)
+        if not adopted:
+            await executor.run_blocking(helpers.check_resolution)
+
+        if self.conf.vision_worker:
+            # Started on the first match, once the screen size is known
+            vision.start(self.conf.vision_worker_memory_mb)
+
+        self.lag_monitor.start()
+
+        try:
+            await self.control.start()
+        except Exception as e:
+            log.error("Failed to start the control endpoint", exc_info=e)
+
+        if self.cluster_sync:
+            try:
+                await self.cluster_sync.start()
+            except Exception as e:
+                log.error("Failed to start cluster sync", exc_info=e)
+
+        profiling.set_enabled(self.conf.profiling)
+        profiling.install_signal_handler(self.conf.profile_seconds)
 
         # Window bar animation
         if const.IS_EXE:
-            asyncio.create_task(self.window_title())
+            self.window_title()
 
         scheduler.add_job(
             func=self.watchdog,
             trigger="interval",
-            seconds=7,
+            seconds=self.cadence.interval("watchdog"),
             id="watchdog",
             name="Watchdog",
             replace_existing=True,
             max_instances=1,
             next_run_time=datetime.now() + timedelta(seconds=5),
         )
+        if self.resume_loading:
+            # The loop only keeps a weak reference to tasks
+            self.resume_task = asyncio.create_task(self.resume_boot(self.resume_loading), name="resume-boot")
+            self.resume_task.add_done_callback(self.resume_done)
         scheduler.add_job(
             func=self.check_internet,
             trigger="interval",
-            seconds=60,
+            seconds=self.cadence.interval("internet"),
             id="internet_checker",
             name="Internet Checker",
             replace_existing=True,
             max_instances=1,
             next_run_time=datetime.now() + timedelta(seconds=60),
         )
+        scheduler.add_job(
+            func=self.check_updates,
+            trigger="interval",
+            seconds=30,
+            id="update_checker",
+            name="Update Checker",
+            replace_existing=True,
+            max_instances=1,
+            next_run_time=datetime.now() + timedelta(seconds=10),
+        )
+        self.log_tailer.seek_end()
+        scheduler.add_job(
+            func=self.tail_server_log,
+            trigger="interval",
+            seconds=2,
+            id="server_log",
+            name="Server Log",
+            replace_existing=True,
+            max_instances=1,
+        )
+        if self.conf.query_port:
+            scheduler.add_job(
+                func=self.probe_server,
+                trigger="interval",
+                seconds=self.cadence.interval("query"),
+                id="server_query",
+                name="Server Query",
+                replace_existing=True,
+                max_instances=1,
+            )
+        if self.conf.backups and self.conf.backup_interval:
+            scheduler.add_job(
+                func=self.backup,
+                trigger="interval",
+                minutes=self.conf.backup_interval,
+                id="backup",
+                name="Backup",
+                replace_existing=True,
+                max_instances=1,
+            )
+        scheduler.add_job(
+            func=self.refresh_profiling,
+            trigger="interval",
+            seconds=30,
+            id="profiling",
+            name="Profiling",
+            replace_existing=True,
+            max_instances=1,
+        )
+        if self.conf.network_telemetry:
+            scheduler.add_job(
+                func=self.sample_network,
+                trigger="interval",
+                seconds=netstats.SAMPLE_SECONDS,
+                id="network",
+                name="Network",
+                replace_existing=True,
+                max_instances=1,
+            )
+        if self.conf.adaptive_cadence:
+            self.intervals = {
+                "watchdog": self.cadence.interval("watchdog"),
+                "internet_checker": self.cadence.interval("internet"),
+                "server_query": self.cadence.interval("query"),
+            }
+            scheduler.add_job(
+                func=self.update_cadence,
+                trigger="interval",
+                seconds=30,
+                id="cadence",
+                name="Cadence",
+                replace_existing=True,
+                max_instances=1,
+            )
+
+    def window_title(self):
+        """Animate the console title from its own thread so it never holds an executor worker"""
 
-    async def window_title(self):
         def _run():
             bar_cycle = cycle(const.BAR)
             while True:
@@ -109,16 +303,415 @@ class ArkHandler:
                 if self.current_action:
                     cmd += f" {self.current_action}"
                 os.system(cmd)
-                sleep(0.15)
+                sleep(self.cadence.interval("title"))
+
+        threading.Thread(target=_run, name="arkhandler-title", daemon=True).start()
+
+    def save_state(self) -> None:
+        pid, create_time = self.server_process or (0, 0.0)
+        checkpoint = state.Checkpoint(
+            running=self.running,
+            booting=self.booting,
+            boot_phase=self.boot_phase,
+            phase_started=self.phase_started,
+            connected=self.connected,
+            # Only matters for timing an outage, saving it every minute otherwise would be pointless writes
+            last_connected=None if self.connected else self.last_connected,
+            pid=pid,
+            create_time=create_time,
+            hold_reason=self.hold[0] if self.hold else "",
+            hold_until=self.hold[1] if self.hold else None,
+        )
+        self.state_store.save(checkpoint)
+
+    def set_phase(self, phase: str) -> None:
+        self.boot_phase = phase
+        self.phase_started = datetime.now() if phase else None
+        self.save_state()
+
+    def restore_state(self) -> bool:
+        """Re-adopt the server from the last checkpoint, returns True if it is still running"""
+        checkpoint = self.state_store.load()
+        if not checkpoint:
+            return False
+        # Carry on timing an outage that was going on when the handler stopped
+        self.connected = checkpoint.connected
+        if checkpoint.last_connected:
+            self.last_connected = checkpoint.last_connected
+        if checkpoint.hold_reason:
+            log.warning(f"Reboots are still on hold ({checkpoint.hold_reason})")
+            self.hold = (checkpoint.hold_reason, checkpoint.hold_until)
+            self.current_action = f"{checkpoint.hold_reason} [on hold]"
+        proc = state.adopt(checkpoint)
+        if not proc:
+            log.info("Server from the previous run is no longer running")
+            return False
+        if checkpoint.booting and checkpoint.boot_phase != "loading":
+            phase = checkpoint.boot_phase or "booting"
+            log.warning(f"Previous run was interrupted while {phase}, restarting the server")
+            helpers.kill()
+            return False
+
+        self.server_process = (checkpoint.pid, checkpoint.create_time)
+        if checkpoint.booting:
+            log.info(f"Re-adopted server with PID {checkpoint.pid}, resuming the wait for it to load")
+            self.resume_loading = checkpoint.phase_started or datetime.now()
+        else:
+            log.info(f"Re-adopted running server with PID {checkpoint.pid}")
+            self.running = True
+        return True
+
+    async def resume_boot(self, started: datetime) -> None:
+        """Finish waiting for a server that was loading when the handler restarted"""
+        self.booting = True
+        self.checking_server = True
+        self.current_action = "booting [resumed]"
+        self.boot_phase, self.phase_started = "loading", started
+        self.update_cadence()
+        elapsed = (datetime.now() - started).total_seconds()
+        try:
+            await self.wait_for_load(max(60, 900 - elapsed))
+        except Exception as e:
+            log.error("Resumed boot failed", exc_info=e)
+        finally:
+            self.booting = False
+            self.checking_server = False
+            self.set_phase("")
+            self.update_cadence()
+
+    def resume_done(self, task: asyncio.Task) -> None:
+        self.resume_task = None
+        self.resume_loading = None
+        if not task.cancelled() and task.exception():
+            log.error("Resumed boot failed", exc_info=task.exception())
+
+    def update_cadence(self, event: bool = False) -> None:
+        """Move the loops to the intervals for the current state, event marks something worth watching closely"""
+        if event:
+            self.cadence.event()
+        self.cadence.set_state(cadence.state_of(self.running, self.booting, self.connected))
+        self.save_state()
+        if not self.cadence.enabled:
+            return
+        jobs = {"watchdog": "watchdog", "internet_checker": "internet", "server_query": "query"}
+        for job_id, loop in jobs.items():
+            cadence.reschedule(scheduler, job_id, self.cadence.interval(loop), self.intervals)
+
+    async def backup(self, reason: str = "scheduled"):
+        try:
+            await executor.run_blocking(backup.snapshot, reason)
+            await executor.run_blocking(backup.prune, self.conf.backup_keep, self.conf.backup_keep_days)
+        except Exception as e:
+            log.error("Backup failed", exc_info=e)
+
+    def is_ready(self) -> bool:
+        """Whether the server log or a query says the server has finished loading"""
+        return self.loaded_event.is_set() or self.query_ready.is_set()
+
+    async def tail_server_log(self):
+        try:
+            events = await executor.run_blocking(self.log_tailer.poll)
+        except Exception as e:
+            log.error("Failed to read server log", exc_info=e)
+            return
+        for event in events:
+            if event.name == "loaded":
+                log.info(f"Server log reports the map has loaded: {event.line}")
+                self.loaded_event.set()
+            elif event.name == "listening":
+                log.info(f"Server log reports it is listening: {event.line}")
+            elif event.name == "fatal":
+                log.error(f"Server log reported a fatal error: {event.line}")
+                if self.running or self.booting:
+                    # Don't wait for the process to exit on its own, the watchdog will reboot it
+                    log.warning("Killing the server so it can be rebooted")
+                    await executor.run_blocking(helpers.kill)
+
+    async def probe_server(self):
+        """Query the server for readiness during boot, liveness once loaded, and the player count"""
+        try:
+            info = await self.prober.info()
+        except (asyncio.TimeoutError, a2s.A2SError, OSError) as e:
+            self.players = None
+            if not self.running or self.booting or not self.query_ready.is_set():
+                return
+            self.query_failures += 1
+            log.debug(f"Server query failed ({self.query_failures} in a row): {e!r}")
+            if self.conf.query_failures and self.query_failures >= self.conf.query_failures:
+                log.warning(f"Server stopped answering queries {self.query_failures} times in a row, rebooting...")
+                self.query_failures = 0
+                self.query_ready.clear()
+                await helpers.send_webhook(
+                    url=self.conf.webhook_url,
+                    title="Server Unresponsive",
+                    message="Server stopped answering queries. Rebooting...",
+                    color=16711753,
+                )
+                await self.kill_server("unresponsive")
+            return
+
+        self.query_failures = 0
+        self.players = info.players
+        if not self.query_ready.is_set():
+            log.info(f"Server is answering queries: {info.name} on {info.map} ({round(info.latency * 1000)}ms)")
+            self.query_ready.set()
+
+        if self.pending_restart:
+            reason, requested = self.pending_restart
+            waited = (datetime.now() - requested).total_seconds() / 60
+            if not self.players or waited >= self.conf.restart_defer_minutes:
+                log.warning(f"Running deferred restart ({reason}) with {self.players} players online")
+                self.pending_restart = None
+                await self.kill_server(reason)
+
+    async def kill_server(self, reason: str) -> None:
+        """Kill the server on purpose, the watchdog reboots it without treating it as a crash"""
+        self.intentional_kill = reason
+        await executor.run_blocking(helpers.kill)
+
+    async def request_restart(self, reason: str) -> None:
+        """Restart the server now, or once it's empty if players are online"""
+        if self.players and self.conf.restart_defer_minutes:
+            log.warning(f"{self.players} players online, deferring restart ({reason}) until they leave")
+            self.pending_restart = (reason, datetime.now())
+            return
+        # Kill the server to trigger the watchdog
+        await self.kill_server(reason)
 
-        await asyncio.to_thread(_run)
+    async def refresh_profiling(self):
+        """Pick up the Profiling config setting without restarting and log timings while it's on"""
+        try:
+            conf = await executor.run_blocking(Conf.load, str(const.CONF_PATH))
+        except Exception as e:
+            log.debug(f"Failed to reload config for profiling: {e}")
+            return
+        profiling.set_enabled(conf.profiling)
+        if profiling.enabled:
+            profiling.log_summary()
+
+    async def sync_inis(self) -> list[str]:
+        synced = []
+        if self.conf.game_ini:
+            log.info(f"Syncing {self.conf.game_ini}...")
+            if await executor.run_blocking(helpers.sync_file, self.conf.game_ini_path):
+                synced.append(self.conf.game_ini)
+        if self.conf.gameusersettings_ini:
+            log.info(f"Syncing {self.conf.gameusersettings_ini}...")
+            if await executor.run_blocking(helpers.sync_file, self.conf.gameusersettings_ini_path):
+                synced.append(self.conf.gameusersettings_ini)
+        return synced
+
+    def holding(self) -> bool:
+        """Whether reboots are on hold after a crash, releasing the hold once it runs out"""
+        if not self.hold:
+            return False
+        reason, until = self.hold
+        if until and datetime.now() >= until:
+            log.info(f"Reboot hold ({reason}) ran out, resuming the watchdog")
+            self.hold = None
+            self.current_action = ""
+            self.save_state()
+            return False
+        return True
+
+    async def analyze_crash(self) -> crashes.Crash | None:
+        # Pick up whatever the server wrote right before it went down
+        await self.tail_server_log()
+        try:
+            crash = await executor.run_blocking(self.crash_analyzer.analyze, list(self.log_tailer.recent))
+        except Exception as e:
+            log.error("Failed to analyze crash", exc_info=e)
+            return None
+        self.last_crash = crash
+        metrics.incr(f"crash_strategy_{crash.strategy}")
+        return crash
+
+    async def recover(self, crash: crashes.Crash) -> bool:
+        """Act on a crash's strategy, returns True if the server should be rebooted now"""
+        signature = crash.signature
+        summary = (
+            f"`{signature.code}` in `{signature.module}` (seen {crash.count} times, {crash.recent} in the last hour)"
+        )
+        if crash.strategy == "restore":
+            snapshot = await executor.run_blocking(backup.latest_before, crash.time)
+            if not snapshot:
+                log.warning("Crash looks like a bad save but there's no backup to restore, rebooting")
+                return True
+            log.warning(f"Rolling the map back to backup {snapshot.stem} before rebooting")
+            self.current_action = "restoring backup"
+            maps = await executor.run_blocking(self.save_verifier.restore_maps, snapshot)
+            if not maps:
+                log.warning(f"No good copy of the map in backup {snapshot.stem} or older, rebooting")
+                return True
+            restored = ", ".join(f"`{rel}` from {name}" for rel, name in maps.items())
+            await helpers.send_webhook(
+                url=self.conf.webhook_url,
+                title="Backup Restored",
+                message=f"Server crashed with {summary}, rolled back {restored}",
+                color=16739584,
+            )
+            return True
+        if crash.strategy == "wait_update":
+            until = datetime.now() + timedelta(minutes=self.conf.crash_update_wait_minutes)
+            self.hold = ("waiting for an update", until)
+            self.current_action = "crashed [waiting for update]"
+            await helpers.send_webhook(
+                url=self.conf.webhook_url,
+                title="Waiting For Update",
+                message=(
+                    f"Server crashed with {summary}, it needs an update. "
+                    f"Holding off rebooting until <t:{int(until.timestamp())}:t>"
+                ),
+                color=14177041,
+            )
+            return False
+        if crash.strategy == "hold":
+            self.hold = (f"crash {signature.id}", None)
+            self.current_action = "crashed [on hold]"
+            await helpers.send_webhook(
+                url=self.conf.webhook_url,
+                title="Reboots On Hold",
+                message=f"Server crashed with {summary}. Rebooting isn't fixing it, holding until someone takes a look",
+                color=16711753,
+            )
+            return False
+        return True
+
+    async def verify_saves(self) -> None:
+        """Check the saves before booting, raises CorruptSave if the map is corrupt and couldn't be rolled back"""
+        result = await executor.run_blocking(self.save_verifier.verify)
+        if result.restored:
+            restored = "\n".join(f"`{i.rel}` ({i.reason}) from {i.restored_from}" for i in result.restored)
+            await helpers.send_webhook(
+                url=self.conf.webhook_url,
+                title="Saves Rolled Back",
+                message=f"Found corrupt saves before booting, rolled back:\n{restored}",
+                color=16739584,
+            )
+        if not result.failed:
+            return
+        failed = "\n".join(f"`{i.rel}` ({i.reason})" for i in result.failed)
+        if not any(integrity.is_map(Path(i.rel)) for i in result.failed):
+            # Better a few players lose their character than the whole server stays down
+            await helpers.send_webhook(
+                url=self.conf.webhook_url,
+                title="Corrupt Saves",
+                message=f"Couldn't find a good copy of these saves, booting anyway:\n{failed}",
+                color=16711753,
+            )
+            return
+        self.hold = ("corrupt save", None)
+        self.current_action = "corrupt save [on hold]"
+        await helpers.send_webhook(
+            url=self.conf.webhook_url,
+            title="Reboots On Hold",
+            message=f"The map save is corrupt and there's no good copy to roll back to:\n{failed}",
+            color=16711753,
+        )
+        # Failing the step skips the backup, so the corrupt map isn't snapshotted over the good copies
+        raise integrity.CorruptSave(f"The map save is corrupt: {failed}")
+
+    async def prepare_boot(self) -> bootprep.Report:
+        """Everything that has to happen before launching the game, run side by side where possible"""
+        prep = bootprep.BootPrep()
+        prep.add(
+            "webhook",
+            helpers.send_webhook,
+            self.conf.webhook_url,
+            "Server Down",
+            "Beginning reboot sequence...",
+            16739584,
+        )
+        if self.conf.verify_saves:
+            prep.add("saves", self.verify_saves)
+        if self.conf.backups:
+            # Don't snapshot a corrupt save over the good copies
+            prep.add("backup", self.backup, "reboot", needs=("saves",) if self.conf.verify_saves else ())
+        if self.conf.game_ini:
+            prep.add("game_ini", helpers.sync_file, self.conf.game_ini_path)
+        if self.conf.gameusersettings_ini:
+            prep.add("gameusersettings_ini", helpers.sync_file, self.conf.gameusersettings_ini_path)
+        prep.add("kill_store", helpers.kill, "WinStore.App.exe")
+        prep.add("dll", helpers.ensure_dll)
+        prep.add("dll_permissions", helpers.apply_permissions_to_dll, const.DLL_PATH, needs=("dll",))
+        report = await prep.run()
+        log.info("Set permissions on startup dll: %s", report.results.get("dll_permissions", False))
+        return report
+
+    # Control endpoint commands
+    async def control_status(self) -> dict:
+        job = scheduler.get_job("watchdog")
+        return {
+            "version": self.__version__,
+            "running": self.running,
+            "booting": self.booting,
+            "action": self.current_action,
+            "watchdog_paused": job is not None and job.next_run_time is None,
+            "connected": self.connected,
+            "last_connected": self.last_connected,
+            "downloading": self.downloading,
+            "installing": self.installing,
+            "players": self.players,
+            "query_ready": self.query_ready.is_set(),
+            "pending_restart": self.pending_restart,
+            "boot_phase": self.boot_phase,
+            "hold": self.hold,
+            "last_crash": self.last_crash,
+            "cadence": {"state": self.cadence.state, "intervals": self.intervals},
+            "cluster_sync": self.cluster_sync.stats if self.cluster_sync else None,
+            "network": self.net_sampler.summary(),
+        }
+
+    async def control_reboot(self, force: bool = False) -> str:
+        if force:
+            await self.kill_server("control command")
+            return "Server killed, the watchdog will reboot it"
+        await self.request_restart("control command")
+        if self.pending_restart:
+            return "Restart deferred until players leave"
+        return "Server killed, the watchdog will reboot it"
+
+    async def control_pause(self) -> str:
+        scheduler.pause_job("watchdog")
+        self.current_action = "watchdog paused"
+        return "Watchdog paused"
+
+    async def control_resume(self) -> str:
+        scheduler.resume_job("watchdog")
+        self.current_action = ""
+        if self.hold:
+            log.info(f"Releasing reboot hold ({self.hold[0]})")
+            self.hold = None
+            self.save_state()
+        return "Watchdog resumed"
+
+    async def control_resync(self) -> list[str]:
+        return await self.sync_inis()
+
+    async def control_loglevel(self, level: str) -> str:
+        level = level.upper()
+        if level not in logging.getLevelNamesMapping():
+            raise ValueError(f"Unknown log level {level}")
+        logging.getLogger().setLevel(level)
+        for name in list(logging.root.manager.loggerDict):
+            if name.startswith("arkhandler"):
+                logging.getLogger(name).setLevel(level)
+        return f"Log level set to {level}"
+
+    async def control_metrics(self) -> dict:
+        return {"metrics": metrics.snapshot(), "profiling": profiling.summary()}
+
+    async def control_profile(self, seconds: float | None = None) -> str:
+        profiling.set_enabled(True)
+        profiling.start_sampling(seconds or self.conf.profile_seconds)
+        return f"Profiling enabled, sampling for {seconds or self.conf.profile_seconds} seconds"
 
     async def watchdog(self):
         skip = [
             self.checking_server,
             self.booting,
-            self.checking_updates,
             self.installing,
+            self.holding(),
         ]
         if any(skip):
             log.debug(f"Skipping watchdog: {skip}")
@@ -131,20 +724,32 @@ class ArkHandler:
         finally:
             self.booting = False
             self.checking_server = False
+            self.boot_phase, self.phase_started = "", None
+            self.update_cadence()
 
     async def _check_server(self):
         """Check for server crashes and restart"""
-        running = await asyncio.to_thread(helpers.is_running)
+        running = await executor.run_blocking(helpers.is_running)
         if running:
             # Server is running and loaded
             if not self.running:
                 log.info("Server is up and running.")
                 self.running = True
+            if not self.server_process:
+                pid = await executor.run_blocking(helpers.get_pid)
+                self.server_process = await executor.run_blocking(state.process_identity, pid)
             return
 
         # Server is either not running or running but not loaded
-        if self.running:
+        killed, self.intentional_kill = self.intentional_kill, None
+        if self.running and killed:
+            log.warning(f"Server was stopped ({killed}), rebooting in 5 seconds...")
+        elif self.running:
             log.warning("Server has stopped running, rebooting in 5 seconds...")
+            crash = await self.analyze_crash()
+            if crash and not await self.recover(crash):
+                self.running = False
+                return
         else:
             log.warning("Server is not running, starting up in 5 seconds...")
         await asyncio.sleep(5)
@@ -152,29 +757,23 @@ class ArkHandler:
         # If we're here, the server needs to be rebooted
         self.running = False
         self.booting = True
-        self.current_action = "booting"
-        if self.conf.game_ini or self.conf.gameusersettings_ini:
-            self.current_action += " [syncing inis]"
-
-        await helpers.send_webhook(
-            url=self.conf.webhook_url,
-            title="Server Down",
-            message="Beginning reboot sequence...",
-            color=16739584,
-        )
-        if self.conf.game_ini:
-            log.info(f"Syncing {self.conf.game_ini}...")
-            helpers.sync_file(self.conf.game_ini_path)
-        if self.conf.gameusersettings_ini:
-            log.info(f"Syncing {self.conf.gameusersettings_ini}...")
-            helpers.sync_file(self.conf.gameusersettings_ini_path)
-
-        self.current_action = "killing MS Store"
-        helpers.kill("WinStore.App.exe")
+        self.server_process = None
+        self.update_cadence(event=True)
+        self.set_phase("preparing")
+        self.current_action = "booting [preparing]"
+        report = await self.prepare_boot()
+        if "saves" in report.failed and self.hold:
+            log.error("Not booting into a corrupt save, holding until resumed")
+            return
 
         self.current_action = "booting [starting server]"
-        os.system(const.BOOT_COMMAND)
-        running = await asyncio.to_thread(helpers.wait_till_running)
+        self.set_phase("launching")
+        self.log_tailer.seek_end()
+        self.loaded_event.clear()
+        self.query_ready.clear()
+        self.pending_restart = None
+        await executor.run_command(const.BOOT_COMMAND, timeout=30)
+        running = await executor.run_blocking(helpers.wait_till_running)
         if not running:
             log.warning("Failed to start server, trying again in 1 minute")
             await helpers.send_webhook(
@@ -185,41 +784,32 @@ class ArkHandler:
             )
             self.current_action = "boot failed [sleeping before retry]"
             await asyncio.sleep(60)
-            helpers.kill()
+            await executor.run_blocking(helpers.kill)
             self.booting = False
             return
 
-        # Ensure dll exists
-        if not const.DLL_PATH.exists():
-            # Rewrite the DLL
-            const.DLL_PATH.parent.mkdir(parents=True, exist_ok=True)
-            const.DLL_PATH.write_bytes(const.DLL_BYTES)
-            # Set the permissions on the DLL
-            const.DLL_PATH.chmod(0o777)
-
-        # Set the permissions on the DLL
-        perms = await asyncio.to_thread(helpers.apply_permissions_to_dll, const.DLL_PATH)
-        log.info("Set permissions on startup dll: %s", perms)
-
         # Get the PID of ShooterGame.exe
-        pid = await asyncio.to_thread(helpers.get_pid)
+        self.set_phase("injecting")
+        pid = await executor.run_blocking(helpers.get_pid)
         log.info("Ark is running with PID %s, injecting startup dll...", pid)
+        self.server_process = await executor.run_blocking(state.process_identity, pid)
 
         # Inject the DLL
-        injected = await asyncio.to_thread(helpers.inject_dll, pid, const.DLL_PATH)
+        injected = await executor.run_blocking(helpers.inject_dll, pid, const.DLL_PATH)
         log.info("Injected dll: %s", injected)
 
         # Wait 3 seconds then check if process is still running
         await asyncio.sleep(3)
-        running = await asyncio.to_thread(helpers.is_running)
+        running = await executor.run_blocking(helpers.is_running)
         if not running:
             log.error("Ark is not running after injection, killing and retrying")
-            helpers.kill()
+            await executor.run_blocking(helpers.kill)
             self.current_action = "dll injection failed [sleeping before retry]"
             await asyncio.sleep(5)
             self.booting = False
             return
 
+        self.set_phase("loading")
         await helpers.send_webhook(
             url=self.conf.webhook_url,
             title="Booting",
@@ -228,11 +818,16 @@ class ArkHandler:
         )
         await asyncio.sleep(10)
         self.current_action = "booting [stopping license manager]"
-        call("net stop LicenseManager", stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL)
+        await executor.run_command("net stop LicenseManager", timeout=60)
         await asyncio.sleep(10)
         # Wait up to 15 minutes for loading to finish
+        await self.wait_for_load(900)
+
+    async def wait_for_load(self, timeout: float):
         log.info("Waiting for server to finish loading")
-        loaded = await asyncio.to_thread(helpers.wait_for_state, "loaded", 900)
+        loaded = await executor.run_blocking(
+            helpers.wait_for_state, "loaded", timeout, self.is_ready, self.cadence.interval("screen")
+        )
         if not loaded:
             log.warning("Server never finished loading, waiting 5 minutes before trying again")
             await helpers.send_webhook(
@@ -244,10 +839,11 @@ class ArkHandler:
             self.current_action = "boot failed [sleeping before retry]"
             await asyncio.sleep(300)
             self.booting = False
-            helpers.kill()
+            await executor.run_blocking(helpers.kill)
             return
 
         log.info("Boot sequence complete.")
+        self.cadence.event()
         await helpers.send_webhook(
             url=self.conf.webhook_url,
             title="Reboot Complete",
@@ -257,12 +853,74 @@ class ArkHandler:
         self.current_action = ""
         self.booting = False
 
+    async def check_updates(self):
+        """Relay Ark update progress and pause the watchdog while an update is installing"""
+        try:
+            events = await executor.run_blocking(self.update_detector.poll)
+        except Exception as e:
+            log.error("Failed to check for updates", exc_info=e)
+            return
+        for event in events:
+            self.last_event = (event.record_id, event.created)
+            if event.phase == "download" and not self.downloading:
+                log.info("Ark update is downloading")
+                self.downloading = True
+                await helpers.send_webhook(self.conf.webhook_url, "Update Found", const.DOWNLOAD, 14177041)
+            elif event.phase == "install" and not self.installing:
+                log.warning("Ark update is installing, pausing watchdog")
+                self.downloading = False
+                self.installing = True
+                self.current_action = "installing update"
+                await helpers.send_webhook(self.conf.webhook_url, "Installing Update", const.INSTALL, 14177041)
+            elif event.phase == "complete":
+                log.info("Ark update installed, resuming watchdog")
+                self.downloading = False
+                self.installing = False
+                self.current_action = ""
+                if self.hold and self.hold[0] == "waiting for an update":
+                    self.hold = None
+                    self.save_state()
+                await helpers.send_webhook(self.conf.webhook_url, "Update Complete", const.COMPLETE, 65314)
+            elif event.phase == "failed":
+                log.error("Ark update failed to install, resuming watchdog")
+                self.downloading = False
+                self.installing = False
+                self.current_action = ""
+
+        # Don't let a missed completion pause the watchdog forever
+        if self.installing and self.last_event and datetime.now() - self.last_event[1] > timedelta(hours=1):
+            log.warning("Update has been installing for over an hour, resuming watchdog")
+            self.installing = False
+            self.current_action = ""
+
+    async def sample_network(self):
+        try:
+            alerts = await executor.run_blocking(self.net_sampler.sample)
+        except Exception as e:
+            log.error("Failed to sample network counters", exc_info=e)
+            return
+        if alerts:
+            await helpers.send_webhook(
+                url=self.conf.webhook_url,
+                title="Network",
+                message="\n".join(alerts),
+                color=14177041,
+            )
+
     async def check_internet(self):
         connected = await helpers.internet_connected()
         if not connected:
             if self.connected:
-                log.warning("Internet disconnected!")
+                # A saturated link can look like an outage, say which it was
+                usage = ", ".join(
+                    f"{nic} {i.utilization:.0%} ({i.sent_mbps} up/{i.recv_mbps} down Mbps)"
+                    for nic, i in self.net_sampler.latest().items()
+                )
+                log.warning(f"Internet disconnected! Link usage: {usage or 'unknown'}")
+                # Time the outage from here, the last good check can be a whole (stretched) interval ago
+                self.last_connected = datetime.now()
                 self.connected = False
+                self.update_cadence()
             # Internet is down, nothing to do
             return
 
@@ -279,10 +937,11 @@ class ArkHandler:
                     message=txt,
                     color=16711753,
                 )
-                # Kill the server to trigger the watchdog
-                helpers.kill()
+                await self.request_restart("internet outage")
             else:
                 log.warning(f"Internet was down for {round(td)} seconds but is back up!")
 
-        self.connected = True
+        if not self.connected:
+            self.connected = True
+            self.update_cadence(event=True)
         self.last_connected = datetime.now()
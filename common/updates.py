@@ -0,0 +1,211 @@
+"""
+Detect Ark updates from the Windows Update client's event log instead of driving the Microsoft Store UI.
+
+Events are read incrementally after a persisted bookmark so old events are never re-read,
+and the installed package version is watched as a cheap fallback for missed completions.
+The Windows modules are only imported by the Windows source and version probe, so the rest runs anywhere.
+"""
+
+import json
+import logging
+import typing as t
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    from common import const
+except ModuleNotFoundError:
+    import const
+
+log = logging.getLogger("arkhandler.updates")
+
+PACKAGE_NAME = const.APP.split("_")[0]
+PROVIDER = "Microsoft-Windows-WindowsUpdateClient"
+PACKAGES_KEY = r"Software\Classes\Local Settings\Software\Microsoft\Windows\CurrentVersion\AppModel\Repository\Packages"
+NS = {"e": "http://schemas.microsoft.com/win/2004/08/events/event"}
+
+# Windows Update client event IDs
+PHASES = {
+    44: "download",  # Started downloading an update
+    43: "install",  # Started installing an update
+    19: "complete",  # Successfully installed an update
+    20: "failed",  # Failed to install an update
+}
+
+
+@dataclass
+class UpdateEvent:
+    record_id: int
+    event_id: int
+    created: datetime
+    title: str
+
+    @property
+    def phase(self) -> str | None:
+        return PHASES.get(self.event_id)
+
+
+class EventSource(t.Protocol):
+    def latest(self) -> int:
+        """The newest record ID currently in the source"""
+
+    def read(self, after: int) -> list[UpdateEvent]:
+        """Events with a record ID greater than the one given, oldest first"""
+
+
+class WindowsEventSource:
+    """Reads Windows Update client events from the System event log"""
+
+    def __init__(self, channel: str = "System", batch: int = 50) -> None:
+        self.channel = channel
+        self.batch = batch
+
+    def _query(self, xpath: str, flags: int) -> t.Iterator[str]:
+        import win32evtlog
+
+        handle = win32evtlog.EvtQuery(self.channel, flags, xpath)
+        while True:
+            events = win32evtlog.EvtNext(handle, self.batch)
+            if not events:
+                return
+            for event in events:
+                yield win32evtlog.EvtRender(event, win32evtlog.EvtRenderEventXml)
+
+    def latest(self) -> int:
+        import win32evtlog
+
+        flags = win32evtlog.EvtQueryChannelPath | win32evtlog.EvtQueryReverseDirection
+        for xml in self._query(f"*[System[Provider[@Name='{PROVIDER}']]]", flags):
+            return parse_event(xml).record_id
+        return 0
+
+    def read(self, after: int) -> list[UpdateEvent]:
+        import win32evtlog
+
+        flags = win32evtlog.EvtQueryChannelPath | win32evtlog.EvtQueryForwardDirection
+        xpath = f"*[System[Provider[@Name='{PROVIDER}'] and (EventRecordID > {after})]]"
+        return [parse_event(xml) for xml in self._query(xpath, flags)]
+
+
+class MemoryEventSource:
+    """An in-memory feed of events, for tests and dry runs"""
+
+    def __init__(self, events: list[UpdateEvent] | None = None) -> None:
+        self.events = events or []
+
+    def push(self, event_id: int, title: str = PACKAGE_NAME) -> UpdateEvent:
+        event = UpdateEvent(self.latest() + 1, event_id, datetime.now(), title)
+        self.events.append(event)
+        return event
+
+    def latest(self) -> int:
+        return max((i.record_id for i in self.events), default=0)
+
+    def read(self, after: int) -> list[UpdateEvent]:
+        return [i for i in self.events if i.record_id > after]
+
+
+def parse_event(xml: str) -> UpdateEvent:
+    root = ET.fromstring(xml)
+    system = root.find("e:System", NS)
+    created = system.find("e:TimeCreated", NS).get("SystemTime", "")
+    # SystemTime is UTC with 7 digit precision, trim it to something fromisoformat accepts and make it local
+    if created:
+        utc = datetime.fromisoformat(created[:26].rstrip("Z")).replace(tzinfo=timezone.utc)
+        created = utc.astimezone().replace(tzinfo=None)
+    else:
+        created = datetime.now()
+    title = ""
+    for data in root.iterfind("e:EventData/e:Data", NS):
+        if data.get("Name") == "updateTitle":
+            title = data.text or ""
+    return UpdateEvent(
+        record_id=int(system.find("e:EventRecordID", NS).text),
+        event_id=int(system.find("e:EventID", NS).text),
+        created=created,
+        title=title,
+    )
+
+
+def installed_version() -> str | None:
+    """Read the installed Ark package version from the AppModel repository, which is a cheap registry lookup"""
+    import winreg
+
+    try:
+        with winreg.OpenKey(winreg.HKEY_CURRENT_USER, PACKAGES_KEY) as key:
+            index = 0
+            while True:
+                try:
+                    name = winreg.EnumKey(key, index)
+                except OSError:
+                    return None
+                if name.startswith(f"{PACKAGE_NAME}_"):
+                    return name.split("_")[1]
+                index += 1
+    except OSError:
+        return None
+
+
+class UpdateDetector:
+    def __init__(
+        self,
+        source: EventSource,
+        bookmark_path: Path = const.UPDATE_BOOKMARK_PATH,
+        version_probe: t.Callable[[], str | None] = installed_version,
+    ) -> None:
+        self.source = source
+        self.bookmark_path = bookmark_path
+        self.version_probe = version_probe
+        self.record_id: int | None = None
+        self.version: str | None = None
+        self.load()
+
+    def load(self) -> None:
+        if not self.bookmark_path.exists():
+            return
+        try:
+            data = json.loads(self.bookmark_path.read_text())
+            self.record_id = data.get("record_id")
+            self.version = data.get("version")
+        except (OSError, ValueError) as e:
+            log.error("Failed to load update bookmark", exc_info=e)
+
+    def save(self) -> None:
+        data = {"record_id": self.record_id, "version": self.version}
+        tmp = self.bookmark_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data))
+        tmp.replace(self.bookmark_path)
+
+    def poll(self) -> list[UpdateEvent]:
+        """Return any new Ark update events since the last poll"""
+        changed = False
+        found: list[UpdateEvent] = []
+        if self.record_id is None:
+            # First run, start from the newest event rather than replaying history
+            self.record_id = self.source.latest()
+            changed = True
+        else:
+            events = self.source.read(self.record_id)
+            for event in events:
+                self.record_id = max(self.record_id, event.record_id)
+                changed = True
+                if event.phase and PACKAGE_NAME in event.title:
+                    found.append(event)
+            if not events and (latest := self.source.latest()) < self.record_id:
+                # The event log was cleared and record IDs started over
+                self.record_id = latest
+                changed = True
+
+        version = self.version_probe()
+        if version and version != self.version:
+            if self.version and not any(i.phase == "complete" for i in found):
+                log.info(f"Ark version changed from {self.version} to {version}")
+                found.append(UpdateEvent(self.record_id, 19, datetime.now(), f"{PACKAGE_NAME} {version}"))
+            self.version = version
+            changed = True
+
+        if changed:
+            self.save()
+        return found
@@ -0,0 +1,203 @@
+"""
+Template matching in a separate worker process.
+
+Screen captures are copied into a shared memory ring buffer and the worker is sent the slot to read over a pipe,
+so the frames themselves are never pickled. The worker decodes its own templates and masks and sends back
+just the score and box for each template. This keeps OpenCV's allocations and CPU time out of the handler process.
+
+The worker is restarted if it dies, stops answering or its memory grows past the configured cap.
+"""
+
+import logging
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection
+
+import cv2
+import numpy as np
+import psutil
+
+try:
+    from common import const, matching, metrics
+except ModuleNotFoundError:
+    import const
+    import matching
+    import metrics
+
+log = logging.getLogger("arkhandler.vision")
+
+SLOTS = 3  # Frames in the ring buffer
+TIMEOUT = 10  # Seconds to wait for the worker to answer
+MEMORY_CHECK_INTERVAL = 10  # Seconds between checks of the worker's memory
+
+Box = tuple[int, int, int, int]
+
+
+class VisionError(Exception):
+    pass
+
+
+class FrameRing:
+    """Fixed size grayscale frames in shared memory, written round robin"""
+
+    def __init__(self, shape: tuple[int, int], slots: int = SLOTS, name: str | None = None) -> None:
+        self.shape = shape
+        self.slots = slots
+        size = slots * shape[0] * shape[1]
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.frames = np.ndarray((slots, *shape), dtype=np.uint8, buffer=self.shm.buf)
+        self.next = 0
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def write(self, frame: np.ndarray) -> int:
+        slot = self.next
+        np.copyto(self.frames[slot], frame)
+        self.next = (slot + 1) % self.slots
+        return slot
+
+    def close(self, unlink: bool = False) -> None:
+        # The view has to go before the memory can be released
+        del self.frames
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def load_templates() -> dict[str, np.ndarray]:
+    return {
+        name: cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        for name, data in const.IMAGE_BYTES.items()
+    }
+
+
+def worker_main(ring_name: str, shape: tuple[int, int], slots: int, conn: Connection) -> None:
+    """Worker process loop, answers (seq, slot, {template: threshold}) with (seq, {template: (score, box)})"""
+    ring = FrameRing(shape, slots, name=ring_name)
+    templates = load_templates()
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+            seq, slot, thresholds = request
+            frame = ring.frames[slot]
+            results = {}
+            for name, threshold in thresholds.items():
+                results[name] = matching.match(frame, templates[name], name, threshold)
+            conn.send((seq, results))
+    finally:
+        ring.close()
+
+
+class VisionWorker:
+    def __init__(self, memory_mb: float = 1024) -> None:
+        self.memory_cap = memory_mb * 1024**2
+        self.process: multiprocessing.Process | None = None
+        self.conn: Connection | None = None
+        self.ring: FrameRing | None = None
+        self.seq = 0
+        self.last_memory_check = 0.0
+        self.restarts = 0
+        self.lock = threading.Lock()
+
+    def start(self, shape: tuple[int, int]) -> None:
+        self.ring = FrameRing(shape)
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=worker_main,
+            args=(self.ring.name, shape, self.ring.slots, child),
+            name="arkhandler-vision",
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        log.info(f"Started vision worker with PID {self.process.pid}")
+
+    def stop(self) -> None:
+        if self.conn:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+            self.conn.close()
+            self.conn = None
+        if self.process:
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.kill()
+            self.process = None
+        if self.ring:
+            self.ring.close(unlink=True)
+            self.ring = None
+
+    def restart(self, shape: tuple[int, int], reason: str) -> None:
+        log.warning(f"Restarting vision worker: {reason}")
+        self.restarts += 1
+        metrics.incr("vision_worker_restarts")
+        self.stop()
+        self.start(shape)
+
+    def check(self, shape: tuple[int, int]) -> None:
+        """Make sure a healthy worker is running for frames of this shape"""
+        if self.process is None:
+            self.start(shape)
+            return
+        if not self.process.is_alive():
+            self.restart(shape, f"exited with code {self.process.exitcode}")
+            return
+        if self.ring.shape != shape:
+            self.restart(shape, f"screen size changed to {shape[1]}x{shape[0]}")
+            return
+        now = time.monotonic()
+        if now - self.last_memory_check < MEMORY_CHECK_INTERVAL:
+            return
+        self.last_memory_check = now
+        try:
+            rss = psutil.Process(self.process.pid).memory_info().rss
+        except psutil.Error:
+            return
+        if self.memory_cap and rss > self.memory_cap:
+            self.restart(shape, f"using {rss / 1024**2:.0f}MB, over the {self.memory_cap / 1024**2:.0f}MB cap")
+
+    def match(self, frame: np.ndarray, thresholds: dict[str, float]) -> dict[str, tuple[float, Box]]:
+        """Score each template against the frame in the worker"""
+        with self.lock:
+            self.check(frame.shape[:2])
+            self.seq += 1
+            slot = self.ring.write(frame)
+            try:
+                self.conn.send((self.seq, slot, thresholds))
+                # Skip any late answer to a request that timed out before
+                while self.conn.poll(TIMEOUT):
+                    seq, results = self.conn.recv()
+                    if seq == self.seq:
+                        return results
+            except (OSError, EOFError) as e:
+                self.restart(frame.shape[:2], f"pipe failed: {e!r}")
+                raise VisionError("Vision worker pipe failed") from e
+            self.restart(frame.shape[:2], f"no answer after {TIMEOUT}s")
+            raise VisionError(f"Vision worker didn't answer within {TIMEOUT}s")
+
+
+worker: VisionWorker | None = None
+
+
+def start(memory_mb: float) -> VisionWorker:
+    global worker
+    worker = VisionWorker(memory_mb)
+    return worker
+
+
+def shutdown() -> None:
+    global worker
+    if worker:
+        worker.stop()
+        worker = None
@@ -0,0 +1,250 @@
+"""
+Track the windows ArkHandler pokes at instead of looking them up on every call.
+
+Handles are resolved once with FindWindow and revalidated with IsWindow and the window title, which is cheap.
+A window that isn't open is only looked for again after a short delay, and state changes are skipped
+when the window is already in the wanted state (e.g. maximized and focused).
+Only the Win32 backend needs pywin32 and pywinauto, the tracker works with any backend.
+"""
+
+import logging
+import threading
+import time
+import typing as t
+
+log = logging.getLogger("arkhandler.windows")
+
+ARK = "ARK: Survival Evolved"
+STORE = "Microsoft Store"
+TEAMVIEWER = "Sponsored session"
+
+MISSING_RETRY = 1.0  # Seconds before looking for a window that wasn't open again
+
+# ShowWindow commands and GetWindowPlacement states, the same values as win32con
+SW_SHOWNORMAL = 1
+SW_SHOWMINIMIZED = 2
+SW_SHOWMAXIMIZED = 3
+SW_MINIMIZE = 6
+SW_RESTORE = 9
+WM_CLOSE = 0x0010
+
+
+class WindowBackend(t.Protocol):
+    def find(self, title: str) -> int: ...
+
+    def is_valid(self, handle: int, title: str) -> bool: ...
+
+    def placement(self, handle: int) -> int: ...
+
+    def foreground(self) -> int: ...
+
+    def show(self, handle: int, command: int) -> None: ...
+
+    def focus(self, handle: int) -> None: ...
+
+    def close(self, handle: int) -> None: ...
+
+    def rect(self, handle: int) -> tuple[int, int, int, int]: ...
+
+    def forget(self, handle: int) -> None: ...
+
+
+class Win32Backend:
+    def __init__(self) -> None:
+        self.apps: dict[int, t.Any] = {}  # Connected pywinauto apps by window handle
+
+    def find(self, title: str) -> int:
+        import win32gui
+
+        return win32gui.FindWindow(None, title)
+
+    def is_valid(self, handle: int, title: str) -> bool:
+        import win32gui
+
+        # Handles get reused, so the title has to match too
+        return bool(win32gui.IsWindow(handle)) and win32gui.GetWindowText(handle) == title
+
+    def placement(self, handle: int) -> int:
+        import win32gui
+
+        return win32gui.GetWindowPlacement(handle)[1]
+
+    def foreground(self) -> int:
+        import win32gui
+
+        return win32gui.GetForegroundWindow()
+
+    def show(self, handle: int, command: int) -> None:
+        import win32gui
+
+        win32gui.ShowWindow(handle, command)
+
+    def focus(self, handle: int) -> None:
+        from pywinauto import Application
+
+        app = self.apps.get(handle)
+        if app is None:
+            # Connecting enumerates windows through UIA, so only do it once per handle
+            app = self.apps[handle] = Application().connect(handle=handle)
+        try:
+            app.top_window().set_focus()
+        except Exception:
+            self.apps.pop(handle, None)
+            raise
+
+    def close(self, handle: int) -> None:
+        import win32gui
+
+        win32gui.PostMessage(handle, WM_CLOSE, 0, 0)
+
+    def rect(self, handle: int) -> tuple[int, int, int, int]:
+        import win32gui
+
+        return win32gui.GetWindowRect(handle)
+
+    def forget(self, handle: int) -> None:
+        self.apps.pop(handle, None)
+
+
+class FakeBackend:
+    """In-memory windows for exercising the tracker without a desktop"""
+
+    def __init__(self) -> None:
+        self.windows: dict[int, dict] = {}
+        self.active = 0
+        self.calls: list[tuple] = []
+        self.next_handle = 1
+
+    def open(self, title: str, placement: int = SW_SHOWNORMAL, rect=(0, 0, 1280, 720)) -> int:
+        handle = self.next_handle
+        self.next_handle += 1
+        self.windows[handle] = {"title": title, "placement": placement, "rect": rect}
+        return handle
+
+    def find(self, title: str) -> int:
+        self.calls.append(("find", title))
+        return next((h for h, w in self.windows.items() if w["title"] == title), 0)
+
+    def is_valid(self, handle: int, title: str) -> bool:
+        return handle in self.windows and self.windows[handle]["title"] == title
+
+    def placement(self, handle: int) -> int:
+        return self.windows[handle]["placement"]
+
+    def foreground(self) -> int:
+        return self.active
+
+    def show(self, handle: int, command: int) -> None:
+        self.calls.append(("show", handle, command))
+        # Mirror what GetWindowPlacement reports after ShowWindow
+        shown = {SW_MINIMIZE: SW_SHOWMINIMIZED, SW_RESTORE: SW_SHOWNORMAL}
+        self.windows[handle]["placement"] = shown.get(command, command)
+
+    def focus(self, handle: int) -> None:
+        self.calls.append(("focus", handle))
+        self.active = handle
+
+    def close(self, handle: int) -> None:
+        self.calls.append(("close", handle))
+        self.windows.pop(handle, None)
+
+    def rect(self, handle: int) -> tuple[int, int, int, int]:
+        return self.windows[handle]["rect"]
+
+    def forget(self, handle: int) -> None:
+        pass
+
+
+class WindowTracker:
+    def __init__(self, backend: WindowBackend | None = None) -> None:
+        self.backend = backend or Win32Backend()
+        self.handles: dict[str, int] = {}
+        self.missing: dict[str, float] = {}  # When a window was last looked for and not found
+        self.lock = threading.Lock()
+
+    def handle(self, title: str) -> int:
+        """The window's handle, or 0 if it isn't open"""
+        with self.lock:
+            handle = self.handles.get(title)
+            if handle:
+                if self.backend.is_valid(handle, title):
+                    return handle
+                log.debug(f"{title} window handle {handle} went stale")
+                self._forget(title)
+            if time.monotonic() - self.missing.get(title, float("-inf")) < MISSING_RETRY:
+                return 0
+            handle = self.backend.find(title)
+            if handle:
+                self.handles[title] = handle
+                self.missing.pop(title, None)
+            else:
+                self.missing[title] = time.monotonic()
+            return handle
+
+    def _forget(self, title: str) -> None:
+        handle = self.handles.pop(title, 0)
+        if handle:
+            self.backend.forget(handle)
+
+    def invalidate(self, title: str | None = None) -> None:
+        """Drop cached handles, e.g. after the game was killed or relaunched"""
+        with self.lock:
+            for key in [title] if title else list(self.handles):
+                self._forget(key)
+            if title:
+                self.missing.pop(title, None)
+            else:
+                self.missing.clear()
+
+    def maximize(self, title: str = ARK) -> bool:
+        """Maximize and focus a window, returns False if it isn't open"""
+        handle = self.handle(title)
+        if not handle:
+            return False
+        try:
+            if self.backend.placement(handle) != SW_SHOWMAXIMIZED:
+                log.debug(f"Maximizing {title} window...")
+                self.backend.show(handle, SW_SHOWMAXIMIZED)
+            if self.backend.foreground() != handle:
+                log.debug(f"Setting focus to {title} window: {handle}")
+                self.backend.focus(handle)
+        except Exception as e:
+            log.debug(f"Failed to maximize {title} window: {e!r}")
+            self.invalidate(title)
+            return False
+        return True
+
+    def minimize(self, title: str = STORE) -> bool:
+        handle = self.handle(title)
+        if not handle:
+            return False
+        try:
+            if self.backend.placement(handle) != SW_SHOWMINIMIZED:
+                log.debug(f"Minimizing {title} window...")
+                self.backend.show(handle, SW_MINIMIZE)
+        except Exception as e:
+            log.debug(f"Failed to minimize {title} window: {e!r}")
+            self.invalidate(title)
+            return False
+        return True
+
+    def close(self, title: str) -> bool:
+        handle = self.handle(title)
+        if not handle:
+            return False
+        self.backend.close(handle)
+        self.invalidate(title)
+        return True
+
+    def rect(self, title: str = ARK) -> tuple[int, int, int, int] | None:
+        handle = self.handle(title)
+        if not handle:
+            return None
+        try:
+            return self.backend.rect(handle)
+        except Exception:
+            self.invalidate(title)
+            return None
+
+
+tracker = WindowTracker()
@@ -1,8 +1,10 @@
 import asyncio
 import logging
+import multiprocessing
 import os
 import sys
 
+from common import backup, executor, logger, vision
 from common.config import Conf
 from common.const import CONF_PATH, DEFAULT_CONF_TEXT, RESOLUTION_DIR
 from common.helpers import set_resolution
@@ -27,6 +29,14 @@ class Manager:
     async def stop(self) -> None:
         scheduler.remove_all_jobs()
         scheduler.shutdown(wait=False)
+        self.handler.lag_monitor.stop()
+        self.handler.prober.close()
+        self.handler.control.close()
+        if self.handler.cluster_sync:
+            self.handler.cluster_sync.close()
+        executor.shutdown()
+        backup.shutdown()
+        vision.shutdown()
 
     @classmethod
     def run(cls) -> None:
@@ -54,10 +64,16 @@ class Manager:
             loop.close()
 
             log.info("Goodbye.")
+            logger.stop_logging()
             sys.exit()
 
 
 if __name__ == "__main__":
+    # Needed for the backup process pool in the frozen exe
+    multiprocessing.freeze_support()
+    # Only here, the backup and vision workers import common too and must not open logs.log themselves
+    logger.init_logging()
+
     if not CONF_PATH.exists():
         log.warning("Config file not found, created a new one.")
         CONF_PATH.write_text(DEFAULT_CONF_TEXT)
@@ -0,0 +1,104 @@
+import asyncio
+import struct
+
+import pytest
+
+from common.a2s import INFO_REQUEST, SINGLE, SPLIT, A2SClient, A2SError
+
+
+def info_payload(name: str = "Ark Server", players: int = 3) -> bytes:
+    return (
+        bytes([0x49, 17])
+        + b"".join(i.encode() + b"\x00" for i in (name, "TheIsland", "ark_survival_evolved", "ARK"))
+        + struct.pack("<h", 0)
+        + bytes([players, 70, 0])
+        + b"dwvc"
+        + b"358.24\x00"
+    )
+
+
+class FakeServer(asyncio.DatagramProtocol):
+    """Answers each request with the next scripted list of packets"""
+
+    def __init__(self, replies: list[list[bytes]]) -> None:
+        self.replies = replies
+        self.requests: list[bytes] = []
+        self.transport = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.requests.append(data)
+        if self.replies:
+            for packet in self.replies.pop(0):
+                self.transport.sendto(packet, addr)
+
+
+async def query(replies: list[list[bytes]], timeout: float = 1.0):
+    loop = asyncio.get_running_loop()
+    transport, server = await loop.create_datagram_endpoint(
+        lambda: FakeServer(replies), local_addr=("127.0.0.1", 0)
+    )
+    port = transport.get_extra_info("sockname")[1]
+    client = A2SClient("127.0.0.1", port, timeout=timeout)
+    try:
+        return await client.info(), server.requests
+    finally:
+        client.close()
+        transport.close()
+
+
+def split(payload: bytes, size: int) -> list[bytes]:
+    pieces = [payload[i : i + size] for i in range(0, len(payload), size)]
+    return [SPLIT + struct.pack("<lBBh", 1234, len(pieces), n, 1248) + piece for n, piece in enumerate(pieces)]
+
+
+def test_info():
+    info, requests = asyncio.run(query([[SINGLE + info_payload()]]))
+    assert requests == [INFO_REQUEST]
+    assert (info.name, info.map, info.players, info.max_players, info.version) == (
+        "Ark Server",
+        "TheIsland",
+        3,
+        70,
+        "358.24",
+    )
+
+
+def test_info_answers_challenge():
+    info, requests = asyncio.run(query([[SINGLE + b"\x41abcd"], [SINGLE + info_payload()]]))
+    assert requests == [INFO_REQUEST, INFO_REQUEST + b"abcd"]
+    assert info.players == 3
+
+
+def test_info_split_response():
+    packets = split(SINGLE + info_payload(name="x" * 200), 64)
+    assert len(packets) > 2
+    info, _ = asyncio.run(query([list(reversed(packets))]))
+    assert info.name == "x" * 200
+
+
+@pytest.mark.parametrize(
+    "packets",
+    [
+        [SINGLE],
+        [SINGLE + info_payload()[:12]],
+        [SINGLE + info_payload()[:-8]],
+        [SINGLE + b"\x49"],
+        [SINGLE + b"\x41ab"],
+        [SINGLE + b"\x6dgoldsource"],
+        [b"\x00\x01\x02"],
+        [SPLIT + b"\x01\x02"],
+        [SPLIT + struct.pack("<lBBh", 1, 2, 5, 1248) + b"data"],
+        [SPLIT + struct.pack("<lBBh", 1, 1, 0, 1248) + b"\x00"],
+    ],
+)
+def test_malformed_responses_raise_a2s_error(packets):
+    with pytest.raises(A2SError):
+        asyncio.run(query([packets]))
+
+
+def test_no_answer_times_out():
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(query([], timeout=0.2))
@@ -0,0 +1,193 @@
+import asyncio
+import os
+import struct
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pyautogui", reason="common.const reads the screen size with pyautogui")
+
+from common import clustersync  # noqa: E402
+from common.clustersync import (  # noqa: E402
+    MAX_HANDSHAKE,
+    ClusterSync,
+    SyncError,
+    block_signature,
+    delta,
+    patch,
+    read_message,
+    rolling_checksums,
+)
+
+BLOCK = 64
+
+
+def naive_checksums(data: bytes, block: int) -> list[int]:
+    checksums = []
+    for k in range(len(data) - block + 1):
+        window = data[k : k + block]
+        a = sum(window)
+        b = sum((block - j) * x for j, x in enumerate(window))
+        checksums.append((a & 0xFFFF) | ((b & 0xFFFF) << 16))
+    return checksums
+
+
+def round_trip(old: bytes, new: bytes) -> tuple[bytes, bytes]:
+    weak, strong = block_signature(old, BLOCK)
+    ops, literals = delta(new, weak, strong, BLOCK)
+    return patch(old, ops, literals, BLOCK), literals
+
+
+@pytest.fixture
+def rng() -> np.random.Generator:
+    return np.random.default_rng(7)
+
+
+def test_rolling_checksums_match_naive(rng):
+    data = rng.integers(0, 256, 1000, dtype=np.uint8)
+    assert rolling_checksums(data, BLOCK).tolist() == naive_checksums(data.tobytes(), BLOCK)
+
+
+def test_rolling_checksums_short_data():
+    assert len(rolling_checksums(np.zeros(BLOCK - 1, dtype=np.uint8), BLOCK)) == 0
+
+
+def test_delta_round_trips(rng):
+    old = rng.bytes(BLOCK * 40 + 17)
+    cases = {
+        "same": old,
+        "inserted": old[:500] + b"inserted" + old[500:],
+        "changed": old[:1000] + bytes(BLOCK) + old[1000 + BLOCK :],
+        "appended": old + rng.bytes(300),
+        "truncated": old[: BLOCK * 10],
+        "new": rng.bytes(BLOCK * 5),
+        "tiny": b"x",
+        "empty": b"",
+    }
+    for name, new in cases.items():
+        patched, _ = round_trip(old, new)
+        assert patched == new, name
+
+
+def test_delta_only_sends_changes(rng):
+    old = rng.bytes(BLOCK * 40)
+    _, literals = round_trip(old, old)
+    assert literals == b""
+    _, literals = round_trip(old, old[:500] + b"inserted" + old[500:])
+    assert len(literals) < BLOCK * 2
+
+
+def test_delta_against_nothing_is_all_literals(rng):
+    new = rng.bytes(BLOCK * 3 + 5)
+    patched, literals = round_trip(b"", new)
+    assert patched == literals == new
+
+
+def test_read_message_limit():
+    async def read(limit):
+        reader = asyncio.StreamReader()
+        reader.feed_data(struct.pack(">II", 2, MAX_HANDSHAKE) + b"{}" + bytes(MAX_HANDSHAKE))
+        reader.feed_eof()
+        return await read_message(reader, limit)
+
+    assert asyncio.run(read(clustersync.MAX_MESSAGE)) == ({}, bytes(MAX_HANDSHAKE))
+    with pytest.raises(SyncError):
+        asyncio.run(read(MAX_HANDSHAKE))
+
+
+async def wait_until(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for sync")
+        await asyncio.sleep(0.05)
+
+
+def write_old(path, data: bytes) -> None:
+    """Write a file that has already settled"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    settled = time.time_ns() - 10 * 10**9
+    os.utime(path, ns=(settled, settled))
+
+
+@pytest.fixture
+def fast(monkeypatch):
+    monkeypatch.setattr(clustersync, "SCAN_INTERVAL", 0.05)
+    monkeypatch.setattr(clustersync, "RECONNECT_DELAY", 0.05)
+
+
+async def pair(tmp_path, secret: str = "test") -> tuple[ClusterSync, ClusterSync]:
+    """A receiver and a sender pushing to it over localhost"""
+    receiver = ClusterSync(tmp_path / "b", 0, [], "test", host="127.0.0.1")
+    await receiver.start()
+    port = receiver.server.sockets[0].getsockname()[1]
+    sender = ClusterSync(tmp_path / "a", 0, [("127.0.0.1", port)], secret, host="127.0.0.1")
+    await sender.start()
+    return sender, receiver
+
+
+def test_sync_between_peers(tmp_path, rng, fast):
+    async def run():
+        sender, receiver = await pair(tmp_path)
+        try:
+            data = rng.bytes(clustersync.BLOCK * 20)
+            write_old(sender.directory / "tribe" / "1.arktributetribe", data)
+            target = receiver.directory / "tribe" / "1.arktributetribe"
+            await wait_until(lambda: target.exists() and target.read_bytes() == data)
+            assert target.stat().st_mtime_ns == (sender.directory / "tribe" / "1.arktributetribe").stat().st_mtime_ns
+
+            # A small edit only sends the blocks around it
+            changed = data[:1000] + b"changed" + data[1007:]
+            write_old(sender.directory / "tribe" / "1.arktributetribe", changed)
+            await wait_until(lambda: target.read_bytes() == changed)
+            assert sender.stats["sent_files"] == 2
+            assert sender.stats["sent_bytes"] < len(data) + clustersync.BLOCK * 2
+        finally:
+            sender.close()
+            receiver.close()
+
+    asyncio.run(run())
+
+
+def test_wrong_secret_is_rejected(tmp_path, rng, fast):
+    async def run():
+        sender, receiver = await pair(tmp_path, secret="wrong")
+        try:
+            write_old(sender.directory / "1.arktributetribe", rng.bytes(100))
+            await wait_until(lambda: sender.peers[0].backlog)
+            assert not (receiver.directory / "1.arktributetribe").exists()
+        finally:
+            sender.close()
+            receiver.close()
+
+    asyncio.run(run())
+
+
+def test_large_message_before_auth_is_dropped(tmp_path):
+    async def run():
+        receiver = ClusterSync(tmp_path, 0, [], "test", host="127.0.0.1")
+        await receiver.start()
+        port = receiver.server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            challenge, _ = await read_message(reader)
+            assert challenge["type"] == "challenge"
+            # Claim a huge auth message, the receiver should hang up without waiting for it
+            writer.write(struct.pack(">II", 2, 64 * 1024**2) + b"{}")
+            await writer.drain()
+            assert await asyncio.wait_for(reader.read(), 5) == b""
+        finally:
+            writer.close()
+            receiver.close()
+
+    asyncio.run(run())
+
+
+def test_resolve_stays_inside_the_folder(tmp_path):
+    sync = ClusterSync(tmp_path, 0, [], "test")
+    assert sync.resolve("tribe/1.arktributetribe") == (tmp_path / "tribe" / "1.arktributetribe").resolve()
+    for rel in ("../escape", "/etc/passwd", "."):
+        with pytest.raises(SyncError):
+            sync.resolve(rel)
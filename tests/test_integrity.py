@@ -0,0 +1,41 @@
+import struct
+
+import pytest
+
+pytest.importorskip("pyautogui", reason="common.const reads the screen size with pyautogui")
+
+from common import integrity  # noqa: E402
+from common.integrity import PAGE, SaveVerifier, structure_problem  # noqa: E402
+
+
+def map_save(size: int, padding: int = 0) -> bytes:
+    """Shaped like a world save, an int16 version header, data, then the zero padding the game writes"""
+    body = struct.pack("<h", 5) + bytes(range(256)) * (size // 256)
+    return body + bytes(padding)
+
+
+def test_zero_padded_save_is_fine():
+    assert structure_problem(map_save(PAGE * 4, padding=PAGE * 2), True) is None
+
+
+def test_zero_filled_save_is_caught():
+    assert structure_problem(bytes(PAGE * 4), True) == "starts with zeros"
+    assert structure_problem(b"", True) == "empty"
+
+
+def test_bad_header_is_caught():
+    assert structure_problem(struct.pack("<h", -1) + bytes(range(256)) * 20, True) == "bad header version -1"
+
+
+def test_truncated_map_is_caught(tmp_path, monkeypatch):
+    monkeypatch.setattr(integrity.const, "CLUSTER_PATH", tmp_path / "cluster")
+    path = tmp_path / "TheIsland.ark"
+    path.write_bytes(map_save(PAGE * 8, padding=PAGE))
+    verifier = SaveVerifier(tmp_path, tmp_path / "integrity.json", workers=1)
+    assert verifier.check(path)[0].ok
+
+    # Cut short mid-save, padded out with zeros like the good copy was
+    path.write_bytes(map_save(PAGE * 2, padding=PAGE))
+    check, _ = verifier.check(path)
+    assert not check.ok
+    assert check.reason.startswith("shrank from")
@@ -0,0 +1,110 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("pyautogui", reason="common.const reads the screen size with pyautogui")
+
+from common import updates  # noqa: E402
+from common.updates import MemoryEventSource, UpdateDetector, UpdateEvent  # noqa: E402
+
+ARK = updates.PACKAGE_NAME
+
+
+class Versions:
+    """A version probe whose answer the test can change"""
+
+    def __init__(self, version: str | None = "1.0") -> None:
+        self.version = version
+
+    def __call__(self) -> str | None:
+        return self.version
+
+
+@pytest.fixture
+def source() -> MemoryEventSource:
+    source = MemoryEventSource()
+    source.push(44, ARK)
+    source.push(19, ARK)
+    return source
+
+
+def make_detector(source, tmp_path, versions=None) -> UpdateDetector:
+    return UpdateDetector(source, bookmark_path=tmp_path / "bookmark.json", version_probe=versions or Versions())
+
+
+def test_first_poll_starts_at_newest_event(source, tmp_path):
+    detector = make_detector(source, tmp_path)
+    assert detector.poll() == []
+    assert detector.record_id == 2
+    assert (tmp_path / "bookmark.json").exists()
+
+
+def test_new_ark_events_are_returned_once(source, tmp_path):
+    detector = make_detector(source, tmp_path)
+    detector.poll()
+    download = source.push(44, f"{ARK} 1.1")
+    source.push(44, "Some other app")
+    source.push(12345, ARK)  # Not an update phase
+    install = source.push(43, f"{ARK} 1.1")
+
+    assert detector.poll() == [download, install]
+    assert detector.record_id == 6
+    assert detector.poll() == []
+
+
+def test_bookmark_survives_restart(source, tmp_path):
+    make_detector(source, tmp_path).poll()
+    event = source.push(43, ARK)
+
+    detector = make_detector(source, tmp_path)
+    assert detector.record_id == 2
+    assert detector.poll() == [event]
+
+
+def test_cleared_log_resets_bookmark(source, tmp_path):
+    detector = make_detector(source, tmp_path)
+    detector.poll()
+    source.events.clear()
+    assert detector.poll() == []
+    assert detector.record_id == 0
+
+    event = source.push(44, ARK)
+    assert event.record_id == 1
+    assert detector.poll() == [event]
+
+
+def test_version_change_without_event_counts_as_complete(source, tmp_path):
+    versions = Versions("1.0")
+    detector = make_detector(source, tmp_path, versions)
+    # The first version seen is just remembered
+    assert detector.poll() == []
+
+    versions.version = "1.1"
+    found = detector.poll()
+    assert len(found) == 1
+    assert found[0].phase == "complete"
+    assert "1.1" in found[0].title
+    assert detector.poll() == []
+
+
+def test_version_change_with_complete_event_is_not_doubled(source, tmp_path):
+    versions = Versions("1.0")
+    detector = make_detector(source, tmp_path, versions)
+    detector.poll()
+
+    versions.version = "1.1"
+    complete = source.push(19, f"{ARK} 1.1")
+    assert detector.poll() == [complete]
+
+
+def test_missing_version_is_ignored(source, tmp_path):
+    versions = Versions(None)
+    detector = make_detector(source, tmp_path, versions)
+    detector.poll()
+    assert detector.version is None
+    assert detector.poll() == []
+
+
+def test_update_event_phase():
+    assert UpdateEvent(1, 43, datetime.now(), ARK).phase == "install"
+    assert UpdateEvent(1, 1, datetime.now(), ARK).phase is None
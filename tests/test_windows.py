@@ -0,0 +1,130 @@
+import pytest
+
+from common import windows
+from common.windows import (
+    ARK,
+    STORE,
+    SW_MINIMIZE,
+    SW_SHOWMAXIMIZED,
+    FakeBackend,
+    WindowTracker,
+)
+
+
+class Clock:
+    """A monotonic clock the test moves by hand"""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(windows.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def backend() -> FakeBackend:
+    return FakeBackend()
+
+
+@pytest.fixture
+def tracker(backend) -> WindowTracker:
+    return WindowTracker(backend)
+
+
+def finds(backend: FakeBackend) -> int:
+    return sum(1 for i in backend.calls if i[0] == "find")
+
+
+def test_handle_is_cached(backend, tracker, clock):
+    handle = backend.open(ARK)
+    assert tracker.handle(ARK) == handle
+    assert tracker.handle(ARK) == handle
+    assert finds(backend) == 1
+
+
+def test_stale_handle_is_looked_up_again(backend, tracker, clock):
+    old = backend.open(ARK)
+    assert tracker.handle(ARK) == old
+    # The game restarted, the old handle is gone and a new window took its place
+    backend.close(old)
+    new = backend.open(ARK)
+    assert tracker.handle(ARK) == new
+    assert finds(backend) == 2
+
+
+def test_reused_handle_with_another_title_is_stale(backend, tracker, clock):
+    handle = backend.open(ARK)
+    assert tracker.handle(ARK) == handle
+    backend.windows[handle]["title"] = "Notepad"
+    assert tracker.handle(ARK) == 0
+
+
+def test_missing_window_backs_off(backend, tracker, clock):
+    assert tracker.handle(ARK) == 0
+    assert finds(backend) == 1
+
+    # Opened straight away, but not looked for again until the retry delay is up
+    handle = backend.open(ARK)
+    clock.now += windows.MISSING_RETRY / 2
+    assert tracker.handle(ARK) == 0
+    assert finds(backend) == 1
+
+    clock.now += windows.MISSING_RETRY
+    assert tracker.handle(ARK) == handle
+    assert finds(backend) == 2
+
+
+def test_invalidate_skips_the_back_off(backend, tracker, clock):
+    assert tracker.handle(ARK) == 0
+    handle = backend.open(ARK)
+    tracker.invalidate(ARK)
+    assert tracker.handle(ARK) == handle
+
+
+def test_maximize_shows_and_focuses(backend, tracker, clock):
+    handle = backend.open(ARK)
+    assert tracker.maximize(ARK)
+    assert ("show", handle, SW_SHOWMAXIMIZED) in backend.calls
+    assert ("focus", handle) in backend.calls
+    assert backend.active == handle
+
+
+def test_maximize_skips_when_already_maximized_and_focused(backend, tracker, clock):
+    handle = backend.open(ARK, placement=SW_SHOWMAXIMIZED)
+    backend.active = handle
+    assert tracker.maximize(ARK)
+    assert [i for i in backend.calls if i[0] in ("show", "focus")] == []
+
+
+def test_maximize_only_focuses_when_already_maximized(backend, tracker, clock):
+    handle = backend.open(ARK, placement=SW_SHOWMAXIMIZED)
+    assert tracker.maximize(ARK)
+    assert [i for i in backend.calls if i[0] in ("show", "focus")] == [("focus", handle)]
+
+
+def test_minimize_skips_when_already_minimized(backend, tracker, clock):
+    handle = backend.open(STORE)
+    assert tracker.minimize(STORE)
+    assert tracker.minimize(STORE)
+    assert [i for i in backend.calls if i[0] == "show"] == [("show", handle, SW_MINIMIZE)]
+
+
+def test_missing_window_is_not_touched(backend, tracker, clock):
+    assert not tracker.maximize(ARK)
+    assert not tracker.minimize(STORE)
+    assert tracker.rect(ARK) is None
+    assert not tracker.close(ARK)
+
+
+def test_close_forgets_the_handle(backend, tracker, clock):
+    handle = backend.open(windows.TEAMVIEWER)
+    assert tracker.close(windows.TEAMVIEWER)
+    assert ("close", handle) in backend.calls
+    assert windows.TEAMVIEWER not in tracker.handles